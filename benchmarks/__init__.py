@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Like the tests, the benchmarks import the modules in src/ as top-level packages
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
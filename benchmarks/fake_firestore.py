@@ -0,0 +1,221 @@
+"""
+In-memory stand-in for the parts of the Firestore client used by DatabaseManager, so the database
+code can be tested without credentials. Documents are kept in one dict keyed by their path.
+"""
+import copy
+
+from google.cloud import firestore
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = copy.deepcopy(data)
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeDocument:
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self.client, f"{self.path}/{name}")
+
+    def get(self):
+        self.client.reads += 1
+        return FakeSnapshot(self, self.client.store.get(self.path))
+
+    def set(self, data, merge=False):
+        self.client.writes += 1
+        if not (merge and self.path in self.client.store):
+            self.client.store[self.path] = {}
+        self._apply(data)
+
+    def update(self, data):
+        self.client.writes += 1
+        if self.path not in self.client.store:
+            raise KeyError(f"No document to update: {self.path}")
+        self._apply(data)
+
+    def _apply(self, data):
+        document = self.client.store[self.path]
+        for key, value in data.items():
+            if value is firestore.DELETE_FIELD:
+                document.pop(key, None)
+            else:
+                document[key] = copy.deepcopy(value)
+
+    def delete(self):
+        self.client.writes += 1
+        self.client.store.pop(self.path, None)
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), order=None, limit=None, fields=None):
+        self.collection = collection
+        self.filters = list(filters)
+        self.order = order
+        self._limit = limit
+        self.fields = fields
+
+    def where(self, filter):
+        return FakeQuery(self.collection, self.filters + [filter], self.order, self._limit, self.fields)
+
+    def order_by(self, field):
+        return FakeQuery(self.collection, self.filters, field, self._limit, self.fields)
+
+    def limit(self, count):
+        return FakeQuery(self.collection, self.filters, self.order, count, self.fields)
+
+    def select(self, field_paths):
+        return FakeQuery(self.collection, self.filters, self.order, self._limit, list(field_paths))
+
+    def stream(self):
+        snapshots = []
+        for ref in self.collection.list_documents():
+            data = self.collection.client.store[ref.path]
+            if all(_matches(data, query_filter) for query_filter in self.filters):
+                snapshots.append(FakeSnapshot(ref, data))
+        if self.order is not None:
+            snapshots.sort(key=lambda snapshot: snapshot._data.get(self.order))
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        if self.fields is not None:
+            snapshots = [FakeSnapshot(snapshot.reference, {field: value for field, value in snapshot._data.items()
+                                                           if field in self.fields}) for snapshot in snapshots]
+        self.collection.client.reads += max(len(snapshots), 1)
+        return iter(snapshots)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(self)
+        self.client = client
+        self.path = path
+
+    def document(self, document_id):
+        return FakeDocument(self.client, f"{self.path}/{document_id}")
+
+    def list_documents(self):
+        prefix = f"{self.path}/"
+        return [FakeDocument(self.client, path) for path in sorted(self.client.store)
+                if path.startswith(prefix) and "/" not in path[len(prefix):]]
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.operations = []
+
+    def set(self, ref, data, merge=False):
+        self.operations.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self.operations.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self.operations.append(ref.delete)
+
+    def commit(self):
+        if len(self.operations) > 500:
+            raise ValueError("A batch may contain at most 500 writes")
+        self.client.commits += 1
+        for operation in self.operations:
+            operation()
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.store = {}
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, references):
+        return [reference.get() for reference in references]
+
+
+def _matches(data, query_filter):
+    value = data.get(query_filter.field_path)
+    if query_filter.op_string == "==":
+        return value == query_filter.value
+    if query_filter.op_string == "in":
+        return value in query_filter.value
+    raise NotImplementedError(query_filter.op_string)
+
+
+class FakeAsyncFirestore:
+    """Async facade over a FakeFirestore, mirroring firestore.AsyncClient"""
+    def __init__(self, db=None):
+        self.sync = db if db is not None else FakeFirestore()
+
+    def collection(self, name):
+        return _AsyncQuery(self.sync.collection(name))
+
+
+class _AsyncDocument:
+    def __init__(self, document):
+        self._document = document
+        self.id = document.id
+
+    def collection(self, name):
+        return _AsyncQuery(self._document.collection(name))
+
+    async def get(self):
+        return _wrap(self._document.get())
+
+    async def set(self, data, merge=False):
+        self._document.set(data, merge=merge)
+
+    async def update(self, data):
+        self._document.update(data)
+
+    async def delete(self):
+        self._document.delete()
+
+
+class _AsyncQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def document(self, document_id):
+        return _AsyncDocument(self._query.document(document_id))
+
+    def where(self, filter):
+        return _AsyncQuery(self._query.where(filter=filter))
+
+    def order_by(self, field):
+        return _AsyncQuery(self._query.order_by(field))
+
+    def limit(self, count):
+        return _AsyncQuery(self._query.limit(count))
+
+    async def get(self):
+        return [_wrap(snapshot) for snapshot in self._query.get()]
+
+    async def stream(self):
+        for snapshot in self._query.stream():
+            yield _wrap(snapshot)
+
+
+def _wrap(snapshot):
+    snapshot.reference = _AsyncDocument(snapshot.reference)
+    return snapshot
@@ -0,0 +1,201 @@
+"""
+In-process stand-ins for the Sheets API, GitHub and Azure DevOps, used by the benchmarks together with the
+in-memory Firestore from benchmarks/fake_firestore.py. The tracker fakes are httpx transports, so the real
+clients (connection pool, rate limiter, retries) are exercised, with a configurable latency per request
+and an optional rate limit.
+"""
+import asyncio
+import itertools
+import json
+import math
+import threading
+import time
+
+import httpx
+
+TASK_HEADERS = ["Title", "Description", "Priority", "Story Point", "Issue ID", "Duplicate / Comments"]
+EPIC_VALUES = [
+    ["Field", "B"],
+    ["Epic", ""],
+    ["Title", "Benchmark Epic"],
+    ["Problem", "Problem"],
+    ["Feature", "Feature"],
+    ["Value", "Value"],
+]
+
+
+def task_rows(count):
+    """Returns the values of a 'Tasks' sheet with count generated tasks, headers included"""
+    priorities = ["Low", "Medium", "High"]
+    return [TASK_HEADERS] + [
+        [f"Task {i}", f"Description of task {i}", priorities[i % 3], str(i % 13), "", ""] for i in range(count)
+    ]
+
+
+class _Request:
+    """What the googleapiclient request objects look like to the code in Google.sheets"""
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeSheetsApi:
+    """Serves an 'Epic' sheet and a 'Tasks' sheet of generated tasks, like get_sheets_api().spreadsheets()"""
+    def __init__(self, task_count):
+        self.sheets = {"Epic": EPIC_VALUES, "Tasks": task_rows(task_count)}
+        self.requests = 0
+
+    def get(self, spreadsheetId, fields=None):
+        self.requests += 1
+        return _Request({"sheets": [
+            {"properties": {"title": title, "gridProperties": {"rowCount": len(values)}}}
+            for title, values in self.sheets.items()
+        ]})
+
+    def values(self):
+        return self
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.requests += 1
+        return _Request({"valueRanges": [{"range": name, "values": self._values(name)} for name in ranges]})
+
+    def _values(self, spreadsheet_range):
+        name, _, cells = spreadsheet_range.partition("!")
+        values = self.sheets[name.strip("'")]
+        if not cells:
+            return values
+        start, end = cells.split(":")
+        start_row = int(start.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+        end_row = int(end.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ") or len(values))
+        return values[start_row - 1:end_row]
+
+
+class LatencyTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport for sync and async clients, answering from handler after latency seconds"""
+    def __init__(self, handler, latency=0.0):
+        self.handler = handler
+        self.latency = latency
+
+    def handle_request(self, request):
+        request.read()
+        if self.latency:
+            time.sleep(self.latency)
+        return self.handler(request)
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.handler(request)
+
+
+class RateLimit:
+    """
+    Allows `limit` requests per window of `window` seconds, reporting the budget through the X-RateLimit-*
+    headers. GitHub sends the reset time in whole seconds, so a client may wait up to a second past the window.
+    """
+    def __init__(self, limit, window=1.0):
+        self.limit = limit
+        self.window = window
+        self.used = 0
+        self.reset_at = time.time() + window
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Returns the rate limit headers and whether the request is within the budget"""
+        with self._lock:
+            now = time.time()
+            if now >= self.reset_at:
+                self.used, self.reset_at = 0, now + self.window
+            allowed = self.used < self.limit
+            if allowed:
+                self.used += 1
+            else:
+                self.rejected += 1
+            headers = {"X-RateLimit-Limit": str(self.limit),
+                       "X-RateLimit-Remaining": str(self.limit - self.used),
+                       "X-RateLimit-Reset": str(math.ceil(self.reset_at))}
+            return headers, allowed
+
+
+class FakeGitHub:
+    """Issues endpoint of one repository: creates, lists (paginated), and edits issues"""
+    def __init__(self, latency=0.0, rate_limit=None):
+        self.issues = {}
+        self.requests = 0
+        self.rate_limit = rate_limit
+        self.transport = LatencyTransport(self.handle, latency)
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def handle(self, request):
+        with self._lock:
+            self.requests += 1
+        headers = {}
+        if self.rate_limit is not None:
+            headers, allowed = self.rate_limit.take()
+            if not allowed:
+                return httpx.Response(403, headers=headers, json={"message": "API rate limit exceeded"})
+
+        if request.method == "POST":
+            number = next(self._numbers)
+            issue = {"number": number, "state": "open", **json.loads(request.content)}
+            self.issues[number] = issue
+            return httpx.Response(201, headers=headers, json=issue)
+        if request.method == "PATCH":
+            number = int(request.url.path.rsplit("/", 1)[-1])
+            self.issues[number].update(json.loads(request.content))
+            return httpx.Response(200, headers=headers, json=self.issues[number])
+
+        page = int(request.url.params.get("page", 1))
+        per_page = int(request.url.params.get("per_page", 30))
+        issues = list(self.issues.values())
+        last_page = max(math.ceil(len(issues) / per_page), 1)
+        if page < last_page:
+            headers["Link"] = f'<{request.url.copy_set_param("page", last_page)}>; rel="last"'
+        return httpx.Response(200, headers=headers, json=issues[(page - 1) * per_page:page * per_page])
+
+
+class FakeAzureDevOps:
+    """Work item $batch, WIQL and workitemsbatch endpoints of one project"""
+    def __init__(self, latency=0.0, rate_limit=None):
+        self.work_items = {}
+        self.requests = 0
+        self.rate_limit = rate_limit
+        self.transport = LatencyTransport(self.handle, latency)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def handle(self, request):
+        with self._lock:
+            self.requests += 1
+        headers = {}
+        if self.rate_limit is not None:
+            headers, allowed = self.rate_limit.take()
+            if not allowed:
+                return httpx.Response(429, headers={**headers, "Retry-After": "1"})
+
+        data = json.loads(request.content)
+        path = request.url.path
+        if path.endswith("/wiql"):
+            return httpx.Response(200, headers=headers, json={"workItems": [{"id": i} for i in self.work_items]})
+        if path.endswith("/workitemsbatch"):
+            if len(data["ids"]) > 200:
+                return httpx.Response(400, headers=headers, json={"message": "Too many ids"})
+            return httpx.Response(200, headers=headers, json={"value": [
+                {"id": i, "fields": {field: self.work_items[i].get(field) for field in data["fields"]}}
+                for i in data["ids"]
+            ]})
+
+        results = []
+        for operation in data:
+            work_item = operation["uri"].split("?")[0].rsplit("/", 1)[-1]
+            work_item = next(self._ids) if work_item == "$task" else int(work_item)
+            fields = self.work_items.setdefault(work_item, {"System.Id": work_item, "System.State": "New"})
+            for patch in operation["body"]:
+                fields[patch["path"].rsplit("/", 1)[-1]] = patch["value"]
+            results.append({"code": 200, "body": json.dumps({"id": work_item, "fields": fields})})
+        return httpx.Response(200, headers=headers, json={"count": len(results), "value": results})
@@ -0,0 +1,228 @@
+"""
+Offline benchmarks of the import, issue creation and webhook paths, against in-process fakes of Firestore,
+the Sheets API, GitHub and Azure DevOps (see benchmarks/fakes.py), so no accounts or network are needed.
+
+Run from the repository root:
+    python -m benchmarks.run --sizes 10 1000 10000 --output results.json
+
+Every result is one JSON object (benchmark, size, seconds, operations, ops_per_second, counters, ...), written as a JSON array to
+--output, so results can be compared between commits to catch regressions.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+
+from benchmarks.fake_firestore import FakeAsyncFirestore, FakeFirestore
+from benchmarks.fakes import FakeAzureDevOps, FakeGitHub, FakeSheetsApi, RateLimit
+from Google import sheets
+from database.async_manager import AsyncDatabaseManager
+from database.manager import DatabaseManager
+from database.setup import setup_database
+from epics.ado_epic import ado_epic
+from epics.github_epic import github_epic
+import webhook
+
+DEFAULT_SIZES = (10, 1000, 10000)
+# Number of task updates and webhook deliveries per run, whatever the size of the epic
+UPDATES = 200
+
+
+def bench_setup_database(size, options):
+    """Imports a spreadsheet of size tasks into an empty epic, then imports the unchanged spreadsheet again"""
+    db = FakeFirestore()
+    sheets_api = FakeSheetsApi(size)
+    with patch("database.manager.initfirebase", return_value=db), \
+            patch("Google.sheets.get_sheets_api", return_value=sheets_api), \
+            patch("Google.sheets.spreadsheet_revision", return_value=None):
+        sheets.cache.clear()
+        manager = DatabaseManager("epics", "Benchmark Epic")
+        results = []
+        for name in ("setup_database", "setup_database_unchanged"):
+            db.reads = db.writes = db.commits = 0
+            start = time.perf_counter()
+            setup_database("spreadsheet", manager)
+            seconds = time.perf_counter() - start
+            results.append(_result(name, size, seconds, size, firestore_reads=db.reads, firestore_writes=db.writes,
+                                   firestore_commits=db.commits, sheets_requests=sheets_api.requests))
+        sheets.cache.clear()
+    return results
+
+
+def bench_create_issues_github(size, options):
+    server = FakeGitHub(options.latency, _rate_limit(options))
+    epic = github_epic("owner", "repo", "token", "Benchmark Epic", "Problem", "Feature", "Value")
+    epic.transport = server.transport
+    for task in _tasks(size):
+        epic.add_task(task)
+
+    start = time.perf_counter()
+    epic.create_issues_concurrently(options.concurrency)
+    seconds = time.perf_counter() - start
+    created = sum(1 for task in epic.tasks if task.get("issueID"))
+    return [_result("create_issues_github", size, seconds, size, created=created, requests=server.requests)]
+
+
+def bench_create_issues_ado(size, options):
+    server = FakeAzureDevOps(options.latency, _rate_limit(options))
+    epic = ado_epic("organization", "project", "pat", "Benchmark Epic", "Problem", "Feature", "Value")
+    epic.transport = server.transport
+    for task in _tasks(size):
+        epic.add_task(task)
+
+    start = time.perf_counter()
+    summary = epic.create_issues_batch()
+    seconds = time.perf_counter() - start
+    return [_result("create_issues_ado", size, seconds, size, created=len(summary["created"]), requests=server.requests)]
+
+
+def bench_update_tasks(size, options):
+    """UPDATES task updates through AsyncDatabaseManager.update_tasks, in an epic of size tasks"""
+    db = _seeded_firestore(size)
+    manager = AsyncDatabaseManager("epics", "Benchmark Epic", db=FakeAsyncFirestore(db))
+    titles = _spread_titles(size)
+
+    async def run():
+        for title in titles:
+            await manager.update_tasks(title, {"priority": "Urgent"})
+
+    db.reads = db.writes = 0
+    start = time.perf_counter()
+    asyncio.run(run())
+    seconds = time.perf_counter() - start
+    return [_result("update_tasks", size, seconds, len(titles), firestore_reads=db.reads,
+                    firestore_writes=db.writes)]
+
+
+def bench_webhook(size, options):
+    """UPDATES 'edited' deliveries posted to the webhook app, until their updates are applied to an epic of size tasks"""
+    db = _seeded_firestore(size)
+    epic = github_epic("owner", "repo", "token", "Benchmark Epic", "Problem", "Feature", "Value")
+    deliveries = []
+    for i, title in enumerate(_spread_titles(size)):
+        task = {"title": title, "priority": "Urgent", "story_point": 3}
+        deliveries.append({
+            "action": "edited",
+            "issue": {"number": i + 1, "title": task["title"], "body": epic.format_body(task)},
+            "changes": {"body": {"from": ""}},
+        })
+
+    # Created before the timer starts, since the first app imports FastAPI. A queue is bound to the event loop
+    # it first runs in, so every run still gets its own app.
+    app = webhook.create_app(AsyncDatabaseManager("epics", "Benchmark Epic", db=FakeAsyncFirestore(db)))
+
+    async def run():
+        app.state.delivery_queue.start()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://webhook") as client:
+            for delivery in deliveries:
+                response = await client.post("/", json=delivery)
+                response.raise_for_status()
+        await app.state.delivery_queue.stop()
+
+    db.reads = db.writes = 0
+    start = time.perf_counter()
+    asyncio.run(run())
+    seconds = time.perf_counter() - start
+    return [_result("webhook", size, seconds, len(deliveries), firestore_reads=db.reads,
+                    firestore_writes=db.writes)]
+
+
+BENCHMARKS = {
+    "setup_database": bench_setup_database,
+    "create_issues_github": bench_create_issues_github,
+    "create_issues_ado": bench_create_issues_ado,
+    "update_tasks": bench_update_tasks,
+    "webhook": bench_webhook,
+}
+
+
+def run(names, sizes, options):
+    results = []
+    for name in names:
+        for size in sizes:
+            runs = [BENCHMARKS[name](size, options) for _ in range(options.repeat)]
+            for measurements in zip(*runs):
+                result = dict(measurements[0])
+                times = [measurement["seconds"] for measurement in measurements]
+                result["seconds"] = min(times)
+                result["median_seconds"] = statistics.median(times)
+                results.append(result)
+                # print is silenced while the benchmarks run, see main
+                sys.stderr.write(f"{result['benchmark']:<28}{size:>8} tasks {result['seconds']:>10.4f}s\n")
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "commit": commit or None,
+            "timestamp": time.time()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per benchmark and size, the fastest counts")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per request to GitHub and ADO")
+    parser.add_argument("--rate-limit", type=int, default=None, help="Requests per second GitHub and ADO allow")
+    parser.add_argument("--concurrency", type=int, default=5, help="Concurrent requests when creating issues")
+    parser.add_argument("--output", default=None, help="File to write the JSON results to, stdout by default")
+    options = parser.parse_args(argv)
+
+    # The code under benchmark reports what it does through print, keep that out of the results
+    with patch("builtins.print"):
+        results = run(options.benchmarks, options.sizes, options)
+
+    report = json.dumps({"environment": environment(), "results": results}, indent=2)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as output:
+            output.write(report + "\n")
+    else:
+        sys.stdout.write(report + "\n")
+    return results
+
+
+def _result(benchmark, size, seconds, operations, **counters):
+    """operations is the number of tasks imported or created, updates applied or deliveries posted in seconds"""
+    return {"benchmark": benchmark, "size": size, "seconds": seconds, "operations": operations,
+            "ops_per_second": operations / seconds if seconds else None, **counters}
+
+
+def _tasks(size):
+    return [{"title": f"Task {i}", "description": f"Description of task {i}", "priority": "High",
+             "story_point": i % 13} for i in range(size)]
+
+
+def _spread_titles(size):
+    """Titles of UPDATES tasks (or all of them in smaller epics), spread evenly over an epic of size tasks"""
+    count = min(UPDATES, size)
+    return [f"Task {i * size // count}" for i in range(count)]
+
+
+def _rate_limit(options):
+    return RateLimit(options.rate_limit) if options.rate_limit else None
+
+
+def _seeded_firestore(size):
+    db = FakeFirestore()
+    with patch("database.manager.initfirebase", return_value=db):
+        epic = SimpleNamespace(title="Benchmark Epic", problem="Problem", feature="Feature", value="Value")
+        DatabaseManager("epics", "Benchmark Epic").add_to_db(epic, _tasks(size))
+    return db
+
+
+if __name__ == "__main__":
+    main()
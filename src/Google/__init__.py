@@ -1,8 +1,5 @@
 import os.path
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 from secret_manager import access_secret_version_json
 
 cache = {}
@@ -12,19 +9,21 @@ cred_path = os.path.join(base_dir, 'credentials.json')
 
 
 def authenticate_service():
-    project_id = "trackpointdb"
-    secret_id = "credentials_json"
-    version_id = "latest"
-    credentials_json = access_secret_version_json(project_id, secret_id, version_id)
-
     """Authenticate the service account with Google Sheets API.
     See docs: https://developers.google.com/sheets/api/quickstart/python"""
 
     if "credentials" in cache:
         return cache["credentials"]
 
+    # The Google auth libraries are only imported once they are needed, see webhook.create_app
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     scopes = [
-        "https://www.googleapis.com/auth/spreadsheets.readonly"
+        "https://www.googleapis.com/auth/spreadsheets.readonly",
+        # Used to check whether a cached sheet is still up to date, see sheets.spreadsheet_revision
+        "https://www.googleapis.com/auth/drive.metadata.readonly"
     ]
 
     creds = None
@@ -36,6 +35,11 @@ def authenticate_service():
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
+            # The client secret is only needed when there is no usable token yet
+            project_id = "trackpointdb"
+            secret_id = "credentials_json"
+            version_id = "latest"
+            credentials_json = access_secret_version_json(project_id, secret_id, version_id)
             flow = InstalledAppFlow.from_client_config(
                 credentials_json, scopes
             )
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    spreadsheet_id: Optional[str]
+    revision: Optional[str]
+    checked_at: float
+
+
+class SheetCache:
+    """
+    Bounded cache for sheets, with a time to live per entry and least recently used eviction.
+
+    An entry older than ttl seconds is not thrown away right away: if a revision function is given, the
+    current revision of the entry's spreadsheet is looked up (a cheap metadata call), and the entry is kept
+    for another ttl if the spreadsheet has not changed since the entry was stored. Only when the revision
+    changed, or cannot be determined, does the caller have to fetch the sheet again.
+
+    Revisions are only looked up to revalidate a stale entry, never for a sheet that is not cached: a sheet
+    is stored with the revision last seen for its spreadsheet (see known_revision), if any. A sheet cached
+    without a revision is fetched again once it is stale, and is then stored with the revision looked up.
+
+    Args:
+        maxsize: The maximum number of entries, the least recently used entry is evicted beyond that.
+        ttl: Seconds an entry is served without checking the revision of its spreadsheet.
+        revision: Function returning the current revision of a spreadsheet, or None if it is unknown.
+    """
+    def __init__(self, maxsize: int = 64, ttl: float = 300.0,
+                 revision: Optional[Callable[[str], Optional[str]]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.revision = revision
+        self.entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        # The revision last looked up per spreadsheet, see known_revision
+        self.revisions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value for key, or None if it is missing or its spreadsheet has changed"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            if time.monotonic() - entry.checked_at < self.ttl:
+                self.hits += 1
+                return entry.value
+
+        # The entry is stale, check whether the spreadsheet changed (outside the lock, this is a request)
+        revision = self.current_revision(entry.spreadsheet_id)
+        with self._lock:
+            if revision is not None:
+                self.revisions[entry.spreadsheet_id] = revision
+            if revision is not None and revision == entry.revision:
+                entry.checked_at = time.monotonic()
+                self.hits += 1
+                self.revalidations += 1
+                return entry.value
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, spreadsheet_id: Optional[str] = None,
+            revision: Optional[str] = None) -> None:
+        """Caches value for key. revision should be the revision of the spreadsheet before value was fetched."""
+        with self._lock:
+            self.entries[key] = CacheEntry(value, spreadsheet_id, revision, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def known_revision(self, spreadsheet_id: Optional[str]) -> Optional[str]:
+        """
+        Returns the revision of the spreadsheet as last looked up, without a request, or None if it never was.
+        Take it before fetching a sheet: the sheet is then at least as new as the revision it is stored with.
+        """
+        with self._lock:
+            return self.revisions.get(spreadsheet_id)
+
+    def current_revision(self, spreadsheet_id: Optional[str]) -> Optional[str]:
+        if self.revision is None or spreadsheet_id is None:
+            return None
+        return self.revision(spreadsheet_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+        }
@@ -1,14 +1,20 @@
-import re
 import string
+import threading
 
 from dataclasses import dataclass
 from itertools import zip_longest
-from typing import Dict, List, Union, Optional
-from googleapiclient.discovery import build
+from typing import Dict, Iterator, List, Sequence, Tuple, Union, Optional
+from googleapiclient.errors import HttpError
 
 from Google import authenticate_service
+from Google.sheet_cache import SheetCache
+from tracing import span, traced
 
-cache = {}
+# Sheets are revalidated against the revision of their spreadsheet once they are older than the TTL,
+# see SheetCache and spreadsheet_revision
+cache = SheetCache(maxsize=64, ttl=300.0, revision=lambda spreadsheet_id: spreadsheet_revision(spreadsheet_id))
+# API clients, built once per thread since the googleapiclient services are not thread safe
+services = threading.local()
 
 
 @dataclass
@@ -89,7 +95,7 @@ class Column:
         values: The values in the column (excluding the header)
     """
     header: str
-    values: List[Union[str, int, None]]
+    values: Sequence[Union[str, int, None]]
 
     def __iter__(self):
         return iter(self.values)
@@ -108,30 +114,41 @@ class Sheet:
     """
     Represents a sheet in a Google Sheet spreadsheet
 
+    The values are stored column by column, one tuple per column, rather than one dict per row.
+    Row objects are only created when a row is accessed, and row_index lookups use a hash index
+    per column, built the first time the column is searched.
+
     Attributes:
         headers: The headers of the sheet
-        rows: The rows of the sheet (zero-indexed)
+        values: The values of each column (excluding the header), by header
     """
     headers: List[str]
-    rows: List[Row]
+    values: Dict[str, Tuple[Union[str, int, None], ...]]
 
     def __init__(self, headers: List[str], rows: List[List[str]]):
-        def clean_value(value: str) -> Union[str, int, None]:
-            value = value.strip()
-            if value == "":
-                return None
-            return int(value) if _is_ascii_digit(value) else value
-
-        rows = [[clean_value(value) for value in row] for row in rows]
         self.headers = [clean(header) for header in headers]
-        self.rows = [Row(i, dict(zip_longest(self.headers, row)))
-                     for i, row in enumerate(rows, start=2)]
+        self.length = len(rows)
+        width = len(self.headers)
+
+        # Cells beyond the last header are kept under the key None, like zip_longest(headers, row) would
+        self.overflow = {i: _clean_value(row[-1]) for i, row in enumerate(rows) if len(row) > width}
+        if self.overflow:
+            rows = [row[:width] for row in rows]
+
+        # Transpose the rows into columns, short rows are padded with empty cells
+        columns = [tuple(map(_clean_value, column)) for column in zip_longest(*rows, fillvalue="")]
+        columns += [(None,) * self.length] * (width - len(columns))
+        self.values = dict(zip(self.headers, columns))
+        self.indexes = {}
 
     def __iter__(self):
-        return iter(self.rows)
+        return (self.row(i) for i in range(self.length))
+
+    def __len__(self):
+        return self.length
 
     def __contains__(self, header):
-        return clean(header) in self.headers
+        return clean(header) in self.values
 
     def __getitem__(self, index: Union[int, str]) -> Union[Row, Column]:
         if isinstance(index, int):
@@ -140,13 +157,21 @@ class Sheet:
             return self.column(index)
         raise ValueError("Index must be an integer (row) or a string (column)")
 
+    @property
+    def rows(self) -> List[Row]:
+        """The rows of the sheet (zero-indexed)"""
+        return list(self)
+
     def row(self, index: int) -> Row:
         """Returns the row at the given index (zero-indexed)"""
         if index < 0:
             raise IndexError(f"Row index {index} is out of bounds")
-        if index >= len(self.rows):
-            raise IndexError(f"Searched for row {index}, but sheet only has {len(self.rows)} rows")
-        return self.rows[index]
+        if index >= self.length:
+            raise IndexError(f"Searched for row {index}, but sheet only has {self.length} rows")
+        values = {header: self.values[header][index] for header in self.headers}
+        if index in self.overflow:
+            values[None] = self.overflow[index]
+        return Row(index + 2, values)
 
     def column(self, header: str, alternatively: Optional[str] = None) -> Column:
         """
@@ -154,11 +179,11 @@ class Sheet:
         alternative header if the first header does not exist in the sheet
         """
         header = clean(header)
-        if header not in self.headers:
+        if header not in self.values:
             if alternatively is not None:
                 return self.column(alternatively)
             raise IndexError(f"Sheet does not have a column '{header}'")
-        return Column(header, [row[header] for row in self.rows])
+        return Column(header, self.values[header])
 
     def columns(self) -> List[Column]:
         """Returns a list of all columns in the sheet"""
@@ -169,9 +194,13 @@ class Sheet:
         column = clean(column)
         if column not in self:
             raise IndexError(f"Sheet does not have a column '{column}'")
-        for row in self.rows:
-            if row[column] == value:
-                return row.index
+        if column not in self.indexes:
+            index = {}
+            for i, cell in enumerate(self.values[column], start=2):
+                index.setdefault(cell, i)
+            self.indexes[column] = index
+        if value in self.indexes[column]:
+            return self.indexes[column][value]
         raise IndexError(f"Sheet does not have a row with '{column}' = '{value}'")
 
     def header_index(self, header: str) -> str:
@@ -224,6 +253,7 @@ def transform_to_epics(sheet: Sheet) -> Optional[Epic]:
     )
 
 
+@traced()
 def get_sheet(
     sheet_name: Optional[str] = None,
     spreadsheet_id: Optional[str] = None,
@@ -235,12 +265,15 @@ def get_sheet(
     If sheet_name is None, the first sheet in the spreadsheet is returned.
     If spreadsheet_id is None, the spreadsheet_id ID is retrieved from the command line arguments. (NOT IMPLEMENTED)
     If cached is True, the sheet is cached so that subsequent calls to this function with the same
-    sheet name and ID will return the same Sheet object.
+    sheet name and ID will return the same Sheet object, as long as the spreadsheet has not changed.
     """
     sheet_key = f"{spreadsheet_id}_{sheet_name}"
-    if cached and sheet_key in cache:
-        return cache[sheet_key]
+    if cached:
+        sheet = cache.get(sheet_key)
+        if sheet is not None:
+            return sheet
 
+    revision = cache.known_revision(spreadsheet_id)
     sheets_api = get_sheets_api()
 
     spreadsheet_range = _spreadsheet_range(sheet_name=sheet_name)
@@ -248,13 +281,101 @@ def get_sheet(
         spreadsheetId=spreadsheet_id, range=spreadsheet_range
     ).execute()["values"]
 
-    headers, rows = all_rows[0], all_rows[1:]
-    sheet = Sheet(headers, rows)
+    sheet = _to_sheet(all_rows)
 
-    cache[sheet_key] = sheet
+    cache.put(sheet_key, sheet, spreadsheet_id, revision)
     return sheet
 
 
+@traced()
+def get_sheets(
+    sheet_names: List[str],
+    spreadsheet_id: Optional[str] = None,
+    cached: bool = True
+) -> Dict[str, Sheet]:
+    """
+    Returns a dictionary mapping each of the given sheet names to a Sheet object, like get_sheet,
+    but fetches all sheets that are not cached yet in a single batchGet request.
+
+    Each sheet is requested by its name alone, for which the API returns exactly the used range of
+    the sheet (trailing empty rows and columns are left out), instead of the fixed A1:ZZ range.
+    The sheets are cached under the same keys as get_sheet.
+    """
+    sheets = {}
+    missing = []
+    for sheet_name in sheet_names:
+        sheet = cache.get(f"{spreadsheet_id}_{sheet_name}") if cached else None
+        if sheet is not None:
+            sheets[sheet_name] = sheet
+        else:
+            missing.append(sheet_name)
+
+    if missing:
+        revision = cache.known_revision(spreadsheet_id)
+        sheets_api = get_sheets_api()
+        value_ranges = sheets_api.values().batchGet(
+            spreadsheetId=spreadsheet_id, ranges=[f"'{sheet_name}'" for sheet_name in missing]
+        ).execute().get("valueRanges", [])
+
+        for sheet_name, value_range in zip(missing, value_ranges):
+            sheet = _to_sheet(value_range.get("values", []))
+            cache.put(f"{spreadsheet_id}_{sheet_name}", sheet, spreadsheet_id, revision)
+            sheets[sheet_name] = sheet
+
+    return {sheet_name: sheets[sheet_name] for sheet_name in sheet_names}
+
+
+def iter_tasks(
+    spreadsheet_id: str,
+    sheet_name: str = "Tasks",
+    chunk_size: int = 1000
+) -> Iterator[Task]:
+    """
+    Generator yielding the rows of a sheet as Task objects, reading chunk_size rows per request.
+
+    Unlike get_sheet, the sheet is never held in memory as a whole: each window of rows is converted
+    and yielded before the next one is requested, so memory use does not grow with the size of the sheet
+    and the caller can start processing tasks before the whole sheet has been read.
+    The sheets read this way are not cached.
+    """
+    sheets_api = get_sheets_api()
+    row_count = _row_count(sheets_api, spreadsheet_id, sheet_name)
+
+    headers = sheets_api.values().get(
+        spreadsheetId=spreadsheet_id, range=_spreadsheet_range(start_row=1, end_row=1, sheet_name=sheet_name)
+    ).execute().get("values", [[]])[0]
+
+    for start_row in range(2, row_count + 1, chunk_size):
+        end_row = min(start_row + chunk_size - 1, row_count)
+        with span("sheets.iter_tasks.window", start_row=start_row, end_row=end_row):
+            rows = sheets_api.values().get(
+                spreadsheetId=spreadsheet_id,
+                range=_spreadsheet_range(start_row=start_row, end_row=end_row, sheet_name=sheet_name)
+            ).execute().get("values", [])
+
+        for row in Sheet(headers, rows):
+            yield row.to_task()
+
+
+def _row_count(sheets_api, spreadsheet_id: str, sheet_name: str) -> int:
+    """Returns the number of rows in the grid of a sheet, from the spreadsheet metadata"""
+    spreadsheet = sheets_api.get(
+        spreadsheetId=spreadsheet_id, fields="sheets.properties(title,gridProperties.rowCount)"
+    ).execute()
+    for sheet in spreadsheet.get("sheets", []):
+        if sheet["properties"]["title"] == sheet_name:
+            return sheet["properties"]["gridProperties"]["rowCount"]
+    raise IndexError(f"Spreadsheet {spreadsheet_id} does not have a sheet '{sheet_name}'")
+
+
+def _to_sheet(all_rows: List[List[str]]) -> Sheet:
+    """Returns a Sheet from the values of a range, where the first row holds the headers"""
+    if not all_rows:
+        return Sheet([], [])
+    headers, rows = all_rows[0], all_rows[1:]
+    return Sheet(headers, rows)
+
+
 def _spreadsheet_range(
     start_col: str = "A",
     end_col: str = "ZZ",
@@ -274,12 +395,40 @@ def _spreadsheet_range(
 
 
 def get_sheets_api():
-    if "sheets_api" not in cache:
+    if not hasattr(services, "sheets_api"):
+        from googleapiclient.discovery import build
         credentials = authenticate_service()
         service = build("sheets", "v4", credentials=credentials)
-        cache["sheets_api"] = service.spreadsheets()
+        services.sheets_api = service.spreadsheets()
+
+    return services.sheets_api
+
+
+def get_drive_api():
+    if not hasattr(services, "drive_api"):
+        from googleapiclient.discovery import build
+        credentials = authenticate_service()
+        service = build("drive", "v3", credentials=credentials)
+        services.drive_api = service.files()
 
-    return cache["sheets_api"]
+    return services.drive_api
+
+
+@traced()
+def spreadsheet_revision(spreadsheet_id: str) -> Optional[str]:
+    """
+    Returns the revision of a spreadsheet, which changes whenever anything in the spreadsheet changes.
+    This is a metadata request, much cheaper than fetching the values of a sheet.
+    Returns None if the revision cannot be retrieved, e.g. when the token lacks the Drive metadata scope.
+
+    See docs: https://developers.google.com/drive/api/reference/rest/v3/files
+    """
+    try:
+        file = get_drive_api().get(fileId=spreadsheet_id, fields="version,modifiedTime").execute()
+    except HttpError as err:
+        print(f"Could not retrieve the revision of spreadsheet {spreadsheet_id}: {err}")
+        return None
+    return file.get("version") or file.get("modifiedTime")
 
 
 def clean(value: str) -> str:
@@ -288,9 +437,16 @@ def clean(value: str) -> str:
     return value.strip().lower()
 
 
+def _clean_value(value: str) -> Union[str, int, None]:
+    value = value.strip()
+    if value == "":
+        return None
+    return int(value) if _is_ascii_digit(value) else value
+
+
 def _is_ascii_digit(value: str) -> bool:
     """
     is_digit() and is_numeric() returns True for numeric strings like "¹³".
     This function returns True only for strings containing digits 0-9.
     """
-    return bool(re.match(r'^[0-9]+$', value))
+    return value.isascii() and value.isdigit()
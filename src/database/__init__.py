@@ -1,32 +1,65 @@
 import os.path
+import threading
 
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
 from secret_manager import access_secret_version_json
 
+# Firestore clients are created once per process and shared, see initfirebase and initfirebase_async
+clients = {}
+clients_lock = threading.Lock()
+
 def initfirebase():
     """
     Method to initialize the Firebase connection and create a database instance.
+    The client is created on the first call and reused by every later call.
 
     See docs: firebase.google.com/docs/firestore/quickstart
     """
+    if "firestore" in clients:
+        return clients["firestore"]
+
+    with clients_lock:
+        if "firestore" in clients:
+            return clients["firestore"]
+
+        # The Firebase libraries are only imported once a client is needed, see webhook.create_app
+        import firebase_admin
+        from firebase_admin import firestore
+
+        try:
+            # Try to get the default app
+            app = firebase_admin.get_app()
+        except ValueError:
+            # If the app does not exist, initialize it
+            app = firebase_admin.initialize_app(firebase_credentials())
+
+        # Initialize Firestore client
+        db = firestore.client(app=app)
+        clients["firestore"] = db
+
+    return db
+
+
+def initfirebase_async():
+    """
+    Method to create an async Firestore client, for use from async code like the webhook.
+    Uses the same credentials as initfirebase, and is likewise only created once.
+
+    See docs: cloud.google.com/python/docs/reference/firestore/latest/async_client
+    """
+    with clients_lock:
+        if "async_firestore" not in clients:
+            from firebase_admin import firestore
+            cred = firebase_credentials()
+            clients["async_firestore"] = firestore.AsyncClient(project=cred.project_id,
+                                                                credentials=cred.get_credential())
+    return clients["async_firestore"]
+
+
+def firebase_credentials():
+    from firebase_admin import credentials
 
     # With Google Secret Manager
     project_id = "trackpointdb"
     secret_id = "firebase_creds"
     version_id = "latest"
-    cred = credentials.Certificate(access_secret_version_json(project_id, secret_id, version_id))
-    
-    try:
-        # Try to get the default app
-        app = firebase_admin.get_app()
-    except ValueError:
-        # If the app does not exist, initialize it
-        app = firebase_admin.initialize_app(cred)
-
-    # Initialize Firestore client
-    db = firestore.client(app=app)
-
-    return db
-
+    return credentials.Certificate(access_secret_version_json(project_id, secret_id, version_id))
@@ -0,0 +1,140 @@
+import asyncio
+
+from database import initfirebase_async
+import metrics
+from metrics import outbound_call
+from database.backends import TASKS_COLLECTION, _task_from_snapshot
+from database.manager import BOOKKEEPING_FIELDS, DatabaseManager, configured_storage
+from typing import Optional, Dict, Any, List
+
+
+def create_async_manager(db_collection, db_document, storage: Optional[str] = None):
+    """
+    Returns an async manager of the epic for the configured storage backend (see database.manager.create_backend):
+    an AsyncDatabaseManager for Firestore, or a ThreadedDatabaseManager for backends without an async client.
+    """
+    if configured_storage(storage) == "firestore":
+        return AsyncDatabaseManager(db_collection, db_document)
+    return ThreadedDatabaseManager(DatabaseManager(db_collection, db_document, storage=storage))
+
+
+class AsyncDatabaseManager:
+    """
+    Async variant of DatabaseManager, backed by Firestore's AsyncClient.
+
+    Meant for async code like the webhook, where the synchronous client would block the event loop for every
+    round trip. Uses the same layout as DatabaseManager: the epic fields in the epic document, and one
+    document per task in its "tasks" subcollection.
+    """
+    def __init__(self, db_collection, db_document, db=None) -> None:
+        self.db = db if db is not None else initfirebase_async()
+        self.db_collection = db_collection
+        self.db_document = db_document
+        self.doc_ref = self.db.collection(self.db_collection).document(self.db_document)
+        self.tasks_ref = self.doc_ref.collection(TASKS_COLLECTION)
+
+    async def fetch_database(self) -> Optional[Dict[str, Any]]:
+        """Fetches the epic document along with its tasks, see DatabaseManager.fetch_database"""
+        try:
+            with outbound_call("firestore", "get"):
+                doc = await self.doc_ref.get()
+            if doc.exists:
+                data = doc.to_dict()
+                for field in BOOKKEEPING_FIELDS:
+                    data.pop(field, None)
+                if 'tasks' not in data:
+                    data['tasks'] = await self.get_tasks()
+                return data
+            else:
+                print(f"No such document {self.db_document} in collection {self.db_collection}")
+                return None
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+            return None
+
+    async def get_tasks(self) -> List[Dict[str, Any]]:
+        """Returns all tasks of the epic, in the order they were added"""
+        return [_task_from_snapshot(doc) async for doc in self.tasks_ref.order_by("position").stream()]
+
+    async def get_task_with_id(self, task_id: int) -> Optional[Dict[str, Any]]:
+        if not isinstance(task_id, int):
+            raise ValueError("task_id must be an integer")
+        try:
+            with outbound_call("firestore", "get"):
+                doc = await self.tasks_ref.document(str(task_id)).get()
+            if doc.exists:
+                return _task_from_snapshot(doc)
+            return None
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+            return None
+
+    async def get_task_with_title(self, task_title: str) -> Optional[Dict[str, Any]]:
+        if not isinstance(task_title, str):
+            raise ValueError("task_title must be a string")
+        try:
+            docs = await self._tasks_with_title(task_title)
+            if docs:
+                return _task_from_snapshot(docs[0])
+            return None
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+            return None
+
+    async def update_tasks(self, task_title, updated_task):
+        """
+        Updates the fields of the task with the given title, see DatabaseManager.update_tasks.
+        Fields that are None in updated_task, or already have the new value, are not written,
+        and if nothing changed the task is not written at all.
+        """
+        try:
+            docs = await self._tasks_with_title(task_title)
+            if not docs:
+                print(f"Task with title: '{task_title}' not found.")
+                return None
+
+            stored = docs[0].to_dict()
+            changes = {k: v for k, v in updated_task.items() if v is not None and stored.get(k) != v}
+            if not changes:
+                print(f"Task {task_title} is already up to date")
+                return None
+
+            with outbound_call("firestore", "update"):
+                await docs[0].reference.update(changes)
+            print(f"Task {task_title} updated successfully!")
+        except Exception as e:
+            metrics.task_update_errors.inc()
+            print(f"An error occurred: {e}")
+            return None
+
+    async def _tasks_with_title(self, task_title):
+        from google.cloud import firestore
+        with outbound_call("firestore", "query"):
+            return await self.tasks_ref.where(filter=firestore.FieldFilter("title", "==", task_title)).limit(1).get()
+
+
+class ThreadedDatabaseManager:
+    """
+    Async interface of AsyncDatabaseManager over a DatabaseManager, for storage backends without an async client
+    like SQLite. Every call runs in a worker thread, so it does not block the event loop.
+    """
+    def __init__(self, manager: DatabaseManager) -> None:
+        self.manager = manager
+        self.db_collection = manager.db_collection
+        self.db_document = manager.db_document
+
+    async def fetch_database(self) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.manager.fetch_database)
+
+    async def get_tasks(self) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.manager.get_tasks)
+
+    async def get_task_with_id(self, task_id: int) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.manager.get_task_with_id, task_id)
+
+    async def get_task_with_title(self, task_title: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.manager.get_task_with_title, task_title)
+
+    async def update_tasks(self, task_title, updated_task):
+        """Updates the fields of the task with the given title, see DatabaseManager.update_task"""
+        return await asyncio.to_thread(self.manager.update_task, task_title, updated_task)
@@ -0,0 +1,330 @@
+import json
+import sqlite3
+import threading
+
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import outbound_call
+
+# Name of the subcollection holding one document per task under each epic document
+TASKS_COLLECTION = "tasks"
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_WRITES = 500
+# Field of every task document holding the hash of its spreadsheet fields, see DatabaseManager.sync_tasks
+CONTENT_HASH_FIELD = "content_hash"
+# Fields of a task document that are bookkeeping, rather than part of the task
+TASK_BOOKKEEPING_FIELDS = ("position", CONTENT_HASH_FIELD)
+# The fields of the task summaries, see StorageBackend.task_summaries
+SUMMARY_FIELDS = ("title", "issueID", "position", CONTENT_HASH_FIELD)
+
+
+class _DeleteField:
+    def __repr__(self):
+        return "DELETE_FIELD"
+
+
+# Value of a field in an "update" or "merge" operation that removes the field, like firestore.DELETE_FIELD
+DELETE_FIELD = _DeleteField()
+
+# A write: ("set" | "merge" | "update" | "delete", task id or None for the epic itself, data)
+Operation = Tuple[str, Optional[str], Optional[Dict[str, Any]]]
+
+
+class StorageBackend(ABC):
+    """
+    Where DatabaseManager keeps one epic and its tasks.
+
+    An epic is a dict of fields, and its tasks are dicts stored under a task id (see task_document_id)
+    in the order of their "position" field. Tasks are returned without their bookkeeping fields
+    (position and content hash, see TASK_BOOKKEEPING_FIELDS).
+    All writes go through commit, which takes a stream of operations (see Operation):
+    "set" replaces the epic or task, "merge" and "update" change only the given fields ("update" fails if
+    there is nothing to update), and "delete" removes it. Fields set to DELETE_FIELD are removed.
+    """
+    @abstractmethod
+    def get_epic(self) -> Optional[Dict[str, Any]]:
+        """Returns the fields of the epic, or None if it does not exist"""
+
+    @abstractmethod
+    def tasks(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Returns the (task id, task) pairs of the epic, in order"""
+
+    @abstractmethod
+    def task_ids(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def task_summaries(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Returns the (task id, summary) pairs of the epic, in order, where a summary holds only the title,
+        issueID, position and content hash of the task (see SUMMARY_FIELDS), as far as they are stored
+        """
+
+    @abstractmethod
+    def get_tasks_by_issue_ids(self, issue_ids: Iterable[Any]) -> Dict[str, Dict[str, Any]]:
+        """Returns the tasks with the given issueIDs, mapped by the issueID as a string"""
+
+    @abstractmethod
+    def find_task(self, title: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Returns the (task id, task) of the first task with the given title, or None"""
+
+    @abstractmethod
+    def commit(self, operations: Iterable[Operation]) -> None:
+        """Applies the operations, which may be a generator, in batches as they come"""
+
+    def flush(self) -> int:
+        """Commits writes the backend buffered, if it does, and returns their number (see database.write_behind)"""
+        return 0
+
+    def watch(self, listener: Callable, callback: Callable) -> Optional[Any]:
+        """
+        Registers callback for every change to the tasks through listener (see database.index), and returns
+        the registration, which has an unsubscribe method. Returns None if the backend cannot be watched.
+        """
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class FirestoreBackend(StorageBackend):
+    """
+    Stores the epic as a Firestore document, and every task as a document in its "tasks" subcollection.
+    The Firestore library is imported by the methods that need it, so using the SQLite backend never imports it.
+    Every round trip is timed as an outbound call, see metrics.outbound_call.
+    """
+    def __init__(self, db, db_collection: str, db_document: str):
+        self.db = db
+        self.doc_ref = db.collection(db_collection).document(db_document)
+        self.tasks_ref = self.doc_ref.collection(TASKS_COLLECTION)
+
+    def get_epic(self):
+        with outbound_call("firestore", "get"):
+            doc = self.doc_ref.get()
+        return doc.to_dict() if doc.exists else None
+
+    def tasks(self):
+        with outbound_call("firestore", "query"):
+            return [(doc.id, _task_from_snapshot(doc)) for doc in self.tasks_ref.order_by("position").stream()]
+
+    def task_ids(self):
+        with outbound_call("firestore", "list"):
+            return [ref.id for ref in self.tasks_ref.list_documents()]
+
+    def task_summaries(self):
+        # Only the summary fields are sent, not the whole tasks
+        with outbound_call("firestore", "query"):
+            docs = self.tasks_ref.select(list(SUMMARY_FIELDS)).order_by("position").stream()
+            return [(doc.id, doc.to_dict()) for doc in docs]
+
+    def get_tasks_by_issue_ids(self, issue_ids):
+        # Tasks that have an issue are stored under their issueID
+        with outbound_call("firestore", "get_all"):
+            docs = list(self.db.get_all([self.tasks_ref.document(str(issue_id)) for issue_id in issue_ids]))
+        return {doc.id: _task_from_snapshot(doc) for doc in docs if doc.exists}
+
+    def find_task(self, title):
+        from google.cloud import firestore
+        with outbound_call("firestore", "query"):
+            docs = self.tasks_ref.where(filter=firestore.FieldFilter("title", "==", title)).limit(1).get()
+        return (docs[0].id, _task_from_snapshot(docs[0])) if docs else None
+
+    def commit(self, operations):
+        """Commits the operations in write batches of up to 500 writes, each as soon as it is full"""
+        from google.cloud import firestore
+        batch, count = self.db.batch(), 0
+        for operation, task_id, data in operations:
+            ref = self.doc_ref if task_id is None else self.tasks_ref.document(task_id)
+            if data is not None:
+                data = {k: firestore.DELETE_FIELD if v is DELETE_FIELD else v for k, v in data.items()}
+            if operation == "set":
+                batch.set(ref, data)
+            elif operation == "merge":
+                batch.set(ref, data, merge=True)
+            elif operation == "update":
+                batch.update(ref, data)
+            else:
+                batch.delete(ref)
+            count += 1
+            if count == MAX_BATCH_WRITES:
+                with outbound_call("firestore", "commit"):
+                    batch.commit()
+                batch, count = self.db.batch(), 0
+        if count:
+            with outbound_call("firestore", "commit"):
+                batch.commit()
+
+    def watch(self, listener, callback):
+        return listener(self.tasks_ref, callback)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores epics and tasks in a local SQLite database, one row per epic and one row per task, for local
+    development and CI without credentials, or as a low latency store next to the service.
+
+    Tasks are indexed by issueID and by title, so lookups do not scan the epic. The database runs in WAL
+    mode, so readers are not blocked by a writer; every thread gets its own connection.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS epics (
+            collection TEXT NOT NULL,
+            document TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (collection, document)
+        );
+        CREATE TABLE IF NOT EXISTS tasks (
+            collection TEXT NOT NULL,
+            document TEXT NOT NULL,
+            task_id TEXT NOT NULL,
+            position INTEGER,
+            issue_id TEXT,
+            title TEXT,
+            data TEXT NOT NULL,
+            PRIMARY KEY (collection, document, task_id)
+        );
+        CREATE INDEX IF NOT EXISTS tasks_issue_id ON tasks (collection, document, issue_id);
+        CREATE INDEX IF NOT EXISTS tasks_title ON tasks (collection, document, title);
+        CREATE INDEX IF NOT EXISTS tasks_position ON tasks (collection, document, position);
+    """
+
+    def __init__(self, path: str, db_collection: str, db_document: str):
+        self.path = path
+        self.key = (db_collection, db_document)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(self.SCHEMA)
+
+    def get_epic(self):
+        row = self._connection().execute(
+            "SELECT data FROM epics WHERE collection = ? AND document = ?", self.key).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def tasks(self):
+        rows = self._connection().execute(
+            "SELECT task_id, data FROM tasks WHERE collection = ? AND document = ? ORDER BY position", self.key)
+        return [(task_id, task_without_bookkeeping(json.loads(data))) for task_id, data in rows]
+
+    def task_ids(self):
+        rows = self._connection().execute("SELECT task_id FROM tasks WHERE collection = ? AND document = ?", self.key)
+        return [task_id for task_id, in rows]
+
+    def task_summaries(self):
+        rows = self._connection().execute(
+            "SELECT task_id, position, data FROM tasks WHERE collection = ? AND document = ? ORDER BY position",
+            self.key)
+        summaries = []
+        for task_id, position, data in rows:
+            task = {**json.loads(data), "position": position}
+            summaries.append((task_id, {field: task[field] for field in SUMMARY_FIELDS if field in task}))
+        return summaries
+
+    def get_tasks_by_issue_ids(self, issue_ids):
+        issue_ids = [str(issue_id) for issue_id in issue_ids]
+        tasks = {}
+        # Stay well below SQLite's limit on the number of parameters
+        for start in range(0, len(issue_ids), 500):
+            chunk = issue_ids[start:start + 500]
+            rows = self._connection().execute(
+                "SELECT issue_id, data FROM tasks WHERE collection = ? AND document = ? "
+                f"AND issue_id IN ({', '.join('?' * len(chunk))})", self.key + tuple(chunk))
+            for issue_id, data in rows:
+                tasks.setdefault(issue_id, task_without_bookkeeping(json.loads(data)))
+        return tasks
+
+    def find_task(self, title):
+        row = self._connection().execute(
+            "SELECT task_id, data FROM tasks WHERE collection = ? AND document = ? AND title = ? "
+            "ORDER BY position LIMIT 1", self.key + (title,)).fetchone()
+        return (row[0], task_without_bookkeeping(json.loads(row[1]))) if row else None
+
+    def commit(self, operations):
+        """Applies the operations in transactions of up to 500 operations, each as soon as it is full"""
+        connection = self._connection()
+        count = 0
+        try:
+            for operation, task_id, data in operations:
+                if task_id is None:
+                    self._write_epic(connection, operation, data)
+                else:
+                    self._write_task(connection, operation, task_id, data)
+                count += 1
+                if count == MAX_BATCH_WRITES:
+                    connection.commit()
+                    count = 0
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def _write_epic(self, connection, operation, data):
+        if operation == "delete":
+            connection.execute("DELETE FROM epics WHERE collection = ? AND document = ?", self.key)
+            return
+        epic = self._merged(operation, self.get_epic(), data, "epic")
+        connection.execute("INSERT OR REPLACE INTO epics (collection, document, data) VALUES (?, ?, ?)",
+                           self.key + (json.dumps(epic),))
+
+    def _write_task(self, connection, operation, task_id, data):
+        if operation == "delete":
+            connection.execute("DELETE FROM tasks WHERE collection = ? AND document = ? AND task_id = ?",
+                               self.key + (task_id,))
+            return
+        stored = None
+        if operation != "set":
+            row = connection.execute(
+                "SELECT position, data FROM tasks WHERE collection = ? AND document = ? AND task_id = ?",
+                self.key + (task_id,)).fetchone()
+            if row is not None:
+                stored = {**json.loads(row[1]), "position": row[0]}
+        task = self._merged(operation, stored, data, f"task {task_id}")
+        position = task.pop("position", None)
+        issue_id = task.get("issueID")
+        connection.execute(
+            "INSERT OR REPLACE INTO tasks (collection, document, task_id, position, issue_id, title, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            self.key + (task_id, position, None if issue_id in (None, "") else str(issue_id), task.get("title"),
+                        json.dumps(task)))
+
+    def _merged(self, operation, stored, data, name):
+        if operation == "update" and stored is None:
+            raise KeyError(f"No {name} to update")
+        merged = dict(stored or {}) if operation != "set" else {}
+        for key, value in data.items():
+            if value is DELETE_FIELD:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        return merged
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+
+def task_without_bookkeeping(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Removes the bookkeeping fields (see TASK_BOOKKEEPING_FIELDS) from a stored task, and returns it"""
+    for field in TASK_BOOKKEEPING_FIELDS:
+        task.pop(field, None)
+    return task
+
+
+def _task_from_snapshot(doc) -> Dict[str, Any]:
+    """Returns the task stored in a task document, without the bookkeeping fields"""
+    return task_without_bookkeeping(doc.to_dict())
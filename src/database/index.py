@@ -0,0 +1,100 @@
+import enum
+import threading
+from collections import namedtuple
+from typing import Optional, Dict, Any
+
+from database.backends import task_without_bookkeeping
+
+
+class ChangeType(enum.Enum):
+    """Mirrors google.cloud.firestore_v1.watch.ChangeType, which is what Firestore listeners report"""
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+DocumentChange = namedtuple("DocumentChange", ["type", "document"])
+
+
+class TaskIndex:
+    """
+    In-process index of the tasks of an epic by document id (I.e issueID) and by title.
+
+    The index is fed by a snapshot listener on the tasks subcollection: on_snapshot has the signature of
+    a Firestore on_snapshot callback, so Firestore pushes every change to the index as it happens.
+    Until the first snapshot has arrived the index is not ready, and lookups should go to Firestore.
+    """
+    def __init__(self):
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.titles: Dict[str, str] = {}
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                document_id = change.document.id
+                self._remove(document_id)
+                if change.type.name != "REMOVED":
+                    task = task_without_bookkeeping(change.document.to_dict())
+                    self.tasks[document_id] = task
+                    self.titles.setdefault(task.get("title"), document_id)
+        self.ready.set()
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        task = self.tasks.get(document_id)
+        return dict(task) if task is not None else None
+
+    def get_by_title(self, title: str) -> Optional[Dict[str, Any]]:
+        document_id = self.titles.get(title)
+        return self.get(document_id) if document_id is not None else None
+
+    def _remove(self, document_id):
+        task = self.tasks.pop(document_id, None)
+        if task is None or self.titles.get(task.get("title")) != document_id:
+            return
+        # Another task may share the title of the removed task
+        del self.titles[task.get("title")]
+        for other_id, other in self.tasks.items():
+            if other.get("title") == task.get("title"):
+                self.titles[task.get("title")] = other_id
+                break
+
+
+def firestore_listener(collection_ref, callback):
+    """Registers callback as a Firestore snapshot listener on the collection, returns the watch"""
+    return collection_ref.on_snapshot(callback)
+
+
+class LocalSnapshotListener:
+    """
+    Local stand-in for a Firestore snapshot listener, used when Firestore cannot push changes,
+    e.g. offline tests or clients without watch support.
+
+    Instead of a server stream, refresh() reads the collection, compares it with the last read and reports
+    the differences to the callback the same way a Firestore listener would. The first read happens right away.
+    """
+    def __init__(self, collection_ref, callback):
+        self.collection_ref = collection_ref
+        self.callback = callback
+        self.documents = {}
+        self.refresh()
+
+    def refresh(self):
+        snapshots = {doc.id: doc for doc in self.collection_ref.stream()}
+        changes = []
+        for document_id, doc in snapshots.items():
+            previous = self.documents.get(document_id)
+            if previous is None:
+                changes.append(DocumentChange(ChangeType.ADDED, doc))
+            elif previous.to_dict() != doc.to_dict():
+                changes.append(DocumentChange(ChangeType.MODIFIED, doc))
+        for document_id, doc in self.documents.items():
+            if document_id not in snapshots:
+                changes.append(DocumentChange(ChangeType.REMOVED, doc))
+
+        self.documents = snapshots
+        self.callback(list(snapshots.values()), changes, None)
+
+    def unsubscribe(self):
+        self.documents = {}
@@ -1,25 +1,225 @@
+import bisect
+import hashlib
+import itertools
+import json
+import os
+import threading
+
+import metrics
+
 from database import initfirebase
-from typing import Optional, Dict, Any
+from database.backends import (CONTENT_HASH_FIELD, DELETE_FIELD, FirestoreBackend, SQLiteBackend, StorageBackend,
+                               TASKS_COLLECTION, MAX_BATCH_WRITES)
+from database.index import TaskIndex, firestore_listener
+from database.write_behind import WriteBehindBackend
+from tracing import traced
+from typing import Optional, Dict, Any, List, Iterable, Sequence
+
+# Environment variable choosing the storage backend, see create_backend
+STORAGE_ENV = "TRACKPOINT_STORAGE"
+# Field of the epic document that held the content hashes of all tasks, before they were kept on the
+# task documents themselves. sync_tasks removes it.
+TASK_HASHES_FIELD = "task_hashes"
+# Field of the epic document holding the issue ids created so far by a bulk creation, see epics.checkpoint
+ISSUE_CHECKPOINT_FIELD = "issue_checkpoint"
+# Fields of the epic document that are bookkeeping, rather than part of the epic
+BOOKKEEPING_FIELDS = (TASK_HASHES_FIELD, ISSUE_CHECKPOINT_FIELD)
+# The task fields that come from the spreadsheet, and make up the content hash of a task
+SYNCED_FIELDS = ("title", "description", "priority", "story_point", "comments")
+# Distance between the positions of tasks written one after the other, leaving room to insert tasks between them
+POSITION_GAP = 1024
+
+
+def task_document_id(task: Dict[str, Any], occurrence: int = 0) -> str:
+    """
+    Returns the id of the document a task is stored in. Tasks are keyed by their issueID,
+    tasks that do not have an issue yet are keyed by a hash of their title. Tasks sharing a title
+    (or having none) are told apart by occurrence, the number of earlier tasks with the same title.
+    """
+    issue_id = task.get("issueID")
+    if issue_id not in (None, ""):
+        return str(issue_id)
+    document_id = "title-" + hashlib.sha1(str(task.get("title")).encode("utf-8")).hexdigest()[:20]
+    return f"{document_id}-{occurrence}" if occurrence else document_id
+
+
+def _unused_document_id(task: Dict[str, Any], taken) -> str:
+    """Returns the id of the first document the task can be stored in that is not in taken, see task_document_id"""
+    occurrence = 0
+    while task_document_id(task, occurrence) in taken:
+        occurrence += 1
+    return task_document_id(task, occurrence)
+
+
+def content_hash(task: Dict[str, Any]) -> str:
+    """Returns a hash of the spreadsheet fields of a task. Its position is kept apart, see sparse_positions"""
+    value = json.dumps([task.get(field) for field in SYNCED_FIELDS], default=str)
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:16]
+
+
+def sparse_positions(stored: Sequence[Optional[int]], start: Optional[int] = None) -> List[int]:
+    """
+    Returns the positions to store tasks under, given the positions they are stored under now
+    (None for new tasks), in their new order. All positions are after start, if given, the position
+    of the task before the first one.
+
+    As many tasks as possible keep their position: the longest run of tasks that are still in order and leave
+    room for the tasks between them. The others get positions between them, so inserting, removing or moving
+    a task changes the position of that task only, rather than of every task after it.
+    """
+    if start is not None:
+        # The task at start keeps its position, so tasks without room after it cannot keep theirs
+        stored = [start] + [None if position is None or position - i <= start else position
+                             for i, position in enumerate(stored)]
+        return sparse_positions(stored)[1:]
+
+    # Tasks i < j can both keep their position, with the tasks between them moved, if there are enough
+    # positions between theirs: stored[j] - stored[i] >= j - i, i.e. stored[i] - i <= stored[j] - j.
+    # The tasks that keep their position are thus a longest non-decreasing run of stored[i] - i.
+    keys, ends, previous = [], [], {}
+    for i, position in enumerate(stored):
+        if position is None:
+            continue
+        length = bisect.bisect_right(keys, position - i)
+        previous[i] = ends[length - 1] if length else None
+        if length == len(keys):
+            keys.append(position - i)
+            ends.append(i)
+        else:
+            keys[length] = position - i
+            ends[length] = i
+    kept = set()
+    i = ends[-1] if ends else None
+    while i is not None:
+        kept.add(i)
+        i = previous[i]
+
+    positions = [0] * len(stored)
+    last, moved = None, []
+    for i, position in enumerate(stored):
+        if i not in kept:
+            moved.append(i)
+            continue
+        for n, j in enumerate(moved):
+            if last is None:
+                positions[j] = position - (len(moved) - n) * POSITION_GAP
+            else:
+                positions[j] = last + (position - last) * (n + 1) // (len(moved) + 1)
+        positions[i], last, moved = position, position, []
+    for n, j in enumerate(moved):
+        positions[j] = n * POSITION_GAP if last is None else last + (n + 1) * POSITION_GAP
+    return positions
+
+
+# Managers shared by the calls of DatabaseManager.update_tasks, by (collection, document, storage)
+_shared_managers = {}
+_shared_managers_lock = threading.Lock()
+
+
+def close_shared_managers() -> None:
+    """Closes the managers shared by DatabaseManager.update_tasks, e.g. when the storage is reconfigured"""
+    with _shared_managers_lock:
+        managers = list(_shared_managers.values())
+        _shared_managers.clear()
+    for manager in managers:
+        manager.close()
+
+
+def configured_storage(storage: Optional[str] = None) -> str:
+    """Returns storage, or the storage backend configured by the TRACKPOINT_STORAGE environment variable if None"""
+    return storage or os.environ.get(STORAGE_ENV) or "firestore"
+
+
+def create_backend(db_collection: str, db_document: str, storage: Optional[str] = None) -> StorageBackend:
+    """
+    Returns the storage backend of an epic, as configured by storage, or by the TRACKPOINT_STORAGE
+    environment variable if storage is None:
+        "firestore" (the default): Firestore, with the credentials from Secret Manager.
+        "sqlite:<path>": A local SQLite database file, e.g. "sqlite:trackpoint.db" for development and CI.
+    """
+    storage = configured_storage(storage)
+    if storage == "firestore":
+        return FirestoreBackend(initfirebase(), db_collection, db_document)
+    if storage.startswith("sqlite:"):
+        return SQLiteBackend(storage[len("sqlite:"):], db_collection, db_document)
+    raise ValueError(f"Unknown storage backend {storage!r}, expected 'firestore' or 'sqlite:<path>'")
+
 
 #Maybe more of a document manager than a database manager but I'm not sure what to call it
 class DatabaseManager:
-    def __init__(self, db_collection, db_document) -> None:
-        self.db = initfirebase()
+    """
+    Manages an epic document and its tasks.
+
+    The epic fields (title, problem, feature, value) live in the epic document, while each task is its own
+    document in the "tasks" subcollection of the epic (see task_document_id). Reading or changing a single
+    task therefore only touches that task's document, and the size of an epic is not bounded by the
+    1 MiB document limit. Epics stored in the old format, with all tasks in a "tasks" array on the epic
+    document, can be converted with migrate_tasks_to_subcollection.
+
+    Where the epic is stored is up to the storage backend (see database.backends), Firestore unless
+    configured otherwise through storage or the TRACKPOINT_STORAGE environment variable, see create_backend.
+    A backend can also be passed in directly.
+
+    With write_behind=True, writes are buffered and merged per task before they are committed in batches
+    (see database.write_behind.WriteBehindBackend), e.g. for bursts of task updates. Call flush to commit
+    them right away; close flushes as well.
+
+    Every task document also keeps a content hash of the task (see sync_tasks), so that re-importing
+    a spreadsheet only writes the tasks that actually changed. Tasks are ordered by a sparse position
+    kept apart from the hash (see sparse_positions), so inserting a task does not move the tasks after it.
+
+    With use_index=True the manager keeps an in-process TaskIndex of the tasks, kept fresh by a snapshot
+    listener on the tasks subcollection, and serves task lookups from it instead of Firestore.
+    listener is the function registering the listener, see database.index. Backends that cannot be watched,
+    like SQLite, are fast to query locally and do without the index.
+    """
+    def __init__(self, db_collection, db_document, use_index=False, listener=firestore_listener,
+                 storage: Optional[str] = None, backend: Optional[StorageBackend] = None,
+                 write_behind: bool = False) -> None:
         self.db_collection = db_collection
         self.db_document = db_document
-        self.doc_ref = self.db.collection(self.db_collection).document(self.db_document)
-        
+        self.backend = backend if backend is not None else create_backend(db_collection, db_document, storage)
+        if write_behind:
+            self.backend = WriteBehindBackend(self.backend)
+        self.index = None
+        self.watch = None
+        if use_index:
+            index = TaskIndex()
+            self.watch = self.backend.watch(listener, index.on_snapshot)
+            if self.watch is not None:
+                self.index = index
+
+    def close(self) -> None:
+        """Stops the snapshot listener of the task index, if any, and closes the backend after flushing it"""
+        if self.watch is not None:
+            self.watch.unsubscribe()
+            self.watch = None
+        self.backend.close()
+
+    @traced()
+    def flush(self) -> None:
+        """Commits the writes buffered with write_behind=True"""
+        try:
+            self.backend.flush()
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+
+    @traced()
     def fetch_database(self):
         """
-        Fetches a document from a specified Firestore collection.
+        Fetches a document from a specified Firestore collection, along with its tasks.
         Returns:
             dict: The document data as a dictionary if the document exists.
             None: If the document does not exist or an error occurs.
         """
         try:
-            doc = self.doc_ref.get()
-            if doc.exists:
-                data = doc.to_dict()
+            data = self.backend.get_epic()
+            if data is not None:
+                for field in BOOKKEEPING_FIELDS:
+                    data.pop(field, None)
+                # Epics that have not been migrated yet still carry their tasks in the document
+                if 'tasks' not in data:
+                    data['tasks'] = self.get_tasks()
                 return data
                 #return json.dumps(data, indent=4)
             else:
@@ -29,78 +229,264 @@ class DatabaseManager:
             print(f"An error occurred: {e}")
             return None
 
-    def update_db(self, updates):
+    @traced()
+    def get_tasks(self) -> List[Dict[str, Any]]:
+        """Returns all tasks of the epic, in the order they were added"""
+        return [task for _, task in self.backend.tasks()]
+
+    @traced()
+    def update_db(self, updates) -> bool:
+        """Updates the epic with the given fields, replacing its tasks if given. Returns whether the update was stored"""
         try:
-            self.doc_ref.update(updates)
+            updates = dict(updates)
+            tasks = updates.pop('tasks', None)
+            if tasks is not None:
+                self._replace_tasks(tasks)
+            if updates:
+                self.backend.commit([("update", None, updates)])
             print(f"Document {self.db_document} in collection {self.db_collection} updated successfully!")
+            return True
         except Exception as e:  # Catch any exceptions
             print(f"An error occurred: {e}")
-    
+            return False
+
     # Should match the format of a base epic object
+    @traced()
     def add_to_db(self, epic_data, data):
         try:
-            self.doc_ref.set({
+            self._replace_tasks(data, epic={
                 "title": epic_data.title,
                 "problem": epic_data.problem,
                 "feature": epic_data.feature,
-                "value": epic_data.value,
-                "tasks": data
+                "value": epic_data.value
             })
             print(f"Document {self.db_document} in collection {self.db_collection} added successfully!")
         except Exception as e:  # Catch any exceptions
             print(f"An error occurred: {e}")
             return None
-    
+
+    @traced()
+    def sync_tasks(self, epic_data, tasks: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Brings the epic and its tasks in line with the given epic data and tasks (e.g. freshly read from the
+        spreadsheet), writing only what changed instead of overwriting everything like add_to_db.
+
+        The content hash and position stored on every task document are read (and nothing else of the tasks),
+        and compared with the hashes of the given tasks: new tasks are added, changed or moved tasks are
+        updated and tasks that are gone are deleted, all in batched commits. An unchanged epic costs a read per
+        task and no writes. Tasks without an issueID are matched to the stored tasks by title, and an issueID
+        stored for them (e.g. written back after creating the issues) is kept.
+
+        The given tasks are taken MAX_BATCH_WRITES at a time and written as they arrive, so tasks streamed from
+        a generator (see setup.stream_database) are never all held in memory, only the stored hashes and positions.
+        Returns:
+            dict: The number of tasks added, changed, removed and unchanged, or None if the sync failed.
+        """
+        try:
+            return self._sync_tasks(epic_data, tasks)
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+            return None
+
+    def _sync_tasks(self, epic_data, tasks):
+        epic = self.backend.get_epic()
+        stored = epic if epic is not None else {}
+        summaries = dict(self.backend.task_summaries()) if epic is not None else {}
+        # The stored tasks by title, in order, so tasks sharing a title are matched to them one by one
+        titles = {}
+        for task_id, task_summary in summaries.items():
+            titles.setdefault(task_summary.get("title"), []).append(task_id)
+
+        matched, taken = set(), set(summaries)
+
+        def document_id(task):
+            if task.get("issueID") not in (None, ""):
+                task_id = str(task["issueID"])
+            else:
+                candidates = titles.get(task.get("title"), [])
+                while candidates and candidates[0] in matched:
+                    candidates.pop(0)
+                if candidates:
+                    task_id = candidates.pop(0)
+                else:
+                    task_id = _unused_document_id(task, taken)
+            matched.add(task_id)
+            taken.add(task_id)
+            return task_id
+
+        def windows():
+            """
+            Yields the tasks with their document ids and positions, MAX_BATCH_WRITES tasks at a time, so streamed
+            tasks are written as they arrive. Positions are assigned per window, after those of the window before.
+            """
+            iterator, last = iter(tasks), None
+            while True:
+                window = list(itertools.islice(iterator, MAX_BATCH_WRITES))
+                if not window:
+                    return
+                task_ids = [document_id(task) for task in window]
+                positions = sparse_positions([summaries.get(task_id, {}).get("position") for task_id in task_ids],
+                                             start=last)
+                last = positions[-1]
+                yield from zip(window, task_ids, positions)
+
+        summary = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        epic_fields = {
+            "title": epic_data.title,
+            "problem": epic_data.problem,
+            "feature": epic_data.feature,
+            "value": epic_data.value
+        }
+
+        def operations():
+            for task, task_id, position in windows():
+                previous = summaries.get(task_id)
+                task_hash = content_hash(task)
+                data = {**task, "position": position, CONTENT_HASH_FIELD: task_hash}
+
+                if previous is None:
+                    summary["added"] += 1
+                    yield "set", task_id, data
+                elif previous.get(CONTENT_HASH_FIELD) != task_hash:
+                    summary["changed"] += 1
+                    if data.get("issueID") in (None, ""):
+                        # Keep the issueID written back after the issue was created
+                        data.pop("issueID", None)
+                    yield "merge", task_id, data
+                elif previous.get("position") != position:
+                    summary["changed"] += 1
+                    yield "merge", task_id, {"position": position}
+                else:
+                    summary["unchanged"] += 1
+
+            for task_id in summaries:
+                if task_id not in matched:
+                    summary["removed"] += 1
+                    yield "delete", task_id, None
+
+            if epic is None:
+                yield "set", None, epic_fields
+                return
+            updates = {k: v for k, v in epic_fields.items() if stored.get(k) != v}
+            # The tasks of epics in the old format now live in the subcollection, and their hashes on the tasks
+            for field in ('tasks', TASK_HASHES_FIELD):
+                if field in stored:
+                    updates[field] = DELETE_FIELD
+            if updates:
+                yield "update", None, updates
+
+        self._commit_in_batches(operations())
+        print(f"Document {self.db_document} in collection {self.db_collection} synced: {summary}")
+        return summary
+
+    @traced()
+    def save_checkpoint(self, created: Optional[Dict[str, Any]]) -> None:
+        """Saves the issue ids created so far by task (see epics.checkpoint.CreationJournal), or removes them if None"""
+        try:
+            value = DELETE_FIELD if created is None else created
+            self.backend.commit([("merge", None, {ISSUE_CHECKPOINT_FIELD: value})])
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+
+    @traced()
+    def load_checkpoint(self) -> Dict[str, Any]:
+        """Returns the issue ids saved by save_checkpoint"""
+        try:
+            epic = self.backend.get_epic()
+            if epic is None:
+                return {}
+            return epic.get(ISSUE_CHECKPOINT_FIELD) or {}
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+            return {}
+
+    @traced()
     def get_task_with_id(self, task_id: int) -> Optional[Dict[str, Any]]:
         if not isinstance(task_id, int):
             raise ValueError("task_id must be an integer")
-        
+        if self._index_ready():
+            return self.index.get(str(task_id))
+
         try:
-            doc = self.doc_ref.get()
-            if doc.exists:
-                data = doc.to_dict()
-                tasks = data['tasks']
-                for task in tasks:
-                    if task['issueID'] == task_id:
-                        return task
-                return None
-            else:
-                print(f"No such document {self.db_document} in collection {self.db_collection}")
-                return None
+            return self.backend.get_tasks_by_issue_ids([task_id]).get(str(task_id))
         except Exception as e:  # Catch any exceptions
             print(f"An error occurred: {e}")
             return None
-    
+
+    @traced()
     def get_task_with_title(self, task_title: str) -> Optional[Dict[str, Any]]:
         if not isinstance(task_title, str):
             raise ValueError("task_title must be a string")
+        if self._index_ready():
+            return self.index.get_by_title(task_title)
         try:
-            doc = self.doc_ref.get()
-            if doc.exists:
-                data = doc.to_dict()
-                tasks = data['tasks']
-                for task in tasks:
-                    if task['title'] == task_title:
-                        return task
-                return None
-            else:
-                print(f"No such document {self.db_document} in collection {self.db_collection}")
-                return None
+            found = self.backend.find_task(task_title)
+            if found is not None:
+                return found[1]
+            return None
         except Exception as e:  # Catch any exceptions
             print(f"An error occurred: {e}")
             return None
 
+    @traced()
+    def get_tasks_by_ids(self, task_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Returns the tasks with the given issueIDs, mapped by issueID. Tasks that do not exist are left out.
+        Without a ready index, all tasks are read in a single batched request.
+        """
+        task_ids = list(task_ids)
+        if self._index_ready():
+            tasks = {task_id: self.index.get(str(task_id)) for task_id in task_ids}
+            return {task_id: task for task_id, task in tasks.items() if task is not None}
+
+        try:
+            tasks = self.backend.get_tasks_by_issue_ids(task_ids)
+            return {task_id: tasks[str(task_id)] for task_id in task_ids if str(task_id) in tasks}
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+            return {}
+
+    @traced()
     def delete_epic(self) -> None:
         try:
-            self.doc_ref.delete()
+            self.backend.commit([("delete", task_id, None) for task_id in self.backend.task_ids()])
+            self.backend.commit([("delete", None, None)])
             print(f"Document {self.db_document} in collection {self.db_collection} deleted successfully!")
         except Exception as e:  # Catch any exceptions
             print(f"An error occurred: {e}")
             return None
-    
+
+    @traced()
+    def migrate_tasks_to_subcollection(self) -> int:
+        """
+        Moves the tasks of an epic stored in the old format (a "tasks" array in the epic document)
+        into the tasks subcollection, and removes the array from the epic document.
+        The array is only removed after all tasks have been written, so an interrupted migration can be rerun.
+        Returns:
+            int: The number of tasks migrated.
+        """
+        epic = self.backend.get_epic()
+        if epic is None:
+            print(f"No such document {self.db_document} in collection {self.db_collection}")
+            return 0
+
+        tasks = epic.get('tasks')
+        if tasks is None:
+            print(f"Document {self.db_document} in collection {self.db_collection} is already migrated")
+            return 0
+
+        self._replace_tasks(tasks)
+        self.backend.commit([("update", None, {'tasks': DELETE_FIELD})])
+        print(f"Migrated {len(tasks)} tasks of document {self.db_document} in collection {self.db_collection}")
+        return len(tasks)
+
+    @staticmethod
+    @traced()
     def update_tasks(db_collection, db_document, task_title, updated_task):
         """
-        Updates a specific task in the 'tasks' list within a Firestore document.
+        Updates the fields of a specific task document within an epic document, see update_task.
+        The manager (and its backend) of every epic is created on the first call and reused by the later ones,
+        see close_shared_managers.
         Args:
             db_collection (str): The name of the Firestore collection.
             db_document (str): The name of the document within the collection.
@@ -111,31 +497,70 @@ class DatabaseManager:
         Raises:
             Exception: If an error occurs during the update operation, it will be caught and printed.
         """
-        db = initfirebase()
+        key = (db_collection, db_document, configured_storage())
         try:
-            doc_ref = db.collection(db_collection).document(db_document)
-            doc = doc_ref.get()
-            
-            if doc.exists:
-                data = doc.to_dict()
-                tasks = data.get('tasks', [])
-                
-                task_found = False
-                for task in tasks:
-                    if task.get('title') == task_title:
-                        task.update({k: v for k, v in updated_task.items() if v is not None})
-                        task_found = True
-                        break
-                
-                if not task_found:
-                    print(f"Task with title: '{task_title}' not found.")
-                    return None
-                
-                doc_ref.update({'tasks': tasks})
-                print(f"Task {task_title} updated successfully!")
-            else:
-                print(f"No such document {db_document} in collection {db_collection}")
+            with _shared_managers_lock:
+                manager = _shared_managers.get(key)
+                if manager is None:
+                    manager = _shared_managers[key] = DatabaseManager(db_collection, db_document)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+        manager.update_task(task_title, updated_task)
+
+    @traced()
+    def update_task(self, task_title: str, updated_task: Dict[str, Any]) -> None:
+        """
+        Updates the fields of the task with the given title. Fields that are None in updated_task,
+        or already have the new value, are not written, and if nothing changed the task is not written at all.
+        """
+        try:
+            found = self.backend.find_task(task_title)
+            if found is None:
+                print(f"Task with title: '{task_title}' not found.")
+                return None
+
+            task_id, stored = found
+            changes = {k: v for k, v in updated_task.items() if v is not None and stored.get(k) != v}
+            if not changes:
+                print(f"Task {task_title} is already up to date")
                 return None
+
+            self.backend.commit([("update", task_id, changes)])
+            print(f"Task {task_title} updated successfully!")
         except Exception as e:
+            metrics.task_update_errors.inc()
             print(f"An error occurred: {e}")
             return None
+
+    def _index_ready(self) -> bool:
+        return self.index is not None and self.index.ready.is_set()
+
+    def _replace_tasks(self, tasks: Iterable[Dict[str, Any]], epic: Optional[Dict[str, Any]] = None):
+        """
+        Writes the given tasks as the tasks of the epic, and deletes the task documents not among them.
+        tasks may be a generator, the tasks are written batch by batch as they come.
+        If epic is given, the epic document is replaced by it in the first batch.
+        """
+        written = set()
+
+        def operations():
+            if epic is not None:
+                yield "set", None, epic
+            for position, task in enumerate(tasks):
+                task_id = _unused_document_id(task, written) if task.get("issueID") in (None, "") \
+                    else task_document_id(task)
+                written.add(task_id)
+                yield "set", task_id, {**task, "position": position * POSITION_GAP,
+                                       CONTENT_HASH_FIELD: content_hash(task)}
+
+            for task_id in self.backend.task_ids():
+                if task_id not in written:
+                    yield "delete", task_id, None
+
+        self._commit_in_batches(operations())
+
+    @traced()
+    def _commit_in_batches(self, operations):
+        """Applies (operation, task id or None for the epic, data) tuples through the backend, in batches"""
+        self.backend.commit(operations)
@@ -0,0 +1,109 @@
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from Google import sheets
+from database.manager import DatabaseManager
+from database.setup import transform_tasks
+
+STAGES = ("fetch", "transform", "write")
+
+
+@dataclass
+class ImportTarget:
+    """A spreadsheet, and the epic document it is imported into"""
+    spreadsheet_id: str
+    db_collection: str
+    db_document: str
+
+
+@dataclass
+class ImportResult:
+    """Outcome of importing one spreadsheet, with the seconds spent in each stage"""
+    target: ImportTarget
+    timings: Dict[str, float] = field(default_factory=dict)
+    summary: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+
+    @property
+    def total(self) -> float:
+        return sum(self.timings.values())
+
+
+def load_manifest(path: str) -> List[ImportTarget]:
+    """
+    Reads an import manifest, a JSON file mapping spreadsheet ids to the epic document they are imported into:
+        {"<spreadsheet id>": {"collection": "epics", "document": "My Epic"}, ...}
+    """
+    with open(path, encoding="utf-8") as manifest:
+        entries = json.load(manifest)
+    return [ImportTarget(spreadsheet_id, entry["collection"], entry["document"])
+            for spreadsheet_id, entry in entries.items()]
+
+
+def import_spreadsheets(targets: List[ImportTarget], max_workers: int = 4,
+                        manager_factory: Callable[[str, str], Any] = DatabaseManager) -> List[ImportResult]:
+    """
+    Imports several spreadsheets, each into its own epic document, on a pool of max_workers threads.
+
+    Every spreadsheet goes through the same stages as setup_database: its 'Epic' and 'Tasks' sheets are fetched
+    in one request, transformed into an epic and its tasks, and written with DatabaseManager.sync_tasks, which
+    only writes what changed, in batched commits. A failing spreadsheet does not stop the others, its error
+    is recorded in its result.
+    Returns:
+        list: An ImportResult per target, in the order of targets.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda target: import_spreadsheet(target, manager_factory), targets))
+    print_report(results)
+    return results
+
+
+def import_spreadsheet(target: ImportTarget,
+                       manager_factory: Callable[[str, str], Any] = DatabaseManager) -> ImportResult:
+    result = ImportResult(target)
+    stage = STAGES[0]
+    try:
+        started = time.perf_counter()
+        sheets_by_name = sheets.get_sheets(["Epic", "Tasks"], target.spreadsheet_id)
+        started = _record(result, stage, started)
+
+        stage = "transform"
+        epic_data = sheets.transform_to_epics(sheets_by_name["Epic"])
+        tasks = transform_tasks(sheets_by_name["Tasks"])
+        started = _record(result, stage, started)
+
+        stage = "write"
+        db_manager = manager_factory(target.db_collection, target.db_document)
+        try:
+            result.summary = db_manager.sync_tasks(epic_data, tasks)
+        finally:
+            # Flushes buffered writes and stops the listeners of the manager, it is not used after this import
+            db_manager.close()
+        if result.summary is None:
+            raise RuntimeError("the tasks could not be written")
+        _record(result, stage, started)
+    except Exception as e:  # Catch any exceptions
+        result.error = f"{stage} failed: {e}"
+        print(f"An error occurred while importing {target.spreadsheet_id}: {result.error}")
+    return result
+
+
+def print_report(results: List[ImportResult]) -> None:
+    """Prints the time spent per stage for every epic, and in total"""
+    print(f"{'Epic':<30}" + "".join(f"{stage:>12}" for stage in STAGES) + f"{'total':>12}")
+    for result in results:
+        timings = "".join(f"{result.timings.get(stage, 0.0):>12.3f}" for stage in STAGES)
+        status = f"  {result.error}" if result.error else ""
+        print(f"{result.target.db_document[:30]:<30}{timings}{result.total:>12.3f}{status}")
+    totals = "".join(f"{sum(r.timings.get(stage, 0.0) for r in results):>12.3f}" for stage in STAGES)
+    print(f"{'Total':<30}{totals}{sum(r.total for r in results):>12.3f}")
+
+
+def _record(result: ImportResult, stage: str, started: float) -> float:
+    now = time.perf_counter()
+    result.timings[stage] = now - started
+    return now
@@ -3,6 +3,7 @@ import json
 import dataclasses
 from googleapiclient.errors import HttpError
 from Google import sheets
+from tracing import traced
 
 # Define a custom JSON encoder to handle dataclasses. Mostly just here so I could print the dataclasses as JSON
 # in the terminal
@@ -12,11 +13,13 @@ class EnhancedJSONEncoder(json.JSONEncoder):
             return dataclasses.asdict(o)
         return super().default(o)
 
+@traced()
 def setup_database(spreadsheet_id, db_manager):
     try:
-        # Retrieve data from 'Epic' and 'Tasks' sheets.
-        epic_sheet = sheets.get_sheet("Epic", spreadsheet_id)
-        tasks_sheet = sheets.get_sheet("Tasks", spreadsheet_id)
+        # Retrieve data from 'Epic' and 'Tasks' sheets, in one request.
+        sheets_by_name = sheets.get_sheets(["Epic", "Tasks"], spreadsheet_id)
+        epic_sheet = sheets_by_name["Epic"]
+        tasks_sheet = sheets_by_name["Tasks"]
 
         task_list = []
 
@@ -25,10 +28,7 @@ def setup_database(spreadsheet_id, db_manager):
 
         # Transform the data from the 'Tasks' sheet into a list of 'Task' objects.
         if epic_data:
-            for task in tasks_sheet:
-                task_object = task.to_task()
-                if task_object.title != None:
-                    task_list.append(task_object.__dict__)
+            task_list = transform_tasks(tasks_sheet)
             epic_data.tasks = task_list
 
         # Convert the 'Epic' and 'Tasks' objects into JSON format and print them. Purely for debugging purposes.
@@ -37,7 +37,36 @@ def setup_database(spreadsheet_id, db_manager):
         print(epic_json)
         print(task_json)
         
-        db_manager.add_to_db(epic_data, task_list)
+        # Only the tasks that changed since the last import are written.
+        db_manager.sync_tasks(epic_data, task_list)
+
+    except HttpError as err:
+        print(err)
+
+def transform_tasks(tasks_sheet):
+    """Returns the tasks of a 'Tasks' sheet as task dicts, skipping rows without a title"""
+    task_list = []
+    for task in tasks_sheet:
+        task_object = task.to_task()
+        if task_object.title != None:
+            task_list.append(task_object.__dict__)
+    return task_list
+
+@traced()
+def stream_database(spreadsheet_id, db_manager, chunk_size=1000):
+    """
+    Like setup_database, but streams the 'Tasks' sheet chunk_size rows at a time (see sheets.iter_tasks)
+    straight into the database, which writes the changed ones in batches as they arrive. Meant for very
+    large sheets, the tasks are never all held in memory at once.
+    """
+    try:
+        epic_sheet = sheets.get_sheet("Epic", spreadsheet_id)
+        epic_data = sheets.transform_to_epics(epic_sheet)
+
+        if epic_data:
+            tasks = (task.__dict__ for task in sheets.iter_tasks(spreadsheet_id, "Tasks", chunk_size)
+                     if task.title != None)
+            db_manager.sync_tasks(epic_data, tasks)
 
     except HttpError as err:
         print(err)
\ No newline at end of file
@@ -0,0 +1,248 @@
+import atexit
+import threading
+import time
+import weakref
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.backends import DELETE_FIELD, MAX_BATCH_WRITES, StorageBackend, task_without_bookkeeping
+from tracing import traced
+
+# Seconds a write may wait in the buffer before it is flushed
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class _Flusher:
+    """
+    The one thread flushing every write-behind buffer once its oldest pending write is flush_interval
+    seconds old, so timed flushes of a backend always run on the same thread (and e.g. SQLite reuses the
+    connection of that thread). Buffers are held weakly, a buffer that is no longer used can be collected.
+    """
+    def __init__(self):
+        # Buffers that were not closed yet, flushed when the process exits as well
+        self.buffers = weakref.WeakSet()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def add(self, buffer: "WriteBehindBackend") -> None:
+        with self.condition:
+            self.buffers.add(buffer)
+
+    def remove(self, buffer: "WriteBehindBackend") -> None:
+        with self.condition:
+            self.buffers.discard(buffer)
+
+    def schedule(self) -> None:
+        """Wakes the thread up, as a buffer got a new deadline"""
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def flush_all(self) -> None:
+        for buffer in list(self.buffers):
+            buffer._flush_in_background()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                due = [buffer for buffer in self.buffers if buffer.deadline is not None and buffer.deadline <= now]
+                if not due:
+                    deadlines = [buffer.deadline for buffer in self.buffers if buffer.deadline is not None]
+                    self.condition.wait(min(deadlines) - now if deadlines else None)
+                    continue
+            for buffer in due:
+                buffer._flush_in_background()
+            # Do not keep the buffers alive while waiting
+            del due, buffer
+
+
+_flusher = _Flusher()
+atexit.register(_flusher.flush_all)
+
+
+class WriteBehindBackend(StorageBackend):
+    """
+    Write-behind buffer in front of another storage backend.
+
+    Writes are collected instead of committed right away, and writes to the same task (or to the epic) are
+    merged into a single write, e.g. a burst of updates to one task becomes one update. The buffer is flushed
+    as batched commits of the backend once max_pending tasks have pending writes, flush_interval seconds
+    after the oldest pending write (by a single thread shared by all buffers), on flush(), and on close()
+    or when the process exits.
+
+    A write the backend rejects (e.g. an update of a task that no longer exists) is not retried with every
+    later flush: it is logged and moved to dead_letters, and the other pending writes are committed.
+
+    Reads see the pending writes: lookups of single tasks apply them to what the backend returns, and
+    reads of the whole epic flush the buffer first.
+    """
+    def __init__(self, backend: StorageBackend, max_pending: int = MAX_BATCH_WRITES,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.backend = backend
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        # Pending write per task id (None for the epic), in the order they were first written
+        self.pending: Dict[Optional[str], Tuple[str, Optional[Dict[str, Any]]]] = {}
+        # Time (by time.monotonic) the pending writes are due to be flushed, None if there are none
+        self.deadline: Optional[float] = None
+        # The writes the backend rejected, as (operation, task id, data, error)
+        self.dead_letters: List[Tuple[str, Optional[str], Optional[Dict[str, Any]], Exception]] = []
+        self.flushes = 0
+        self._lock = threading.RLock()
+        _flusher.add(self)
+
+    def get_epic(self):
+        self.flush()
+        return self.backend.get_epic()
+
+    def tasks(self):
+        self.flush()
+        return self.backend.tasks()
+
+    def task_ids(self):
+        self.flush()
+        return self.backend.task_ids()
+
+    def task_summaries(self):
+        self.flush()
+        return self.backend.task_summaries()
+
+    def get_tasks_by_issue_ids(self, issue_ids):
+        issue_ids = [str(issue_id) for issue_id in issue_ids]
+        with self._lock:
+            tasks = self.backend.get_tasks_by_issue_ids(issue_ids)
+            # Tasks that have an issue are stored under their issueID, see task_document_id
+            for issue_id in issue_ids:
+                if issue_id in self.pending:
+                    task = _applied(self.pending[issue_id], tasks.get(issue_id))
+                    if task is None:
+                        tasks.pop(issue_id, None)
+                    else:
+                        tasks[issue_id] = task
+            return tasks
+
+    def find_task(self, title):
+        with self._lock:
+            renamed = any(data is not None and data.get("title") == title
+                          for task_id, (_, data) in self.pending.items() if task_id is not None)
+            found = self.backend.find_task(title)
+            if found is not None and found[0] in self.pending:
+                task = _applied(self.pending[found[0]], found[1])
+                found = (found[0], task) if task is not None and task.get("title") == title else None
+                renamed = renamed or found is None
+            if not renamed:
+                return found
+            # A pending write gives or takes the title, the backend has to answer with it applied
+            self.flush()
+            return self.backend.find_task(title)
+
+    def commit(self, operations):
+        """Buffers the operations, merging them with the pending writes, see WriteBehindBackend"""
+        for operation, task_id, data in operations:
+            with self._lock:
+                previous = self.pending.get(task_id)
+                merged = _merged(previous, operation, data)
+                if merged is None:
+                    # The writes cannot be merged (e.g. an update of a pending delete), keep their order
+                    self.flush()
+                    merged = (operation, data)
+                self.pending[task_id] = merged
+                if len(self.pending) >= self.max_pending:
+                    self.flush()
+                elif self.deadline is None and self.flush_interval is not None:
+                    self.deadline = time.monotonic() + self.flush_interval
+                    _flusher.schedule()
+
+    @traced()
+    def flush(self) -> int:
+        """
+        Commits the pending writes to the backend, and returns the number of writes committed.
+        If the commit fails, the writes are committed one by one instead, and those the backend rejects
+        are moved to dead_letters, see WriteBehindBackend.
+        """
+        with self._lock:
+            self.deadline = None
+            if not self.pending:
+                return 0
+            operations = [(operation, task_id, data) for task_id, (operation, data) in self.pending.items()]
+            self.pending = {}
+            try:
+                self.backend.commit(operations)
+                committed = len(operations)
+            except Exception:
+                # Updates, merges, sets and deletes can be applied again, whether or not they were committed
+                committed = 0
+                for operation in operations:
+                    try:
+                        self.backend.commit([operation])
+                        committed += 1
+                    except Exception as e:
+                        print(f"An error occurred: {e}")
+                        print(f"Dropped the {operation[0]} of {operation[1] or 'the epic'}, see dead_letters")
+                        self.dead_letters.append(operation + (e,))
+            except BaseException:
+                # Interrupted, keep the writes pending unless they were written again since
+                self.pending = {**{task_id: (operation, data) for operation, task_id, data in operations},
+                                **self.pending}
+                raise
+            self.flushes += 1
+            return committed
+
+    def watch(self, listener, callback):
+        return self.backend.watch(listener, callback)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            _flusher.remove(self)
+            self.backend.close()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception as e:  # Catch any exceptions
+            print(f"An error occurred: {e}")
+
+
+def _merged(previous, operation, data):
+    """Returns the single write with the effect of the previous write followed by the new one, or None if none does"""
+    if previous is None or operation in ("set", "delete"):
+        return operation, data
+    previous_operation, previous_data = previous
+    if previous_operation == "delete":
+        if operation == "merge":
+            return "set", {k: v for k, v in data.items() if v is not DELETE_FIELD}
+        return None
+    if previous_operation == "set":
+        merged = dict(previous_data)
+        for key, value in data.items():
+            if value is DELETE_FIELD:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        return "set", merged
+    # An update of a task that does not exist fails, a merge following it does not change that
+    return previous_operation, {**previous_data, **data}
+
+
+def _applied(pending, stored):
+    """Returns the task stored with the pending write applied to it, as the backend would after a flush"""
+    operation, data = pending
+    if operation == "delete":
+        return None
+    if operation == "set":
+        task = {}
+    elif stored is None and operation == "update":
+        return None
+    else:
+        task = dict(stored or {})
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            task.pop(key, None)
+        else:
+            task[key] = value
+    return task_without_bookkeeping(task)
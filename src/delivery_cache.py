@@ -0,0 +1,170 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# Deliveries remembered at most, the least recently seen are forgotten first
+DEFAULT_MAX_SIZE = 10000
+# Seconds a delivery is remembered, GitHub gives up redelivering well before that
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class DeliveryCache:
+    """
+    Bounded set of the webhook deliveries that were already processed, by their X-GitHub-Delivery id,
+    so deliveries GitHub sends again (e.g. after a timeout) are recognized and dropped.
+
+    A delivery is claimed with reserve before it is processed, so a redelivery arriving while it is still
+    being processed is dropped as well, and then either remembered with add or given up with release.
+
+    Ids are forgotten once they are older than ttl seconds, or when more than max_size ids are remembered,
+    least recently seen first. With a path, every processed id is appended to that JSON lines file as well,
+    and loaded again on start, so redeliveries are recognized after a restart too. The file is written by a
+    background thread, so add never waits for it; flush waits until everything added was written.
+
+    Args:
+        max_size: The number of delivery ids remembered at most.
+        ttl: The number of seconds a delivery id is remembered.
+        path: Optional file the delivery ids are persisted to, created if it does not exist.
+        clock: Returns the current time in seconds, time.time by default.
+    """
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL, path: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        # Delivery id -> time it was processed, least recently seen first
+        self.seen: "OrderedDict[str, float]" = OrderedDict()
+        # Delivery ids reserved, and not yet added or released
+        self.processing = set()
+        self.duplicates = 0
+        self._lines = 0
+        self._lock = threading.Lock()
+        # Entries to append to the file, and events to set once they are written, see _write
+        self._writes = queue.SimpleQueue()
+        self._writer = None
+        if path is not None:
+            self._load()
+
+    def reserve(self, delivery_id: Optional[str]) -> bool:
+        """
+        Claims a delivery for processing, checking and reserving it in one step: returns False (and counts
+        a duplicate) if it was already processed or is being processed, and True otherwise.
+        Call add once the delivery is processed, or release if processing it failed.
+        """
+        if not delivery_id:
+            return True
+        with self._lock:
+            if self._is_duplicate(delivery_id):
+                self.duplicates += 1
+                return False
+            self.processing.add(delivery_id)
+            return True
+
+    def release(self, delivery_id: Optional[str]) -> None:
+        """Gives up a reserved delivery that could not be processed, so it is processed when it is delivered again"""
+        with self._lock:
+            self.processing.discard(delivery_id)
+
+    def add(self, delivery_id: Optional[str]) -> None:
+        """Remembers a processed delivery"""
+        if not delivery_id:
+            return
+        now = self.clock()
+        with self._lock:
+            self.processing.discard(delivery_id)
+            self.seen[delivery_id] = now
+            self.seen.move_to_end(delivery_id)
+            self._evict(now)
+            if self.path is not None:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write, name="delivery-cache-writer", daemon=True)
+                    self._writer.start()
+                self._writes.put((delivery_id, now))
+
+    def flush(self) -> None:
+        """Waits until every delivery added so far is written to the file"""
+        with self._lock:
+            if self._writer is None:
+                return
+            written = threading.Event()
+            self._writes.put(written)
+        written.wait()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self.seen), "duplicates": self.duplicates}
+
+    def _is_duplicate(self, delivery_id: str) -> bool:
+        """Returns whether the delivery was processed or is being processed, forgetting it if it expired"""
+        if delivery_id in self.processing:
+            return True
+        processed = self.seen.get(delivery_id)
+        if processed is None:
+            return False
+        if self.clock() - processed > self.ttl:
+            del self.seen[delivery_id]
+            return False
+        self.seen.move_to_end(delivery_id)
+        return True
+
+    def _evict(self, now: float) -> None:
+        while len(self.seen) > self.max_size:
+            self.seen.popitem(last=False)
+        # Ids are mostly in the order they were processed, so the expired ones are at the front
+        while self.seen:
+            delivery_id, processed = next(iter(self.seen.items()))
+            if now - processed <= self.ttl:
+                break
+            del self.seen[delivery_id]
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line is cut off if we crashed while writing it
+                    continue
+                self.seen[entry["id"]] = entry["time"]
+                self.seen.move_to_end(entry["id"])
+                self._lines += 1
+        self._evict(self.clock())
+
+    def _write(self) -> None:
+        """Appends the added deliveries to the file, all that queued up at once, for as long as the process runs"""
+        while True:
+            entries, written = [], []
+            item = self._writes.get()
+            while True:
+                (written if isinstance(item, threading.Event) else entries).append(item)
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if entries:
+                    self._append(entries)
+            except Exception as e:  # Catch any exceptions
+                print(f"An error occurred: {e}")
+            for event in written:
+                event.set()
+
+    def _append(self, entries) -> None:
+        if self._lines + len(entries) > 2 * self.max_size:
+            # Rewrite the file with only the ids still remembered, so it does not grow forever
+            with self._lock:
+                entries = list(self.seen.items())
+            mode, self._lines = "w", 0
+        else:
+            mode = "a"
+        with open(self.path, mode, encoding="utf-8") as journal:
+            journal.write("".join(json.dumps({"id": delivery_id, "time": processed}) + "\n"
+                                  for delivery_id, processed in entries))
+        self._lines += len(entries)
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class DeliveryQueue:
+    """
+    Queue of task updates from webhook deliveries, applied to the database by a background worker.
+
+    The webhook only enqueues an update and answers right away. Updates for an issue that is still waiting
+    in the queue are merged into the pending update, so a burst of edits to the same issue turns into
+    a single database write.
+
+    Args:
+        apply: Coroutine function writing one update, called as apply(task_title, update).
+    """
+    def __init__(self, apply: Callable[[str, Dict[str, Any]], Awaitable[Any]]):
+        self.apply = apply
+        self.pending: Dict[Hashable, Tuple[str, Dict[str, Any]]] = {}
+        self.received = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.failed = 0
+        self._keys: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+
+    def enqueue(self, issue_key: Hashable, task_title: str, update: Dict[str, Any]) -> None:
+        """
+        Queues an update of the task stored under task_title. Values that are None are ignored.
+        If an update for the same issue is already pending, the new values are merged into it; the task title of
+        the pending update is kept, since the task is stored under that title until the update is applied.
+        """
+        self.received += 1
+        update = {k: v for k, v in update.items() if v is not None}
+        if issue_key in self.pending:
+            self.pending[issue_key][1].update(update)
+            self.coalesced += 1
+            return
+        self.pending[issue_key] = (task_title, update)
+        self._keys.put_nowait(issue_key)
+
+    async def run(self) -> None:
+        """Applies queued updates one at a time, forever"""
+        while True:
+            issue_key = await self._keys.get()
+            task_title, update = self.pending.pop(issue_key)
+            try:
+                await self.apply(task_title, update)
+                self.applied += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"An error occurred while applying the update of {task_title}: {e}")
+            finally:
+                self._keys.task_done()
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Waits for the queued updates to be applied, then stops the worker"""
+        if self._worker is None:
+            return
+        await self._keys.join()
+        self._worker.cancel()
+        self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the queue depth (updates waiting to be applied) and the coalescing ratio,
+        I.e the share of received updates that were merged into an already pending update.
+        """
+        return {
+            "depth": len(self.pending),
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "applied": self.applied,
+            "failed": self.failed,
+            "coalescing_ratio": self.coalesced / self.received if self.received else 0.0,
+        }
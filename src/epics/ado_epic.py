@@ -1,8 +1,69 @@
 
+import re
 import time
+import json
+import html
 import httpx
 import urllib 
-from epics.base_epic import BaseEpic
+from concurrent.futures import ThreadPoolExecutor
+from epics.base_epic import BaseEpic, body_hash
+from epics.rate_limit import RateLimiter
+from tracing import span
+
+# Maximum number of operations Azure DevOps accepts in a single $batch request, and of ids in a workitemsbatch request
+MAX_BATCH_SIZE = 200
+# The fields requested for each work item, see work_item_to_task
+WORK_ITEM_FIELDS = ["System.Id", "System.Title", "System.Description", "System.State"]
+# State a work item of a removed task is moved to, and the states that count as closed
+CLOSED_STATE = "Closed"
+CLOSED_STATES = {"Closed", "Done", "Removed"}
+
+
+def parse_description(description: str) -> dict:
+    """Parse the description of a work item, as written by ado_epic.format_body, into Task attributes."""
+    task_data = {
+        'description': None,
+        'priority': None,
+        'story_point': None,
+        'comments': None
+    }
+
+    sections = {
+        'Description': 'description',
+        'Priority': 'priority',
+        'Story Point': 'story_point',
+        'Comments': 'comments'
+    }
+
+    for label, value in re.findall(r'<b>(.*?):</b><br>(.*?)(?=<br><br>|<br>$|$)', description, re.DOTALL):
+        key = sections.get(label)
+        if key is None:
+            continue
+        value = html.unescape(value).strip()
+        if key == 'story_point':
+            task_data[key] = int(value) if value.isdigit() else None
+        else:
+            task_data[key] = value
+
+    return task_data
+
+
+def work_item_to_task(work_item: dict) -> dict:
+    """
+    Converts a work item into a task dict, the inverse of ado_epic.format_body. Like github_epic's
+    issue_to_task, the task also carries the state of the work item and the body_hash of its title and description.
+    """
+    fields = work_item.get("fields", {})
+    description = fields.get("System.Description") or ""
+    task = {"title": fields.get("System.Title"), "issueID": work_item.get("id")}
+    task.update(parse_description(description))
+    task["state"] = "closed" if fields.get("System.State") in CLOSED_STATES else "open"
+    task["body_hash"] = body_hash(fields.get("System.Title") or "", description)
+    return task
+
+
+def _wiql_string(value: str) -> str:
+    return str(value).replace("'", "''")
 
 class ado_epic(BaseEpic):
     def __init__(self, organization, project, pat, *args, **kwargs):
@@ -10,6 +71,11 @@ class ado_epic(BaseEpic):
         self.organization = organization
         self.project = project
         self.pat = pat
+        self.transport = None  # Optional httpx transport for the pooled client, mostly used by tests
+        # Scope of the epic's work items in get_issues
+        self.area_path = None
+        self.tag = None
+        self.parent_id = None
 
     def start(self):
         print("Start the ADO Epic")
@@ -17,29 +83,17 @@ class ado_epic(BaseEpic):
     def create_issues(self):
         url = f"https://dev.azure.com/{self.organization}/{self.project}/_apis/wit/workitems/$task?api-version=7.1"
         for task in self.tasks:
-            data = [
-                    {
-                        "op": "add",
-                        "path": "/fields/System.Title",
-                        "from": None,
-                        "value": task.get("title", "")
-                    },
-                    {
-                        "op": "add",
-                        "path": "/fields/System.Description",
-                        "from": None,
-                        "value": self.format_body(task)
-                    }
-                ]
+            data = self._work_item_fields(task) + self._scope_fields()
 
             try:
-                with httpx.Client() as client:
+                with httpx.Client() as client, span("ado.request", method="POST", url=url) as request_span:
                     response = client.post(
                         url,
                         json=data,
                         headers={'Content-Type': 'application/json-patch+json'},
                         auth=('', self.pat)
                     )
+                    request_span.set(status=response.status_code)
 
                 if response.status_code == 200 or response.status_code == 201:
                     print(f"Issue created successfully!\n Response: {response}\n")
@@ -55,61 +109,238 @@ class ado_epic(BaseEpic):
 
             time.sleep(1) # Add a delay to avoid hitting the rate limit
 
-    ## Forced to make two requests to get the work item details becuase of ADO API limitations i think
-    def get_issues(self):
-         #Query Work Item IDs using WIQL
+    def create_issues_batch(self, chunk_size=MAX_BATCH_SIZE, tasks=None, on_created=None):
+        """
+        Create work items for all tasks (or only the given tasks) through the work item $batch endpoint,
+        chunk_size work items per request.
+
+        Each task gets the id of its created work item as issueID, like create_issues, and is passed to
+        on_created if given. A failed work item does not fail the rest of its chunk, instead the failures
+        are collected and returned.
+
+        See docs: https://learn.microsoft.com/en-us/rest/api/azure/devops/wit/work-items
+        Returns:
+            dict: {"created": [ids], "failed": [{"title", "status", "error"}]}
+        """
+        summary = {"created": [], "failed": []}
+
+        def operation(task):
+            return self._batch_operation("$task", self._work_item_fields(task) + self._scope_fields())
+
+        def created(task, body):
+            task["issueID"] = body.get("id")
+            summary["created"].append(task["issueID"])
+            if on_created is not None:
+                on_created(task)
+
+        summary["failed"] = self._run_batches(self.tasks if tasks is None else tasks, chunk_size, operation, created)
+        return summary
+
+    def _run_batches(self, tasks, chunk_size, operation, on_success):
+        """
+        Sends operation(task) for every task through the $batch endpoint, chunk_size operations per request,
+        and calls on_success(task, body) for every operation that succeeded.
+        Returns:
+            list: The failures, as [{"title", "status", "error"}]
+        """
+        if not 0 < chunk_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"chunk_size must be between 1 and {MAX_BATCH_SIZE}")
+
+        batch_url = f"https://dev.azure.com/{self.organization}/_apis/wit/$batch?api-version=7.1"
+        failed = []
+        limiter = RateLimiter()
+
+        with self._client() as client:
+            for start in range(0, len(tasks), chunk_size):
+                chunk = tasks[start:start + chunk_size]
+                batch = [operation(task) for task in chunk]
+
+                limiter.wait_sync()
+                try:
+                    with span("ado.request", method="POST", url=batch_url, operations=len(batch)) as request_span:
+                        response = client.post(batch_url, json=batch)
+                        request_span.set(status=response.status_code)
+                except httpx.HTTPError as exc:
+                    print(f"An error occurred: {exc}")
+                    failed.extend(self._batch_failure(task, None, str(exc)) for task in chunk)
+                    continue
+
+                limiter.update(response)
+                if response.status_code != 200:
+                    print(f"Failed to send work item batch: \n{response}\n")
+                    failed.extend(self._batch_failure(task, response.status_code, response.text) for task in chunk)
+                    continue
+
+                results = response.json().get("value", [])
+                for task, result in zip(chunk, results):
+                    # The body of each batch result is a JSON encoded string
+                    body = json.loads(result.get("body") or "{}")
+                    if result.get("code") in (200, 201):
+                        on_success(task, body)
+                    else:
+                        failed.append(
+                            self._batch_failure(task, result.get("code"), body.get("message", result.get("body")))
+                        )
+                failed.extend(
+                    self._batch_failure(task, None, "Missing from batch response") for task in chunk[len(results):]
+                )
+
+                print(f"Sent {len(results)} work item operations in batch {start // chunk_size + 1}")
+
+        return failed
+
+    def _batch_operation(self, work_item, fields):
+        return {
+            "method": "PATCH",
+            "uri": f"/{self.project}/_apis/wit/workitems/{work_item}?api-version=7.1",
+            "headers": {"Content-Type": "application/json-patch+json"},
+            "body": fields
+        }
+
+    def create_remote_issues(self, tasks, on_created=None):
+        self.create_issues_batch(tasks=tasks, on_created=on_created)
+
+    def update_remote_issues(self, tasks):
+        updated = []
+        self._run_batches(tasks, MAX_BATCH_SIZE,
+                          lambda task: self._batch_operation(task["issueID"], self._work_item_fields(task, "replace")),
+                          lambda task, body: updated.append(task["issueID"]))
+        return updated
+
+    def close_remote_issues(self, issue_ids):
+        closed = []
+        tasks = [{"title": f"Work item {issue_id}", "issueID": issue_id} for issue_id in issue_ids]
+        state = [{"op": "replace", "path": "/fields/System.State", "from": None, "value": CLOSED_STATE}]
+        self._run_batches(tasks, MAX_BATCH_SIZE,
+                          lambda task: self._batch_operation(task["issueID"], state),
+                          lambda task, body: closed.append(task["issueID"]))
+        return closed
+
+    def _batch_failure(self, task, status, error):
+        return {"title": task.get("title", ""), "status": status, "error": error}
+
+    def _work_item_fields(self, task, op="add"):
+        return [
+            {
+                "op": op,
+                "path": "/fields/System.Title",
+                "from": None,
+                "value": task.get("title", "")
+            },
+            {
+                "op": op,
+                "path": "/fields/System.Description",
+                "from": None,
+                "value": self.format_body(task)
+            }
+        ]
+
+    def _scope_fields(self):
+        """
+        The area path, tag and parent link of a new work item, so get_issues finds it again when the epic is scoped
+        """
+        fields = []
+        if self.area_path:
+            fields.append({"op": "add", "path": "/fields/System.AreaPath", "from": None, "value": self.area_path})
+        if self.tag:
+            fields.append({"op": "add", "path": "/fields/System.Tags", "from": None, "value": self.tag})
+        if self.parent_id:
+            fields.append({
+                "op": "add",
+                "path": "/relations/-",
+                "from": None,
+                "value": {
+                    "rel": "System.LinkTypes.Hierarchy-Reverse",
+                    "url": f"https://dev.azure.com/{self.organization}/_apis/wit/workItems/{int(self.parent_id)}"
+                }
+            })
+        return fields
+
+    def _client(self):
+        return httpx.Client(
+            auth=('', self.pat),
+            headers={'Content-Type': 'application/json'},
+            timeout=30.0,
+            transport=self.transport
+        )
+
+    def get_issues(self, area_path=None, tag=None, parent_id=None, max_workers=4):
+        """
+        Returns the Task work items of the epic as task dicts (see work_item_to_task).
+
+        The work items are scoped to the epic by area path, tag and/or parent work item, falling back to
+        self.area_path, self.tag and self.parent_id. Without any scope, every Task in the project is returned.
+        The ids matched by the WIQL query are then hydrated in chunks of 200 (the limit of workitemsbatch),
+        fetched concurrently and returned in the order of the query.
+        Returns None if the query or any of the requests failed, rather than only some of the work items.
+        """
+        work_item_ids = self.query_work_item_ids(area_path or self.area_path, tag or self.tag,
+                                                 parent_id or self.parent_id)
+        if work_item_ids is None:
+            return None
+        print(f"Successfully retrieved {len(work_item_ids)} issue ids")
+        return self.fetch_work_item_details(work_item_ids, max_workers)
+
+    def query_work_item_ids(self, area_path=None, tag=None, parent_id=None):
+        """Returns the ids of the Task work items in the given scope, or None if the query failed"""
         wiql_url = f"https://dev.azure.com/{self.organization}/{self.project}/_apis/wit/wiql?api-version=7.1"
+        conditions = ["[System.TeamProject] = @project", "[System.WorkItemType] = 'Task'"]
+        if area_path:
+            conditions.append(f"[System.AreaPath] UNDER '{_wiql_string(area_path)}'")
+        if tag:
+            conditions.append(f"[System.Tags] CONTAINS '{_wiql_string(tag)}'")
+        if parent_id:
+            conditions.append(f"[System.Parent] = {int(parent_id)}")
         wiql_query = {
-            "query": "Select [System.Id], [System.Title], [System.Description] From WorkItems Where [System.WorkItemType] = 'Task'"
+            "query": f"Select [System.Id] From WorkItems Where {' AND '.join(conditions)} Order By [System.Id]"
         }
 
         try:
-            with httpx.Client() as client:
-                response = client.post(
-                    wiql_url,
-                    json=wiql_query,
-                    headers={'Content-Type': 'application/json'},
-                    auth=('', self.pat)
-                )
+            with self._client() as client, span("ado.request", method="POST", url=wiql_url) as request_span:
+                response = client.post(wiql_url, json=wiql_query)
+                request_span.set(status=response.status_code)
 
             if response.status_code == 200:
-                work_item_ids = [item['id'] for item in response.json()['workItems']]
-                print(f"Successfully retrieved issues!\n Response: {work_item_ids}\n")
-                self.fetch_work_item_details(work_item_ids)
-            else:
-                print(f"Failed to retrieve issues: \n{response}\n")
+                return [item['id'] for item in response.json()['workItems']]
+            print(f"Failed to retrieve issues: \n{response}\n")
         except httpx.HTTPError as exc:
             print(f"An error occurred: {exc}")
+        return None
 
-    #TODO some implementation with tasks list
-    def fetch_work_item_details(self, work_item_ids):
+    def fetch_work_item_details(self, work_item_ids, max_workers=4):
+        """
+        Fetches the given work items as task dicts, MAX_BATCH_SIZE ids per workitemsbatch request with up to
+        max_workers requests in flight. Only the fields needed for a task are requested.
+        Returns None if any of the requests failed.
+        """
         work_item_url = f"https://dev.azure.com/{self.organization}/{self.project}/_apis/wit/workitemsbatch?api-version=7.1"
-        data = {
-            "ids": work_item_ids,
-            "fields": ["System.Id", "System.Title", "System.Description"]
-        }
-        try:
-            with httpx.Client() as client:
-                response = client.post(
-                    work_item_url,
-                    headers={'Content-Type': 'application/json'},
-                    json = data,
-                    auth=('', self.pat)
-                )
-            if response.status_code == 200:
-                work_items = response.json()['value']
-                print(f"Successfully retrieved work item details!")
-                for work_item in work_items:
-                    work_item_id = work_item['id']
-                    title = work_item['fields'].get('System.Title', 'No Title')
-                    description = work_item['fields'].get('System.Description', 'No Description')
-                    print(f"Work Item ID: {work_item_id}")
-                    print(f"Title: {title}")
-                    print(f"Description: {description}\n")
-            else:
+        chunks = [work_item_ids[start:start + MAX_BATCH_SIZE] for start in range(0, len(work_item_ids), MAX_BATCH_SIZE)]
+        limiter = RateLimiter()
+
+        def fetch(chunk):
+            limiter.wait_sync()
+            try:
+                with span("ado.request", method="POST", url=work_item_url, ids=len(chunk)) as request_span:
+                    response = client.post(work_item_url, json={"ids": chunk, "fields": WORK_ITEM_FIELDS})
+                    request_span.set(status=response.status_code)
+            except httpx.HTTPError as exc:
+                print(f"An error occurred: {exc}")
+                return None
+            limiter.update(response)
+            if response.status_code != 200:
                 print(f"Failed to retrieve work item details: \n{response}\n")
-        except httpx.HTTPError as exc:
-            print(f"An error occurred: {exc}")
+                return None
+            return [work_item_to_task(work_item) for work_item in response.json()['value']]
+
+        with self._client() as client:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                chunk_tasks = list(pool.map(fetch, chunks))
+
+        if any(tasks is None for tasks in chunk_tasks):
+            return None
+        tasks = [task for tasks in chunk_tasks for task in tasks]
+        print(f"Successfully retrieved {len(tasks)} work item details!")
+        return tasks
 
     def delete_issue(self):
         pass
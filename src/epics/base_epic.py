@@ -1,5 +1,14 @@
+import hashlib
 from abc import ABC, abstractmethod
 
+from epics.checkpoint import task_keys
+
+
+def body_hash(title, body):
+    """Hash of the title and formatted body of an issue, used to tell whether an issue is up to date with its task"""
+    return hashlib.sha1(f"{title}\n{body}".encode("utf-8")).hexdigest()[:16]
+
+
 #TODO Some kind of way to enforce the structure of the tasks so that is has the required fields
 class BaseEpic(ABC):
     def __init__(self, title, problem, feature, value):
@@ -8,6 +17,7 @@ class BaseEpic(ABC):
         self.feature = feature
         self.value = value
         self.tasks = []
+        self.removed_issue_ids = set()  # Issues of removed tasks, closed by the next reconcile
     @abstractmethod
     def start(self):
         pass
@@ -25,6 +35,8 @@ class BaseEpic(ABC):
         self.tasks.append(task)
 
     def remove_task(self, task_title):
+        self.removed_issue_ids.update(task["issueID"] for task in self.tasks
+                                      if task["title"] == task_title and task.get("issueID"))
         self.tasks = [task for task in self.tasks if task["title"] != task_title]
 
     def get_tasks(self):
@@ -34,8 +46,157 @@ class BaseEpic(ABC):
         self.tasks = [new_data if task["title"] == task_title else task for task in self.tasks]
     
     def remove_all_tasks(self):
+        self.removed_issue_ids.update(task["issueID"] for task in self.tasks if task.get("issueID"))
         self.tasks = []
 
+    def merge_issues(self, issues):
+        """
+        Merges issues from the tracker (as returned by get_issues) into the tasks of the epic.
+        Tasks without an issueID are linked to the issue with the same title, and issues that match no task
+        are added as new tasks. The fields of existing tasks are kept.
+        Returns:
+            dict: The number of tasks linked to an issue and added.
+        """
+        issue_ids = {task.get("issueID") for task in self.tasks if task.get("issueID")}
+        unlinked = {}
+        for task in self.tasks:
+            if not task.get("issueID"):
+                unlinked.setdefault(task.get("title"), task)
+
+        summary = {"linked": 0, "added": 0}
+        for issue in issues:
+            if issue.get("issueID") in issue_ids:
+                continue
+            task = unlinked.pop(issue.get("title"), None)
+            if task is not None:
+                task["issueID"] = issue["issueID"]
+                summary["linked"] += 1
+            else:
+                self.add_task({key: value for key, value in issue.items() if key not in ("state", "body_hash")})
+                summary["added"] += 1
+            issue_ids.add(issue.get("issueID"))
+        return summary
+
+    def task_hash(self, task):
+        return body_hash(task.get("title", ""), self.format_body(task))
+
+    def reconcile(self):
+        """
+        Brings the tracker in line with the tasks of the epic: creates issues for tasks without one, updates
+        the issues whose title or body no longer match their task, and closes the issues of removed tasks.
+
+        Every task keeps the hash of its issue as it was last written or seen (see body_hash) as body_hash,
+        which is stored along with the tasks by DatabaseManager.update_db. Tasks whose hash still matches are
+        taken to be up to date, and only if some task changed (or was removed) are the issues fetched with
+        get_remote_issues and compared through their hash, so only the issues that actually differ are written,
+        each kind in bulk. Reconciling an unchanged epic makes no calls at all.
+
+        If the issues could not all be listed, nothing is created, updated or closed, since a missing issue
+        would otherwise be created again.
+        Returns:
+            dict: The number of issues created, updated, closed and unchanged, or None if the listing failed.
+        """
+        changed = [task for task in self.tasks
+                   if not task.get("issueID") or task.get("body_hash") != self.task_hash(task)]
+        if not changed and not self.removed_issue_ids:
+            summary = {"created": 0, "updated": 0, "closed": 0, "unchanged": len(self.tasks)}
+            print(f"Reconciled epic {self.title}: {summary}")
+            return summary
+
+        remote_issues = self.get_remote_issues()
+        if remote_issues is None:
+            print(f"Could not list the issues of epic {self.title}, not reconciling it")
+            return None
+        remote = {issue["issueID"]: issue for issue in remote_issues}
+        to_create, to_update = [], []
+        for task in changed:
+            issue = remote.get(task.get("issueID")) if task.get("issueID") else None
+            task_hash = self.task_hash(task)
+            if issue is None:
+                to_create.append(task)
+            elif issue.get("body_hash") != task_hash:
+                to_update.append(task)
+            else:
+                task["body_hash"] = task_hash
+        # Issues of removed tasks that are gone or already closed need no call
+        self.removed_issue_ids = {issue_id for issue_id in self.removed_issue_ids
+                                  if issue_id in remote and remote[issue_id].get("state", "open") != "closed"}
+        to_close = list(self.removed_issue_ids)
+
+        summary = {"created": 0, "updated": 0, "closed": 0,
+                   "unchanged": len(self.tasks) - len(to_create) - len(to_update)}
+        if to_create:
+            self.create_remote_issues(to_create)
+            created = [task for task in to_create if task.get("issueID")]
+            for task in created:
+                task["body_hash"] = self.task_hash(task)
+            summary["created"] = len(created)
+        if to_update:
+            updated = set(self.update_remote_issues(to_update))
+            for task in to_update:
+                if task["issueID"] in updated:
+                    task["body_hash"] = self.task_hash(task)
+            summary["updated"] = len(updated)
+        if to_close:
+            closed = self.close_remote_issues(to_close)
+            self.removed_issue_ids.difference_update(closed)
+            summary["closed"] = len(closed)
+
+        print(f"Reconciled epic {self.title}: {summary}")
+        return summary
+
+    def create_issues_checkpointed(self, journal):
+        """
+        Creates issues for the tasks that do not have one yet, journaling every created issue in the given
+        CreationJournal (see epics.checkpoint). If a previous run was interrupted, the tasks it already created
+        issues for get their issueID back from the journal instead of being created again.
+        Clear the journal once the tasks, with their issueIDs, are stored in the database.
+        Returns:
+            dict: The number of issues resumed from the journal, created and failed.
+        """
+        created = journal.load()
+        keys = {id(task): key for task, key in zip(self.tasks, task_keys(self.tasks))}
+        resumed = 0
+        for task in self.tasks:
+            if not task.get("issueID") and keys[id(task)] in created:
+                task["issueID"] = created[keys[id(task)]]
+                resumed += 1
+
+        pending = [task for task in self.tasks if not task.get("issueID")]
+        print(f"Resumed {resumed} issues from the journal, creating {len(pending)} issues")
+        try:
+            if pending:
+                self.create_remote_issues(pending,
+                                          on_created=lambda task: journal.record(keys[id(task)], task["issueID"]))
+        finally:
+            # Also checkpoint the issues created before a failure, so a rerun does not create them again
+            journal.checkpoint()
+
+        failed = sum(1 for task in pending if not task.get("issueID"))
+        return {"resumed": resumed, "created": len(pending) - failed, "failed": failed}
+
+    def get_remote_issues(self):
+        """
+        Returns the issues in the tracker, open and closed, as task dicts that include the body_hash of the issue
+        and its state ("open" or "closed"), or None if they could not all be listed
+        """
+        return self.get_issues()
+
+    @abstractmethod
+    def create_remote_issues(self, tasks, on_created=None):
+        """
+        Creates issues for the given tasks, setting issueID on the tasks whose issue was created.
+        on_created is called with every task right after its issue was created, and may block on I/O.
+        """
+
+    @abstractmethod
+    def update_remote_issues(self, tasks):
+        """Updates the title and body of the issues of the given tasks, returns the ids of the updated issues"""
+
+    @abstractmethod
+    def close_remote_issues(self, issue_ids):
+        """Closes the given issues, returns the ids of the closed issues"""
+
     @abstractmethod
     def create_issues(self):
         pass
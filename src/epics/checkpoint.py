@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+
+from typing import Any, Dict, List, Optional
+
+from database.manager import task_document_id
+
+
+def task_keys(tasks: List[Dict[str, Any]]) -> List[str]:
+    """
+    Returns the key of every task in the journal: the id of its task document (see task_document_id), so tasks
+    sharing a title, or having none, get keys of their own as well
+    """
+    occurrences = {}
+    keys = []
+    for task in tasks:
+        title = str(task.get("title"))
+        keys.append(task_document_id({"title": task.get("title")}, occurrences.get(title, 0)))
+        occurrences[title] = occurrences.get(title, 0) + 1
+    return keys
+
+
+class CreationJournal:
+    """
+    Journal of the issues created for the tasks of an epic, so an interrupted bulk creation can be resumed
+    without creating the same issues again (see BaseEpic.create_issues_checkpointed).
+
+    Every created issue is appended to a local JSON lines file right away, and every `every` issues the
+    created ids are checkpointed to the remote store as well, e.g. a DatabaseManager, which survives
+    losing the machine. Tasks are identified by their key, see task_keys.
+
+    Args:
+        path: The local journal file, created if it does not exist.
+        remote: Optional object with save_checkpoint(created) and load_checkpoint() methods.
+        every: The number of created issues between remote checkpoints.
+    """
+    def __init__(self, path: str, remote: Optional[Any] = None, every: int = 50):
+        self.path = path
+        self.remote = remote
+        self.every = every
+        self.created: Dict[str, Any] = {}
+        self.unsaved = 0
+        self._lock = threading.Lock()
+        # Held while saving remotely, so a checkpoint never overwrites a later one
+        self._save_lock = threading.Lock()
+
+    def load(self) -> Dict[str, Any]:
+        """Returns the issue ids created so far by task key, from the remote checkpoint and the local journal"""
+        created = {}
+        if self.remote is not None:
+            created.update(self.remote.load_checkpoint() or {})
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line is cut off if we crashed while writing it
+                        continue
+                    created[entry["task"]] = entry["issueID"]
+        with self._lock:
+            self.created = created
+        return dict(created)
+
+    def record(self, key: str, issue_id: Any) -> None:
+        """
+        Journals a created issue, and checkpoints remotely once `every` issues were created since the last time.
+        This blocks on file and network I/O, async callers should run it in a thread.
+        """
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as journal:
+                journal.write(json.dumps({"task": key, "issueID": issue_id}) + "\n")
+            self.created[key] = issue_id
+            self.unsaved += 1
+            due = self.unsaved >= self.every
+        if due:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Saves the created issue ids to the remote store"""
+        with self._save_lock:
+            with self._lock:
+                if self.remote is None or not self.unsaved:
+                    return
+                created, self.unsaved = dict(self.created), 0
+            self.remote.save_checkpoint(created)
+
+    def clear(self) -> None:
+        """Forgets the journal, once all issues have been created and stored with their tasks"""
+        with self._lock:
+            self.created, self.unsaved = {}, 0
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        if self.remote is not None:
+            self.remote.save_checkpoint(None)
@@ -33,8 +33,18 @@ class database_epic(BaseEpic):
         pass
 
     def get_issues(self):
+        # The database is not an issue tracker, it has no issues of its own
+        return []
+
+    def create_remote_issues(self, tasks, on_created=None):
         pass
 
+    def update_remote_issues(self, tasks):
+        return []
+
+    def close_remote_issues(self, issue_ids):
+        return []
+
     def delete_issue(self, title):
         pass
 
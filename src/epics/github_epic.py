@@ -1,7 +1,55 @@
 
+import re
 import time
+import asyncio
 import httpx 
-from epics.base_epic import BaseEpic
+from concurrent.futures import ThreadPoolExecutor
+from epics.base_epic import BaseEpic, body_hash
+from epics.rate_limit import RateLimiter
+from tracing import span
+
+def parse_body(body: str) -> dict:
+    """Parse the body text and extract values for Task attributes."""
+    task_data = {
+        'description': None,
+        'priority': None,
+        'story_point': None,
+        'comments': None
+    }
+
+    body = body.replace('**', '')  # Escape markdown characters
+    
+    # Regular expressions to extract values
+    patterns = {
+        'description': r'Description:\s*(.*)',
+        'priority': r'Priority:\s*(.*)',
+        'story_point': r'Story Point:\s*(\d+)',
+        'comments': r'Comments:\s*(.*)'
+    }
+    
+    for key, pattern in patterns.items():
+        match = re.search(pattern, body)
+        if match:
+            value = match.group(1).strip()
+            if key == 'story_point':
+                task_data[key] = int(value)  # Convert story_point to int
+            else:
+                task_data[key] = value
+    
+    return task_data
+
+
+def issue_to_task(issue: dict) -> dict:
+    """
+    Converts a GitHub issue into a task dict, the inverse of github_epic.format_body.
+    The task also carries the state of the issue and the body_hash of its title and body, see BaseEpic.reconcile.
+    """
+    task = {"title": issue.get("title"), "issueID": issue.get("number")}
+    task.update(parse_body(issue.get("body") or ""))
+    task["state"] = issue.get("state", "open")
+    task["body_hash"] = body_hash(issue.get("title") or "", issue.get("body") or "")
+    return task
+
 
 class github_epic(BaseEpic):
     def __init__(self, owner, repo, token, *args, **kwargs):
@@ -15,6 +63,8 @@ class github_epic(BaseEpic):
             "Accept": "application/vnd.github+json",
             "Authorization": f"Bearer {token}",
             "X-GitHub-Api-Version": "2022-11-28"}
+        self.transport = None  # Optional httpx transport for the pooled clients, mostly used by tests
+        self.etags = {}  # Maps issue list requests to their last (ETag, issues, last page)
 
     
     def create_issues(self):
@@ -26,7 +76,9 @@ class github_epic(BaseEpic):
             }
   
             try:
-                response = httpx.post(self.issues_url, headers=self.headers, json=data)
+                with span("github.request", method="POST", url=self.issues_url) as request_span:
+                    response = httpx.post(self.issues_url, headers=self.headers, json=data)
+                    request_span.set(status=response.status_code)
                 # Use if-else to handle HTTP response status codes
                 if response.status_code == 201:
                     print(f"Issue created successfully!\n Response: {response.text}\n")
@@ -39,7 +91,81 @@ class github_epic(BaseEpic):
                 print(f"An error occurred: {exc}")
             
             time.sleep(1)  # Add a delay to avoid hitting the rate limit
-            
+
+    def create_issues_concurrently(self, max_concurrency=5):
+        """Sync wrapper around create_issues_async, so it can be called from non-async code like main.py"""
+        asyncio.run(self.create_issues_async(max_concurrency))
+
+    async def create_issues_async(self, max_concurrency=5, max_retries=3, tasks=None, on_created=None):
+        """
+        Create GitHub issues for each task (or only the given tasks) concurrently on one shared client.
+        on_created is called with every task right after its issue was created.
+
+        At most max_concurrency requests are in flight at a time, and the requests are paced from the
+        rate limit headers GitHub sends back instead of a fixed delay. Requests rejected by a rate limit
+        are retried up to max_retries times.
+        """
+        limiter = RateLimiter()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async with self._async_client(max_concurrency) as client:
+            await asyncio.gather(*(
+                self._create_issue_async(client, task, semaphore, limiter, max_retries, on_created)
+                for task in (self.tasks if tasks is None else tasks)
+            ))
+
+    async def _create_issue_async(self, client, task, semaphore, limiter, max_retries, on_created=None):
+        data = {
+            "title": task.get("title", ""),
+            "body": self.format_body(task),
+        }
+
+        response = await self._send_async(client, semaphore, limiter, "POST", self.issues_url, data, max_retries)
+        if response is None:
+            return
+
+        if response.status_code == 201:
+            print(f"Issue created successfully!\n Response: {response.text}\n")
+            issue_id = response.json().get("number")
+            task["issueID"] = issue_id
+            if on_created is not None:
+                # The callback may block on I/O (e.g. CreationJournal.record), keep it off the event loop
+                await asyncio.to_thread(on_created, task)
+        else:
+            print(f"Failed to create issue: \n{response.status_code}, {response.text}\n")
+
+    async def _send_async(self, client, semaphore, limiter, method, url, data, max_retries):
+        """
+        Sends a request once a concurrency slot is free and the rate limit allows it.
+        Requests rejected by a rate limit are retried up to max_retries times.
+        Returns the last response, or None if the request failed with an exception.
+        """
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                await limiter.wait()
+                try:
+                    with span("github.request", method=method, url=url, attempt=attempt) as request_span:
+                        response = await client.request(method, url, json=data)
+                        request_span.set(status=response.status_code)
+                except httpx.HTTPError as exc:
+                    print(f"An error occurred: {exc}")
+                    return None
+
+                if limiter.update(response) and attempt < max_retries:
+                    print(f"Rate limited on {method} {url}, retrying in {limiter.delay():.0f}s")
+                    continue
+                return response
+
+    def _client(self):
+        return httpx.Client(headers=self.headers, timeout=30.0, transport=self.transport)
+
+    def _async_client(self, max_connections=5):
+        return httpx.AsyncClient(
+            headers=self.headers,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=max_connections),
+            transport=self.transport
+        )
+
     def format_body(self, task):
         # Format the body of the GitHub issue with task details
         body = (
@@ -53,22 +179,112 @@ class github_epic(BaseEpic):
     def start(self):
         print("Start the GitHub Epic")
     
-    #TODO some implementation with tasks list
-    def get_issues(self):
+    def get_issues(self, state="open", labels=None):
+        """
+        Returns all issues in the repository as task dicts (see iter_issues),
+        or None if some page of issues could not be fetched
+        """
+        issues = []
+        for page in self._issue_pages(state, labels):
+            if page is None:
+                return None
+            issues.extend(page)
+        return issues
+
+    def iter_issues(self, state="open", labels=None, max_workers=4):
+        """
+        Generator yielding every issue in the repository as a task dict (see issue_to_task), page by page.
+        The issues on pages that could not be fetched are left out.
+        """
+        for issues in self._issue_pages(state, labels, max_workers):
+            yield from issues or []
+
+    def _issue_pages(self, state="open", labels=None, max_workers=4):
+        """
+        Generator yielding the issues on every page in order, or None for a page that could not be fetched.
+
+        The first page tells us how many pages there are through its Link header, the remaining pages
+        are then fetched concurrently on one pooled client, but still yielded in order.
+        Every page is requested with the ETag of the last response, so re-polling an unchanged repository
+        gets 304 responses, which do not count against the rate limit.
+        Pull requests are skipped, even though GitHub lists them as issues.
+        """
+        params = {"state": state, "per_page": 100}
+        if labels:
+            params["labels"] = ",".join(labels)
+
+        limiter = RateLimiter()
+        with self._client() as client:
+            issues, last_page = self._get_issue_page(client, limiter, params, 1)
+            yield issues
+
+            if last_page > 1:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    yield from pool.map(lambda page: self._get_issue_page(client, limiter, params, page)[0],
+                                        range(2, last_page + 1))
+
+    def _get_issue_page(self, client, limiter, params, page):
+        """Returns the issues on the given page (None if it could not be fetched) and the number of the last page"""
+        key = (tuple(sorted(params.items())), page)
+        cached = self.etags.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+
+        limiter.wait_sync()
         try:
-            response = httpx.get(self.issues_url, headers=self.headers)
-            if response.status_code == 200:
-                issues = response.json()
-                print(f"Retrieved issues successfully!\n Issues: {issues}\n")
-                for issue in issues:
-                    print(f"Issue Number: {issue['number']}")
-                    print(f"Issue: {issue['title']}")
-                    print(f"Body: {issue['body']}\n")
-            else:
-                print(f"Failed to retrieve issues: \n{response.status_code}, {response.text}\n")
+            with span("github.request", method="GET", url=self.issues_url, page=page) as request_span:
+                response = client.get(self.issues_url, params={**params, "page": page}, headers=headers)
+                request_span.set(status=response.status_code)
         except httpx.HTTPError as exc:
             print(f"An error occurred: {exc}")
-            
+            return None, page
+        limiter.update(response)
+
+        if response.status_code == 304:
+            return [dict(issue) for issue in cached[1]], cached[2]
+        if response.status_code != 200:
+            print(f"Failed to retrieve issues: \n{response.status_code}, {response.text}\n")
+            return None, page
+
+        issues = [issue_to_task(issue) for issue in response.json() if "pull_request" not in issue]
+        last_url = response.links.get("last", {}).get("url")
+        last_page = int(httpx.URL(last_url).params.get("page", page)) if last_url else page
+
+        if "ETag" in response.headers:
+            self.etags[key] = (response.headers["ETag"], issues, last_page)
+        return issues, last_page
+
+    def get_remote_issues(self):
+        return self.get_issues(state="all")
+
+    def create_remote_issues(self, tasks, on_created=None):
+        asyncio.run(self.create_issues_async(tasks=tasks, on_created=on_created))
+
+    def update_remote_issues(self, tasks):
+        return asyncio.run(self.update_issues_async(tasks))
+
+    def close_remote_issues(self, issue_ids):
+        return asyncio.run(self.close_issues_async(issue_ids))["closed"]
+
+    async def update_issues_async(self, tasks, max_concurrency=5, max_retries=3):
+        """Updates the title and body of the issues of the given tasks concurrently, returns the updated issue numbers"""
+        limiter = RateLimiter()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        updated = []
+
+        async def update(task):
+            url = f"{self.issues_url}/{task['issueID']}"
+            data = {"title": task.get("title", ""), "body": self.format_body(task)}
+            response = await self._send_async(client, semaphore, limiter, "PATCH", url, data, max_retries)
+            if response is not None and response.status_code == 200:
+                print(f"Issue {task['issueID']} updated successfully!")
+                updated.append(task["issueID"])
+            elif response is not None:
+                print(f"Failed to update issue {task['issueID']}: {response.status_code}, {response.text}")
+
+        async with self._async_client(max_concurrency) as client:
+            await asyncio.gather(*(update(task) for task in tasks))
+
+        return updated
 
     def delete_issue(self, title):
         pass
@@ -77,23 +293,43 @@ class github_epic(BaseEpic):
     def save_json(self, file_path):
         pass    
 
-    def close_all_issues(self):
-        while True:
-            page = 1
-            response = httpx.get(self.issues_url, headers=self.headers, params={'state': 'open', 'page': page})
-            issues = response.json()
-
-            if not issues:
-                break
-
-            for issue in issues:
-                issue_number = issue['number']
-                delete_url = f"{self.issues_url}/{issue_number}"
-                delete_response = httpx.patch(delete_url, headers=self.headers, json={"state": "closed"})
-                if delete_response.status_code == 200:
-                    print(f"Issue {issue_number} closed successfully!")
-                else:
-                    print(f"Failed to close issue {issue_number}: {delete_response.status_code}, {delete_response.text}")
-            
-            page += 1
-            time.sleep(1)
\ No newline at end of file
+    def close_all_issues(self, labels=None, only_epic=False, max_concurrency=5):
+        """
+        Closes all open issues in the repository, optionally only those with all of the given labels
+        and/or only those belonging to the tasks of this epic (by issueID).
+
+        The open issues are all listed before any of them are closed, since closing issues while paging
+        through them shifts the pages. The issues are then closed concurrently on one pooled client.
+        Returns:
+            dict: {"closed": [issue numbers], "failed": [{"issueID", "status", "error"}]}
+        """
+        issue_ids = [issue["issueID"] for issue in self.iter_issues(state="open", labels=labels)]
+        if only_epic:
+            epic_ids = {task.get("issueID") for task in self.tasks}
+            issue_ids = [issue_id for issue_id in issue_ids if issue_id in epic_ids]
+
+        return asyncio.run(self.close_issues_async(issue_ids, max_concurrency))
+
+    async def close_issues_async(self, issue_ids, max_concurrency=5, max_retries=3):
+        """Closes the given issues concurrently, returns a summary like close_all_issues"""
+        limiter = RateLimiter()
+        semaphore = asyncio.Semaphore(max_concurrency)
+        summary = {"closed": [], "failed": []}
+
+        async def close(issue_id):
+            url = f"{self.issues_url}/{issue_id}"
+            response = await self._send_async(client, semaphore, limiter, "PATCH", url, {"state": "closed"},
+                                              max_retries)
+            if response is None:
+                summary["failed"].append({"issueID": issue_id, "status": None, "error": "Request failed"})
+            elif response.status_code == 200:
+                print(f"Issue {issue_id} closed successfully!")
+                summary["closed"].append(issue_id)
+            else:
+                print(f"Failed to close issue {issue_id}: {response.status_code}, {response.text}")
+                summary["failed"].append({"issueID": issue_id, "status": response.status_code, "error": response.text})
+
+        async with self._async_client(max_concurrency) as client:
+            await asyncio.gather(*(close(issue_id) for issue_id in issue_ids))
+
+        return summary
@@ -10,7 +10,22 @@ class MockEpic(BaseEpic):
 
     def get_issues(self):
         # Mock issue retrieval
-        pass
+        return []
+
+    def create_remote_issues(self, tasks, on_created=None):
+        # Mock issue creation, numbering the issues in order
+        for number, task in enumerate(tasks, start=1):
+            task["issueID"] = number
+            if on_created is not None:
+                on_created(task)
+
+    def update_remote_issues(self, tasks):
+        # Mock issue update
+        return [task["issueID"] for task in tasks]
+
+    def close_remote_issues(self, issue_ids):
+        # Mock issue closing
+        return list(issue_ids)
     
     def delete_issue(self):
         # Mock issue deletion
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import httpx
+
+
+class RateLimiter:
+    """
+    Paces requests from the rate limit headers sent back by the tracker APIs.
+
+    GitHub (and Azure DevOps) report the remaining budget through the X-RateLimit-* headers and ask
+    clients to back off with Retry-After. Instead of sleeping a fixed amount between requests, every
+    response is fed to update() and every request waits on wait() first.
+
+    See docs: https://docs.github.com/en/rest/using-the-rest-api/rate-limits-for-the-rest-api
+    """
+
+    # GitHub asks to wait at least a minute when a secondary rate limit is hit without a Retry-After header
+    default_backoff = 60.0
+
+    def __init__(self, min_remaining: int = 1):
+        self.min_remaining = min_remaining
+        self.remaining = None
+        self.reset_at = None
+        self.retry_at = 0.0
+
+    def delay(self) -> float:
+        """Returns the number of seconds to wait before the next request may be sent."""
+        now = time.time()
+        delay = max(self.retry_at - now, 0.0)
+        if self.remaining is not None and self.remaining < self.min_remaining and self.reset_at is not None:
+            delay = max(delay, self.reset_at - now)
+        return delay
+
+    async def wait(self) -> None:
+        delay = self.delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def wait_sync(self) -> None:
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, response: httpx.Response) -> bool:
+        """
+        Updates the limiter from the headers of a response.
+        Returns True if the request was rejected because of a rate limit and should be retried.
+        """
+        headers = response.headers
+        now = time.time()
+
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is not None and remaining.isdigit():
+            self.remaining = int(remaining)
+        reset = headers.get("X-RateLimit-Reset")
+        if reset is not None and reset.isdigit():
+            self.reset_at = float(reset)
+
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            self.retry_at = max(self.retry_at, now + int(retry_after))
+
+        if response.status_code not in (403, 429):
+            return False
+
+        rate_limited = response.status_code == 429 or retry_after is not None or self.remaining == 0
+        if rate_limited and retry_after is None and self.remaining != 0:
+            # Secondary rate limit without any timing information
+            self.retry_at = max(self.retry_at, now + self.default_backoff)
+        return rate_limited
@@ -2,6 +2,7 @@ from database.setup import setup_database
 from database.manager import DatabaseManager
 from epics.github_epic import github_epic
 from epics.ado_epic import ado_epic
+from epics.checkpoint import CreationJournal
 from secret_manager import access_secret_version
 
 #TODO create a config or env file for these
@@ -33,7 +34,9 @@ def github_epic_test(config):
         gh_epic.add_task(task)
 
     print("Creating issues")
-    gh_epic.create_issues()
+    # Journals the created issues, so rerunning after a crash does not create them again
+    journal = CreationJournal(f"{config.db_document}.journal", remote=db_manager)
+    print(gh_epic.create_issues_checkpointed(journal))
 
     print("Getting issues")
     print(gh_epic.get_issues())
@@ -42,7 +45,9 @@ def github_epic_test(config):
     print(gh_epic.get_tasks())
 
     input("Press enter to update DB")
-    db_manager.update_db(gh_epic.get_epic())
+    # The journal is the only record of the created issues until they are stored
+    if db_manager.update_db(gh_epic.get_epic()):
+        journal.clear()
 
     taskwithid = db_manager.get_task_with_id(70)
     print("f: Task with id: ", taskwithid)
@@ -65,7 +70,7 @@ def ado_epic_test(config):
         az_epic.add_task(task)
 
     print("Creating issues")
-    az_epic.create_issues()
+    print(az_epic.create_issues_batch())
 
     print("Getting issues")
     print(az_epic.get_issues())
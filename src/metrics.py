@@ -0,0 +1,193 @@
+import bisect
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Upper bounds in seconds of the latency histogram buckets, from 1ms to 10s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Quantiles estimated from the histogram buckets, and exported next to them
+QUANTILES = (0.5, 0.95, 0.99)
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    """Monotonic counter, with one value per combination of label values"""
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self.values.get(_label_values(self.labelnames, labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self.values.items())
+        lines.extend(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values)
+        return lines
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, with one set of buckets per combination of label values.
+
+    Observing a value is a binary search and two additions under a lock, cheap enough for every request.
+    Besides the buckets, the p50/p95/p99 estimated from them are exported as a gauge named <name>_quantile.
+    """
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [count per bucket (the last one is +Inf), sum of the observed values]
+        self.values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_values(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes the time spent in the with block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        series = self.values.get(_label_values(self.labelnames, labels))
+        return sum(series[0]) if series else 0
+
+    def quantile(self, q: float, **labels: str) -> float:
+        """Estimates the q quantile by linear interpolation within its bucket, like Prometheus' histogram_quantile"""
+        series = self.values.get(_label_values(self.labelnames, labels))
+        return _quantile(self.buckets, series[0], q) if series else float("nan")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        quantiles = [f"# HELP {self.name}_quantile Estimated quantiles of {self.name}",
+                     f"# TYPE {self.name}_quantile gauge"]
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _labels(self.labelnames + ("le",), key + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+            for q in QUANTILES:
+                labels = _labels(self.labelnames + ("quantile",), key + (str(q),))
+                quantiles.append(f"{self.name}_quantile{labels} {_number(_quantile(self.buckets, counts, q))}")
+        return lines + quantiles
+
+
+class Registry:
+    """The metrics of the process, rendered together in the Prometheus text format by render"""
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+webhook_requests = registry.counter(
+    "trackpoint_webhook_requests_total", "Webhook deliveries received, by action", ["action"])
+webhook_errors = registry.counter(
+    "trackpoint_webhook_errors_total", "Webhook deliveries or task updates that failed, by action", ["action"])
+webhook_request_seconds = registry.histogram(
+    "trackpoint_webhook_request_seconds", "Time spent handling a webhook delivery, from receiving it to responding")
+webhook_stage_seconds = registry.histogram(
+    "trackpoint_webhook_stage_seconds", "Time spent in each stage of handling a webhook delivery", ["stage"])
+webhook_duplicates = registry.counter(
+    "trackpoint_webhook_duplicate_deliveries_total", "Webhook deliveries dropped because they were already processed")
+task_update_errors = registry.counter(
+    "trackpoint_task_update_errors_total", "Task updates that failed, e.g. because a database call raised")
+outbound_call_seconds = registry.histogram(
+    "trackpoint_outbound_call_seconds", "Time spent in calls to other services", ["service", "call"])
+outbound_call_errors = registry.counter(
+    "trackpoint_outbound_call_errors_total", "Calls to other services that raised", ["service", "call"])
+
+
+@contextmanager
+def outbound_call(service: str, call: str) -> Iterator[None]:
+    """Times a call to another service (e.g. Firestore), and counts it as an error if it raises"""
+    try:
+        with outbound_call_seconds.time(service=service, call=call):
+            yield
+    except Exception:
+        outbound_call_errors.inc(service=service, call=call)
+        raise
+
+
+def _label_values(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    if labels.keys() != set(labelnames):
+        raise ValueError(f"Expected the labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _labels(labelnames: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not labelnames:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value != value:
+        return "NaN"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _quantile(buckets: Tuple[float, ...], counts: List[int], q: float) -> float:
+    total = sum(counts)
+    if not total:
+        return float("nan")
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            if i == len(buckets):
+                # Beyond the last bucket, the best estimate is its upper bound
+                return buckets[-1]
+            lower = buckets[i - 1] if i else 0.0
+            return lower + (buckets[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return buckets[-1]
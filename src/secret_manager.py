@@ -1,21 +1,64 @@
-from google.cloud import secretmanager
 import os
 import json
+import threading
+import time
+
+from metrics import outbound_call
 
 # gcloud init
 # gcloud auth application-default login
 
-def access_secret_version(project_id, secret_id, version_id):
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-    response = client.access_secret_version(name=name)
-    secret_value = response.payload.data.decode('UTF-8')
-    return secret_value
+# Seconds a fetched secret is served from the cache before it is fetched again
+SECRET_TTL = 600
+
+_client = None
+_client_lock = threading.Lock()
+_cache = {}  # Maps secret version names to (value, expiry)
+_fetch_locks = {}  # One lock per secret version name, so concurrent misses share a single fetch
+_fetch_locks_lock = threading.Lock()
 
-def access_secret_version_json(project_id, secret_id, version_id):
-    client = secretmanager.SecretManagerServiceClient()
+def get_client():
+    """Returns the Secret Manager client shared by the whole process"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Imported on first use, the client library takes longer to import than most requests take
+                from google.cloud import secretmanager
+                _client = secretmanager.SecretManagerServiceClient()
+    return _client
+
+def access_secret_version(project_id, secret_id, version_id, ttl=SECRET_TTL):
+    """
+    Returns the value of a secret version. Values are cached for ttl seconds, and when several threads
+    miss the cache for the same secret at once only one of them fetches it.
+    """
     name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-    response = client.access_secret_version(name=name)
-    secret_value = response.payload.data.decode('UTF-8')
+    cached = _cache.get(name)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+
+    with _fetch_lock(name):
+        # Another thread may have fetched the secret while we were waiting
+        cached = _cache.get(name)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        with outbound_call("secret_manager", "access_secret_version"):
+            response = get_client().access_secret_version(name=name)
+        secret_value = response.payload.data.decode('UTF-8')
+        _cache[name] = (secret_value, time.monotonic() + ttl)
+        return secret_value
+
+def access_secret_version_json(project_id, secret_id, version_id, ttl=SECRET_TTL):
+    secret_value = access_secret_version(project_id, secret_id, version_id, ttl)
     json_data = json.loads(secret_value)
     return json_data
+
+def clear_secret_cache():
+    """Drops all cached secrets, e.g. after rotating one"""
+    _cache.clear()
+
+def _fetch_lock(name):
+    with _fetch_locks_lock:
+        return _fetch_locks.setdefault(name, threading.Lock())
@@ -0,0 +1,167 @@
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import itertools
+import json
+import pstats
+import threading
+import time
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_ids = itertools.count(1)
+_current: contextvars.ContextVar[Optional["ActiveSpan"]] = contextvars.ContextVar("current_span", default=None)
+# Where finished spans go, tracing is disabled while this is None
+_sink = None
+
+
+@dataclass
+class Span:
+    """A finished span: a named, timed piece of work and the span it ran in"""
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    start: float  # Seconds since the epoch
+    duration: float  # Seconds
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class MemorySink:
+    """Keeps finished spans in a list, mostly for tests"""
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def emit(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def named(self, name: str) -> List[Span]:
+        return [span for span in self.spans if span.name == name]
+
+
+class JsonlSink:
+    """Appends every finished span to a file as a line of JSON"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, span: Span) -> None:
+        line = json.dumps(asdict(span), default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line)
+
+
+def set_sink(sink) -> None:
+    """Sends finished spans to sink (any object with an emit(span) method), or disables tracing if None"""
+    global _sink
+    _sink = sink
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+class ActiveSpan:
+    """A span that is running, as returned by span(). Attributes can be added to it until it ends."""
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_ids)
+        self.parent_id = None
+        self._token = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "ActiveSpan":
+        parent = _current.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self._token = _current.set(self)
+        self._start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        duration = time.perf_counter() - self._started
+        _current.reset(self._token)
+        sink = _sink
+        if sink is not None:
+            error = f"{exc_type.__name__}: {exc}" if exc_type is not None else None
+            sink.emit(Span(self.name, self.span_id, self.parent_id, self._start, duration, self.attributes, error))
+
+
+class _NoopSpan:
+    """Stands in for ActiveSpan while tracing is disabled, so instrumented code costs next to nothing"""
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes: Any):
+    """
+    Context manager timing the with block as a span named name, nested in the span it runs in.
+    Yields the span, so attributes known only later (e.g. a response status) can be added with set().
+    """
+    if _sink is None:
+        return _NOOP_SPAN
+    return ActiveSpan(name, attributes)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator running every call of a function (or coroutine function) in a span, named after it by default"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _sink is None:
+                    return await func(*args, **kwargs)
+                with ActiveSpan(span_name, {}):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _sink is None:
+                return func(*args, **kwargs)
+            with ActiveSpan(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def profile(path: Optional[str] = None, sort: str = "cumulative", limit: int = 30) -> Iterator[cProfile.Profile]:
+    """
+    Profiles the with block with cProfile, e.g. a single run of setup_database. The stats are written to path
+    (readable with pstats or snakeviz), or the top limit functions are printed if no path is given.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+        else:
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats(sort).print_stats(limit)
+            print(output.getvalue())
@@ -1,91 +1,183 @@
-import ngrok
-import time
-import re
+import asyncio
 import os
-import json
-import uvicorn
-from fastapi import FastAPI
+
+import metrics
 
 from Google.sheets import Task
-from epics.database_epic import database_epic
-from secret_manager import access_secret_version
-from database.manager import DatabaseManager
-from fastapi import Request
+from database.async_manager import create_async_manager
+from delivery_queue import DeliveryQueue
+from delivery_cache import DeliveryCache
 
 db_collection = "epics"
 db_document = "MVP for TrackPoint"
 
-# Initialize FastAPI application
-app = FastAPI()
-
-def parse_body(body: str) -> dict:
-    """Parse the body text and extract values for Task attributes."""
-    task_data = {
-        'description': None,
-        'priority': None,
-        'story_point': None,
-        'comments': None
-    }
-
-    body = body.replace('**', '')  # Escape markdown characters
-    
-    # Regular expressions to extract values
-    patterns = {
-        'description': r'Description:\s*(.*)',
-        'priority': r'Priority:\s*(.*)',
-        'story_point': r'Story Point:\s*(\d+)',
-        'comments': r'Comments:\s*(.*)'
-    }
-    
-    for key, pattern in patterns.items():
-        match = re.search(pattern, body)
-        if match:
-            value = match.group(1).strip()
-            if key == 'story_point':
-                task_data[key] = int(value)  # Convert story_point to int
-            else:
-                task_data[key] = value
-    
-    return task_data
-
-# Define the webhook endpoint
-@app.post("/")
-async def read_webhook(request: Request) -> dict:
-    payload = await request.json()
-
-    database_epic_instance = database_epic(db_collection, db_document, "", "", "", "")
-
-    if payload.get('action') == 'edited':
-        changes = payload.get('changes', {})
-        issue = payload.get('issue', {})
-
-        update_data = Task(title=None, comments=None, issueID=None, priority=None, description=None, story_point=None)
-
-        for key in changes.keys():
-            print(f"Change detected in: {key}")
-            from_value = changes[key].get('from', None)
-            print(f"Previous value: {from_value}")
-            db_value = getattr(database_epic_instance.tasks, from_value, None)
-            new_value = issue.get(key, None)
-            if db_value != new_value:
-                if key == 'body':
-                    from_value = issue.get('title')
-                    parsed_data = parse_body(new_value)
-                    for attr, value in parsed_data.items():
-                        setattr(update_data, attr, value)
-                else:
-                    setattr(update_data, key, new_value)
-        
-        #Update Firestore
-        issue_title = issue.get('title')
-        if update_data and issue_title:
-            DatabaseManager.update_tasks(db_collection, db_document, str(from_value), update_data.__dict__)
-        
-        return {"status": "success", "value updated:": update_data}
-
-    return payload
+# Actions of issue events, any other action is counted as "other" to keep the number of metric labels bounded
+ISSUE_ACTIONS = {"opened", "edited", "deleted", "closed", "reopened", "assigned", "unassigned", "labeled",
+                 "unlabeled", "transferred", "pinned", "unpinned", "locked", "unlocked", "milestoned", "demilestoned"}
+
+def task_update(payload: dict):
+    """
+    Returns the title the edited task is stored under and the update to apply to it, from an 'edited' issue event.
+    """
+    # Imported on the first delivery, so importing the webhook does not pull in the GitHub client
+    from epics.github_epic import parse_body
+
+    changes = payload.get('changes', {})
+    issue = payload.get('issue', {})
+
+    update_data = Task(title=None, comments=None, issueID=None, priority=None, description=None, story_point=None)
+    from_value = None
+
+    for key in changes.keys():
+        print(f"Change detected in: {key}")
+        from_value = changes[key].get('from', None)
+        print(f"Previous value: {from_value}")
+        new_value = issue.get(key, None)
+        if key == 'body':
+            from_value = issue.get('title')
+            parsed_data = parse_body(new_value)
+            for attr, value in parsed_data.items():
+                setattr(update_data, attr, value)
+        else:
+            setattr(update_data, key, new_value)
+
+    return str(from_value), update_data
+
+def create_app(db_manager=None, delivery_cache: DeliveryCache = None):
+    """
+    Creates the webhook application, e.g. `uvicorn --factory webhook:create_app`, or see init_webhook.
+
+    Importing this module and creating the app do no I/O: FastAPI is imported here, the database manager
+    (see database.async_manager.create_async_manager) is created on the first task update unless one is given,
+    and the delivery queue starts with the app. Every app has its own queue and delivery cache.
+
+    Args:
+        db_manager: Optional async database manager to apply the task updates with.
+        delivery_cache: Optional cache of the processed deliveries. By default deliveries are remembered in memory,
+            or in the file TRACKPOINT_DELIVERY_CACHE points to, so they are remembered across restarts.
+    """
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI, Request
+    from fastapi.responses import Response
+
+    if delivery_cache is None:
+        delivery_cache = DeliveryCache(path=os.environ.get("TRACKPOINT_DELIVERY_CACHE"))
+
+    def get_db_manager():
+        """Returns the async database manager shared by all requests, so the database client is only created once"""
+        if app.state.db_manager is None:
+            app.state.db_manager = create_async_manager(db_collection, db_document)
+        return app.state.db_manager
+
+    async def apply_update(task_title: str, update: dict):
+        # Failures of the update itself are caught and counted by update_tasks (see metrics.task_update_errors),
+        # what is left is e.g. failing to create the database manager
+        try:
+            with metrics.webhook_stage_seconds.time(stage="update_tasks"):
+                await get_db_manager().update_tasks(task_title, update)
+        except Exception:
+            metrics.webhook_errors.inc(action="update")
+            raise
+
+    # Task updates are applied in the background, see read_webhook
+    delivery_queue = DeliveryQueue(apply_update)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        delivery_queue.start()
+        yield
+        # Apply the updates that are still queued before shutting down
+        await delivery_queue.stop()
+        await asyncio.to_thread(delivery_cache.flush)
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.db_manager = db_manager
+    app.state.delivery_queue = delivery_queue
+    app.state.delivery_cache = delivery_cache
+
+    # Define the webhook endpoint
+    @app.post("/", status_code=202)
+    async def read_webhook(request: Request) -> dict:
+        """
+        Accepts a delivery and queues the resulting task update, which is applied to the database in the background.
+        Values that already match the database are skipped by update_tasks.
+        Deliveries that were already processed (by their X-GitHub-Delivery id) are acknowledged and dropped.
+        """
+        with metrics.webhook_request_seconds.time():
+            return await handle_delivery(request)
+
+    async def handle_delivery(request: Request) -> dict:
+        delivery_id = request.headers.get("X-GitHub-Delivery")
+        # Reserved before anything is awaited, so a redelivery arriving while this one is processed is dropped too
+        if not delivery_cache.reserve(delivery_id):
+            metrics.webhook_duplicates.inc()
+            return {"status": "duplicate", "delivery": delivery_id}
+
+        try:
+            response = await process_delivery(request)
+        except BaseException:
+            # Not processed, so a redelivery is
+            delivery_cache.release(delivery_id)
+            raise
+        delivery_cache.add(delivery_id)
+        return response
+
+    async def process_delivery(request: Request) -> dict:
+        try:
+            with metrics.webhook_stage_seconds.time(stage="parse_json"):
+                payload = await request.json()
+        except Exception:
+            metrics.webhook_errors.inc(action="invalid")
+            raise
+
+        action = payload.get('action')
+        action = action if action in ISSUE_ACTIONS else "other"
+        metrics.webhook_requests.inc(action=action)
+
+        try:
+            if action == 'edited':
+                issue = payload.get('issue', {})
+                with metrics.webhook_stage_seconds.time(stage="parse_body"):
+                    task_title, update_data = task_update(payload)
+
+                issue_title = issue.get('title')
+                if update_data and issue_title:
+                    with metrics.webhook_stage_seconds.time(stage="enqueue"):
+                        delivery_queue.enqueue(issue.get('number', issue_title), task_title, update_data.__dict__)
+
+                return {"status": "accepted", "value updated:": update_data}
+        except Exception:
+            metrics.webhook_errors.inc(action=action)
+            raise
+
+        return payload
+
+    @app.get("/queue")
+    async def queue_stats() -> dict:
+        """Returns the depth and coalescing ratio of the delivery queue, and the number of duplicate deliveries dropped"""
+        return {**delivery_queue.stats(), "duplicates": delivery_cache.duplicates}
+
+    @app.get("/metrics")
+    async def read_metrics() -> Response:
+        """Returns the request counts, stage latencies and outbound call timings in the Prometheus text format"""
+        return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+    return app
+
+def __getattr__(name):
+    # `uvicorn webhook:app` keeps working, the app is only created when it is asked for
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def init_webhook():
+    """Opens the ngrok tunnel the webhook is delivered through, and serves the webhook app until interrupted"""
+    import ngrok
+    import uvicorn
+    from secret_manager import access_secret_version
+
     project_id = "trackpointdb" 
     secret_id = "NGROK_AUTHTOKEN"  
     version_id = "latest"  
@@ -99,9 +191,9 @@ def init_webhook():
 
     # Keep the listener alive
     try:
-        uvicorn.run(app, host="0.0.0.0", port=5000)
+        uvicorn.run(create_app(), host="0.0.0.0", port=5000)
     except KeyboardInterrupt:
         print("Closing listener")
 
-init_webhook()
-
+if __name__ == "__main__":
+    init_webhook()
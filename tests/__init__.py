@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules in src/ import each other as top-level packages (e.g. "from epics.base_epic import BaseEpic"),
+# so make src/ importable when the tests are run from the repository root.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
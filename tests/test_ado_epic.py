@@ -0,0 +1,183 @@
+import json
+import re
+import unittest
+import httpx
+
+from epics.ado_epic import ado_epic
+
+
+class TestCreateIssuesBatch(unittest.TestCase):
+    def setUp(self):
+        self.epic = ado_epic("test_org", "test_project", "test_pat", "Epic", "Problem", "Feature", "Value")
+        for i in range(5):
+            self.epic.add_task({"title": f"Task {i}", "description": "Description", "priority": "High"})
+        self.batches = []
+
+    def handler(self, request):
+        batch = json.loads(request.content)
+        self.batches.append(batch)
+        results = []
+        for operation in batch:
+            title = operation["body"][0]["value"]
+            if title == "Task 3":
+                body = {"message": "TF401320: Rule Error"}
+                results.append({"code": 400, "headers": {}, "body": json.dumps(body)})
+            else:
+                body = {"id": 1000 + int(title.split()[-1]), "fields": {"System.Title": title}}
+                results.append({"code": 200, "headers": {}, "body": json.dumps(body)})
+        return httpx.Response(200, json={"count": len(results), "value": results})
+
+    def test_chunks_and_maps_ids(self):
+        self.epic.transport = httpx.MockTransport(self.handler)
+
+        summary = self.epic.create_issues_batch(chunk_size=2)
+
+        self.assertEqual([len(batch) for batch in self.batches], [2, 2, 1])
+        self.assertEqual(self.batches[0][0]["method"], "PATCH")
+        self.assertEqual(self.batches[0][0]["uri"], "/test_project/_apis/wit/workitems/$task?api-version=7.1")
+        self.assertEqual(summary["created"], [1000, 1001, 1002, 1004])
+        self.assertEqual(summary["failed"], [{"title": "Task 3", "status": 400, "error": "TF401320: Rule Error"}])
+        self.assertEqual(self.epic.tasks[4]["issueID"], 1004)
+        self.assertNotIn("issueID", self.epic.tasks[3])
+
+    def test_failed_request_fails_its_chunk_only(self):
+        def handler(request):
+            if not self.batches:
+                self.batches.append(None)
+                return httpx.Response(503, text="Service Unavailable")
+            return self.handler(request)
+
+        self.epic.transport = httpx.MockTransport(handler)
+
+        summary = self.epic.create_issues_batch(chunk_size=3)
+
+        self.assertEqual([failure["title"] for failure in summary["failed"]], ["Task 0", "Task 1", "Task 2", "Task 3"])
+        self.assertEqual(summary["created"], [1004])
+
+    def test_rejects_oversized_chunks(self):
+        with self.assertRaises(ValueError):
+            self.epic.create_issues_batch(chunk_size=201)
+
+
+class TestGetIssues(unittest.TestCase):
+    def setUp(self):
+        self.epic = ado_epic("test_org", "test_project", "test_pat", "Epic", "Problem", "Feature", "Value")
+        self.work_items = {}
+        for i in range(1, 451):
+            task = {"title": f"Task {i}", "description": "Description", "priority": "High", "story_point": i % 8}
+            self.work_items[i] = {"System.Title": task["title"], "System.Description": self.epic.format_body(task),
+                                  "System.State": "Closed" if i == 7 else "Active"}
+        self.queries = []
+        self.batches = []
+        self.failing_ids = set()
+        self.epic.transport = httpx.MockTransport(self.handler)
+
+    def handler(self, request):
+        data = json.loads(request.content)
+        if request.url.path.endswith("/wiql"):
+            self.queries.append(data["query"])
+            return httpx.Response(200, json={"workItems": [{"id": i} for i, fields in self.work_items.items()
+                                                           if self.in_scope(data["query"], fields)]})
+        if request.url.path.endswith("/workitemsbatch"):
+            self.batches.append(data)
+            if len(data["ids"]) > 200:
+                return httpx.Response(400, text="VS403474: too many ids")
+            if self.failing_ids.intersection(data["ids"]):
+                return httpx.Response(503, text="Service Unavailable")
+            return httpx.Response(200, json={"value": [
+                {"id": i, "fields": {field: self.work_items[i][field] for field in data["fields"]
+                                     if field in self.work_items[i]}}
+                for i in data["ids"]
+            ]})
+
+        results = []
+        for operation in data:
+            work_item = operation["uri"].split("/")[-1].split("?")[0]
+            if work_item == "$task":
+                work_item = max(self.work_items) + 1
+                self.work_items[work_item] = {"System.State": "New"}
+            work_item = int(work_item)
+            for field in operation["body"]:
+                if field["path"] == "/relations/-":
+                    self.work_items[work_item]["System.Parent"] = int(field["value"]["url"].rsplit("/", 1)[-1])
+                else:
+                    self.work_items[work_item][field["path"].rsplit("/", 1)[-1]] = field["value"]
+            results.append({"code": 200, "body": json.dumps({"id": work_item})})
+        return httpx.Response(200, json={"value": results})
+
+    def in_scope(self, query, fields):
+        """Evaluates the scope conditions of a WIQL query written by query_work_item_ids against a work item"""
+        area_path = re.search(r"\[System.AreaPath\] UNDER '(.*?)'", query)
+        tag = re.search(r"\[System.Tags\] CONTAINS '(.*?)'", query)
+        parent = re.search(r"\[System.Parent\] = (\d+)", query)
+        return ((not area_path or fields.get("System.AreaPath", "").startswith(area_path.group(1)))
+                and (not tag or tag.group(1) in fields.get("System.Tags", ""))
+                and (not parent or fields.get("System.Parent") == int(parent.group(1))))
+
+    def test_scoped_query(self):
+        self.epic.get_issues(area_path="Project\\Team's Area", tag="epic-1", parent_id=42)
+
+        self.assertIn("[System.AreaPath] UNDER 'Project\\Team''s Area'", self.queries[0])
+        self.assertIn("[System.Tags] CONTAINS 'epic-1'", self.queries[0])
+        self.assertIn("[System.Parent] = 42", self.queries[0])
+
+    def test_created_work_items_are_listed_in_their_scope(self):
+        self.epic.area_path, self.epic.tag, self.epic.parent_id = "Project\\Team", "epic-1", 42
+        self.epic.add_task({"title": "New task", "description": "Description", "priority": "High"})
+
+        self.epic.create_issues_batch()
+
+        issue_id = self.epic.tasks[0]["issueID"]
+        self.assertEqual(self.work_items[issue_id]["System.AreaPath"], "Project\\Team")
+        self.assertEqual([task["issueID"] for task in self.epic.get_issues()], [issue_id])
+        self.assertEqual(self.epic.reconcile()["created"], 0)
+
+    def test_hydrates_in_chunks_and_returns_tasks(self):
+        tasks = self.epic.get_issues()
+
+        self.assertEqual(sorted(len(batch["ids"]) for batch in self.batches), [50, 200, 200])
+        self.assertEqual(self.batches[0]["fields"], ["System.Id", "System.Title", "System.Description", "System.State"])
+        self.assertEqual([task["issueID"] for task in tasks], list(range(1, 451)))
+        self.assertEqual({key: tasks[2][key] for key in ("title", "description", "priority", "story_point", "state")},
+                         {"title": "Task 3", "description": "Description", "priority": "High", "story_point": 3,
+                          "state": "open"})
+        self.assertEqual(tasks[6]["state"], "closed")
+
+    def test_merge_issues(self):
+        self.epic.add_task({"title": "Task 1", "issueID": 1})
+        self.epic.add_task({"title": "Task 2"})
+
+        summary = self.epic.merge_issues(self.epic.get_issues())
+
+        self.assertEqual(summary, {"linked": 1, "added": 448})
+        self.assertEqual(self.epic.tasks[1]["issueID"], 2)
+        self.assertNotIn("body_hash", self.epic.tasks[2])
+
+    def test_reconcile(self):
+        self.epic.merge_issues(self.epic.get_issues())
+        self.epic.tasks[0]["priority"] = "Low"
+        self.epic.remove_task("Task 2")
+        self.batches.clear()
+
+        summary = self.epic.reconcile()
+
+        self.assertEqual((summary["updated"], summary["closed"], summary["created"]), (1, 1, 0))
+        self.assertIn("Low", self.work_items[1]["System.Description"])
+        self.assertEqual(self.work_items[2]["System.State"], "Closed")
+
+    def test_failed_chunk_changes_nothing(self):
+        self.epic.merge_issues(self.epic.get_issues())
+        self.epic.tasks[0]["priority"] = "Low"
+        self.epic.remove_task("Task 2")
+        self.failing_ids.add(300)
+
+        self.assertIsNone(self.epic.get_issues())
+        self.assertIsNone(self.epic.reconcile())
+
+        self.assertNotIn("Low", self.work_items[1]["System.Description"])
+        self.assertEqual(self.work_items[2]["System.State"], "Active")
+        self.assertEqual(len(self.work_items), 450)
+
+
+if __name__ == '__main__':
+    unittest.main()
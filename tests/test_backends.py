@@ -0,0 +1,124 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from database.async_manager import ThreadedDatabaseManager, create_async_manager
+from database.backends import DELETE_FIELD, SQLiteBackend
+from database.manager import STORAGE_ENV, DatabaseManager, close_shared_managers, create_backend
+
+
+class TestSQLiteBackend(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = "sqlite:" + os.path.join(directory.name, "trackpoint.db")
+        self.manager = DatabaseManager("epics", "Test Epic", storage=self.storage)
+        self.addCleanup(self.manager.close)
+        self.addCleanup(close_shared_managers)
+        self.epic = SimpleNamespace(title="Test Epic", problem="Problem", feature="Feature", value="Value")
+        self.tasks = [
+            {"title": "Task 1", "description": "First", "priority": "High", "issueID": 1},
+            {"title": "Task 2", "description": "Second", "priority": "Low"},
+            {"title": "Task 3", "description": "Third", "priority": "Medium", "issueID": 3},
+        ]
+
+    def test_add_and_fetch_round_trip(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+
+        epic = self.manager.fetch_database()
+
+        self.assertEqual(epic["title"], "Test Epic")
+        self.assertEqual(epic["tasks"], self.tasks)
+        self.assertEqual(self.manager.get_task_with_id(3), self.tasks[2])
+        self.assertEqual(self.manager.get_task_with_title("Task 2"), self.tasks[1])
+        self.assertEqual(self.manager.get_tasks_by_ids([1, 3, 4]), {1: self.tasks[0], 3: self.tasks[2]})
+        self.assertIsNone(self.manager.get_task_with_id(2))
+
+    def test_sync_tasks_writes_only_changes(self):
+        self.assertEqual(self.manager.sync_tasks(self.epic, self.tasks)["added"], 3)
+        self.tasks[1]["description"] = "Changed"
+        del self.tasks[2]
+
+        summary = self.manager.sync_tasks(self.epic, self.tasks)
+
+        self.assertEqual(summary, {"added": 0, "changed": 1, "removed": 1, "unchanged": 1})
+        self.assertEqual(self.manager.get_tasks(), self.tasks)
+
+    def test_update_tasks_uses_the_configured_backend(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+
+        with patch.dict(os.environ, {STORAGE_ENV: self.storage}):
+            DatabaseManager.update_tasks("epics", "Test Epic", "Task 2", {"priority": "Urgent", "description": None})
+
+        self.assertEqual(self.manager.get_task_with_title("Task 2")["priority"], "Urgent")
+        self.assertEqual(self.manager.get_task_with_title("Task 2")["description"], "Second")
+
+    def test_checkpoint_and_delete(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+        self.manager.save_checkpoint({"Task 2": 2})
+        self.assertEqual(self.manager.load_checkpoint(), {"Task 2": 2})
+        self.assertNotIn("issue_checkpoint", self.manager.fetch_database())
+
+        self.manager.save_checkpoint(None)
+        self.assertEqual(self.manager.load_checkpoint(), {})
+
+        self.manager.delete_epic()
+        self.assertIsNone(self.manager.fetch_database())
+        self.assertEqual(self.manager.backend.task_ids(), [])
+
+    def test_epics_are_kept_apart(self):
+        other = DatabaseManager("epics", "Other Epic", storage=self.storage)
+        self.addCleanup(other.close)
+        self.manager.add_to_db(self.epic, self.tasks)
+        other.add_to_db(self.epic, self.tasks[:1])
+
+        other.delete_epic()
+
+        self.assertEqual(self.manager.get_tasks(), self.tasks)
+
+    def test_update_of_missing_task_fails(self):
+        with self.assertRaises(KeyError):
+            self.manager.backend.commit([("update", "42", {"title": "Missing", "notes": DELETE_FIELD})])
+
+    def test_lookups_use_indexes_in_wal_mode(self):
+        backend = self.manager.backend
+        connection = backend._connection()
+
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        for column, index in (("issue_id", "tasks_issue_id"), ("title", "tasks_title")):
+            plan = connection.execute(
+                f"EXPLAIN QUERY PLAN SELECT data FROM tasks WHERE collection = ? AND document = ? AND {column} = ?",
+                backend.key + ("1",)).fetchall()
+            self.assertIn(index, " ".join(row[-1] for row in plan))
+
+    def test_threaded_manager_updates_tasks(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+        manager = create_async_manager("epics", "Test Epic", storage=self.storage)
+        self.assertIsInstance(manager, ThreadedDatabaseManager)
+
+        asyncio.run(manager.update_tasks("Task 1", {"priority": "Low"}))
+        manager.manager.close()
+
+        self.assertEqual(self.manager.get_task_with_id(1)["priority"], "Low")
+
+
+class TestCreateBackend(unittest.TestCase):
+    def test_unknown_storage(self):
+        with self.assertRaises(ValueError):
+            create_backend("epics", "Test Epic", "postgres://localhost")
+
+    def test_storage_from_environment(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trackpoint.db")
+            with patch.dict(os.environ, {STORAGE_ENV: "sqlite:" + path}):
+                backend = create_backend("epics", "Test Epic")
+            self.assertIsInstance(backend, SQLiteBackend)
+            self.assertEqual(backend.path, path)
+            backend.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from benchmarks import run
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_every_benchmark_runs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+
+            run.main(["--sizes", "10", "--output", path])
+
+            with open(path, encoding="utf-8") as output:
+                report = json.load(output)
+
+        results = {result["benchmark"]: result for result in report["results"]}
+        self.assertEqual(set(results), {"setup_database", "setup_database_unchanged", "create_issues_github",
+                                        "create_issues_ado", "update_tasks", "webhook"})
+        self.assertEqual(results["setup_database_unchanged"]["firestore_writes"], 0)
+        self.assertEqual(results["create_issues_github"]["created"], 10)
+        self.assertEqual(results["webhook"]["firestore_writes"], 10)
+        self.assertIn("python", report["environment"])
+
+    def test_throughput_counts_the_operations_run(self):
+        with patch("builtins.print"):
+            result, = run.run(["update_tasks"], [300], SimpleNamespace(repeat=1))
+
+        self.assertEqual(result["operations"], run.UPDATES)
+        self.assertAlmostEqual(result["ops_per_second"], run.UPDATES / result["seconds"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+
+from database.manager import DatabaseManager
+from epics.checkpoint import CreationJournal
+from epics.github_epic import github_epic
+from benchmarks.fake_firestore import FakeFirestore
+
+
+class Crash(Exception):
+    pass
+
+
+class TestCreateIssuesCheckpointed(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeFirestore()
+        patcher = patch("database.manager.initfirebase", return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db_manager = DatabaseManager("epics", "Test Epic")
+        self.db_manager.add_to_db(SimpleNamespace(title="Test Epic", problem="", feature="", value=""), [])
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "epic.journal")
+        self.issues = []
+
+    def epic(self, crash_after=None, titles=None):
+        epic = github_epic("test_owner", "test_repo", "test_token", "Epic", "Problem", "Feature", "Value")
+        for title in titles if titles is not None else (f"Task {i}" for i in range(100)):
+            epic.add_task({"title": title, "description": "Description"})
+
+        def handler(request):
+            if crash_after is not None and len(self.issues) == crash_after:
+                raise Crash()
+            self.issues.append(json.loads(request.content)["title"])
+            return httpx.Response(201, json={"number": len(self.issues)})
+
+        epic.transport = httpx.MockTransport(handler)
+        return epic
+
+    def test_resumes_after_a_crash(self):
+        with self.assertRaises(Crash):
+            self.epic(crash_after=30).create_issues_checkpointed(CreationJournal(self.path, self.db_manager, every=10))
+
+        epic = self.epic()
+        summary = epic.create_issues_checkpointed(CreationJournal(self.path, self.db_manager, every=10))
+
+        self.assertEqual(summary, {"resumed": 30, "created": 70, "failed": 0})
+        self.assertEqual(sorted(self.issues), sorted(task["title"] for task in epic.tasks))
+        self.assertEqual(sorted(task["issueID"] for task in epic.tasks), list(range(1, 101)))
+
+    def test_remote_checkpoint_survives_losing_the_journal(self):
+        with self.assertRaises(Crash):
+            self.epic(crash_after=30).create_issues_checkpointed(CreationJournal(self.path, self.db_manager, every=10))
+        os.remove(self.path)
+
+        summary = self.epic().create_issues_checkpointed(CreationJournal(self.path, self.db_manager, every=10))
+
+        self.assertEqual(summary["resumed"], 30)
+        self.assertEqual(len(self.issues), 100)
+
+    def test_resumes_tasks_sharing_a_title(self):
+        titles = ["Same", "", "Same", "", "Other"]
+        with self.assertRaises(Crash):
+            self.epic(crash_after=3, titles=titles).create_issues_checkpointed(
+                CreationJournal(self.path, self.db_manager, every=1))
+        os.remove(self.path)
+
+        epic = self.epic(titles=titles)
+        summary = epic.create_issues_checkpointed(CreationJournal(self.path, self.db_manager, every=1))
+
+        self.assertEqual(summary, {"resumed": 3, "created": 2, "failed": 0})
+        self.assertEqual(sorted(task["issueID"] for task in epic.tasks), [1, 2, 3, 4, 5])
+
+    def test_clear(self):
+        journal = CreationJournal(self.path, self.db_manager, every=10)
+        self.epic().create_issues_checkpointed(journal)
+
+        journal.clear()
+
+        self.assertEqual(journal.load(), {})
+        self.assertNotIn("issue_checkpoint", self.db.store["epics/Test Epic"])
+
+
+if __name__ == '__main__':
+    unittest.main()
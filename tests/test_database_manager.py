@@ -0,0 +1,318 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import metrics
+from database.async_manager import AsyncDatabaseManager
+from database.index import LocalSnapshotListener
+from database.manager import (DatabaseManager, close_shared_managers, create_backend, sparse_positions,
+                              task_document_id)
+from benchmarks.fake_firestore import FakeFirestore, FakeAsyncFirestore
+
+
+class TestDatabaseManager(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeFirestore()
+        patcher = patch("database.manager.initfirebase", return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(close_shared_managers)
+
+        self.manager = DatabaseManager("epics", "Test Epic")
+        self.epic = SimpleNamespace(title="Test Epic", problem="Problem", feature="Feature", value="Value")
+        self.tasks = [
+            {"title": "Task 1", "issueID": 1, "priority": "High", "description": "First", "story_point": 3},
+            {"title": "Task 2", "issueID": "", "priority": "Low", "description": "Second", "story_point": 5},
+            {"title": "Task 3", "issueID": 3, "priority": "Medium", "description": "Third", "story_point": 8},
+        ]
+
+    def test_add_to_db_stores_one_document_per_task(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+
+        self.assertNotIn("tasks", self.db.store["epics/Test Epic"])
+        self.assertIn("epics/Test Epic/tasks/1", self.db.store)
+        self.assertIn(f"epics/Test Epic/tasks/{task_document_id(self.tasks[1])}", self.db.store)
+        self.assertEqual(self.manager.fetch_database()["tasks"], self.tasks)
+
+    def test_get_task_reads_a_single_document(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+        self.db.reads = 0
+
+        self.assertEqual(self.manager.get_task_with_id(3), self.tasks[2])
+        self.assertEqual(self.manager.get_task_with_title("Task 2"), self.tasks[1])
+        self.assertIsNone(self.manager.get_task_with_id(42))
+        self.assertEqual(self.db.reads, 3)
+
+    def test_update_tasks_writes_only_changed_fields(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+        self.db.writes = 0
+
+        DatabaseManager.update_tasks("epics", "Test Epic", "Task 3", {"priority": "Low", "description": None})
+
+        self.assertEqual(self.db.writes, 1)
+        self.assertEqual(self.manager.get_task_with_id(3)["priority"], "Low")
+        self.assertEqual(self.manager.get_task_with_id(3)["description"], "Third")
+
+    def test_update_tasks_reuses_the_manager(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+
+        with patch("database.manager.create_backend", wraps=create_backend) as backends:
+            DatabaseManager.update_tasks("epics", "Test Epic", "Task 1", {"priority": "Low"})
+            DatabaseManager.update_tasks("epics", "Test Epic", "Task 3", {"priority": "Low"})
+
+        self.assertEqual(backends.call_count, 1)
+        self.assertEqual(self.manager.get_task_with_id(3)["priority"], "Low")
+
+    def test_update_db_moves_tasks_that_got_an_issue(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+        self.tasks[1]["issueID"] = 2
+
+        self.manager.update_db({"title": "Renamed", "tasks": self.tasks})
+
+        self.assertEqual(self.manager.get_task_with_id(2)["title"], "Task 2")
+        self.assertEqual(len(self.manager.backend.task_ids()), 3)
+        self.assertEqual(self.manager.fetch_database()["title"], "Renamed")
+
+    def test_update_db_reports_failures(self):
+        self.assertTrue(self.manager.update_db({"tasks": self.tasks}))
+
+        with patch.object(self.manager.backend, "commit", side_effect=RuntimeError("unavailable")):
+            self.assertFalse(self.manager.update_db({"title": "Renamed"}))
+
+    def test_migrate_tasks_to_subcollection(self):
+        self.db.store["epics/Test Epic"] = {"title": "Test Epic", "problem": "Problem", "feature": "Feature",
+                                            "value": "Value", "tasks": self.tasks}
+
+        self.assertEqual(self.manager.migrate_tasks_to_subcollection(), 3)
+
+        self.assertNotIn("tasks", self.db.store["epics/Test Epic"])
+        self.assertEqual(self.manager.fetch_database()["tasks"], self.tasks)
+        self.assertEqual(self.manager.migrate_tasks_to_subcollection(), 0)
+
+    def test_add_to_db_writes_streamed_tasks_batch_by_batch(self):
+        commits_seen = []
+
+        def tasks():
+            for i in range(1200):
+                commits_seen.append(self.db.commits)
+                yield {"title": f"Task {i}", "issueID": i}
+
+        self.manager.add_to_db(self.epic, tasks())
+
+        # The epic document is written in the first batch, along with the first 499 tasks
+        self.assertEqual(self.db.commits, 3)
+        self.assertEqual(commits_seen[498], 0)
+        self.assertEqual(commits_seen[499], 1)
+        self.assertEqual(len(self.manager.get_tasks()), 1200)
+
+    def test_sync_tasks_writes_nothing_when_unchanged(self):
+        tasks = [{"title": f"Task {i}", "issueID": "", "priority": "High", "description": f"Task number {i}",
+                  "story_point": i % 8} for i in range(1000)]
+        self.assertEqual(self.manager.sync_tasks(self.epic, tasks)["added"], 1000)
+        self.db.reads, self.db.writes = 0, 0
+
+        summary = self.manager.sync_tasks(self.epic, tasks)
+
+        self.assertEqual(summary, {"added": 0, "changed": 0, "removed": 0, "unchanged": 1000})
+        # The epic document, and the hash and position of every task
+        self.assertEqual((self.db.reads, self.db.writes), (1001, 0))
+
+    def test_sync_tasks_writes_only_changed_tasks(self):
+        self.manager.sync_tasks(self.epic, self.tasks)
+        self.db.writes = 0
+        self.tasks[2]["priority"] = "Low"
+
+        summary = self.manager.sync_tasks(self.epic, self.tasks)
+
+        self.assertEqual(summary["changed"], 1)
+        self.assertEqual(self.db.writes, 1)
+        self.assertEqual(self.manager.get_task_with_id(3)["priority"], "Low")
+
+    def test_sync_tasks_only_writes_inserted_and_moved_tasks(self):
+        tasks = [{"title": f"Task {i}", "issueID": i, "priority": "High"} for i in range(100)]
+        self.manager.sync_tasks(self.epic, tasks)
+        self.db.writes = 0
+
+        tasks = tasks[:10] + [{"title": "Inserted", "issueID": 100}] + tasks[10:99]
+        tasks.insert(50, tasks.pop())
+        summary = self.manager.sync_tasks(self.epic, tasks)
+
+        self.assertEqual(summary, {"added": 1, "changed": 1, "removed": 1, "unchanged": 98})
+        self.assertEqual(self.db.writes, 3)
+        self.assertEqual(self.manager.get_tasks(), tasks)
+
+    def test_sync_tasks_writes_streamed_tasks_window_by_window(self):
+        commits_seen = []
+
+        def tasks(inserted=None):
+            for i in range(1200):
+                commits_seen.append(self.db.commits)
+                if i == 700 and inserted:
+                    yield inserted
+                yield {"title": f"Task {i}", "issueID": i}
+
+        self.manager.sync_tasks(self.epic, tasks())
+        # The first tasks are written before the last ones are read
+        self.assertGreater(commits_seen[-1], 0)
+        self.db.writes = 0
+
+        summary = self.manager.sync_tasks(self.epic, tasks({"title": "Inserted", "issueID": 1200}))
+
+        self.assertEqual(summary, {"added": 1, "changed": 0, "removed": 0, "unchanged": 1200})
+        self.assertEqual(self.db.writes, 1)
+        self.assertEqual(self.manager.get_tasks()[700]["title"], "Inserted")
+
+    def test_sync_tasks_removes_hashes_from_the_epic(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+        self.db.store["epics/Test Epic"]["task_hashes"] = {"1": ["title", "hash"]}
+
+        self.manager.sync_tasks(self.epic, self.tasks)
+
+        self.assertNotIn("task_hashes", self.db.store["epics/Test Epic"])
+        self.assertEqual(self.manager.fetch_database()["tasks"], self.tasks)
+
+    def test_sync_tasks_adds_and_removes_tasks(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+        tasks = self.tasks[1:] + [{"title": "Task 4", "issueID": 4, "priority": "Low"}]
+
+        summary = self.manager.sync_tasks(self.epic, tasks)
+
+        self.assertEqual((summary["added"], summary["removed"]), (1, 1))
+        self.assertIsNone(self.manager.get_task_with_id(1))
+        self.assertEqual(self.manager.fetch_database()["tasks"], tasks)
+
+    def test_sync_tasks_keeps_issue_ids_written_back(self):
+        self.manager.sync_tasks(self.epic, self.tasks)
+        created = [dict(task, issueID=task["issueID"] or 2) for task in self.tasks]
+        self.manager.update_db({"tasks": created})
+        self.tasks[1]["description"] = "Changed in the sheet"
+
+        summary = self.manager.sync_tasks(self.epic, self.tasks)
+
+        self.assertEqual(summary["changed"], 1)
+        self.assertEqual(len(self.manager.backend.task_ids()), 3)
+        self.assertEqual(self.manager.get_task_with_id(2)["description"], "Changed in the sheet")
+
+    def test_tasks_sharing_a_title_are_all_kept(self):
+        tasks = [{"title": "Same", "priority": "High"}, {"title": "Same", "priority": "Low"},
+                 {"title": None, "priority": "High"}, {"title": None, "priority": "Low"}]
+
+        self.manager.add_to_db(self.epic, tasks)
+        self.assertEqual(self.manager.get_tasks(), tasks)
+
+        tasks[1]["priority"] = "Medium"
+        summary = self.manager.sync_tasks(self.epic, tasks)
+
+        self.assertEqual(summary, {"added": 0, "changed": 1, "removed": 0, "unchanged": 3})
+        self.assertEqual(self.manager.get_tasks(), tasks)
+        self.assertEqual(len(self.manager.backend.task_ids()), 4)
+
+    def test_firestore_calls_are_timed(self):
+        commits = metrics.outbound_call_seconds.count(service="firestore", call="commit")
+        queries = metrics.outbound_call_seconds.count(service="firestore", call="query")
+
+        self.manager.add_to_db(self.epic, self.tasks)
+        self.manager.get_task_with_title("Task 2")
+
+        self.assertEqual(metrics.outbound_call_seconds.count(service="firestore", call="commit"), commits + 1)
+        self.assertEqual(metrics.outbound_call_seconds.count(service="firestore", call="query"), queries + 1)
+
+    def test_delete_epic_deletes_tasks(self):
+        self.manager.add_to_db(self.epic, self.tasks)
+
+        self.manager.delete_epic()
+
+        self.assertEqual(self.db.store, {})
+
+
+class TestSparsePositions(unittest.TestCase):
+    def test_keeps_positions_of_tasks_in_order(self):
+        self.assertEqual(sparse_positions([0, 1024, 2048]), [0, 1024, 2048])
+        self.assertEqual(sparse_positions([None, None]), [0, 1024])
+
+    def test_fits_new_tasks_between_the_others(self):
+        self.assertEqual(sparse_positions([None, 0, None, None, 9, None]), [-1024, 0, 3, 6, 9, 1033])
+
+    def test_moves_only_tasks_out_of_order(self):
+        self.assertEqual(sparse_positions([3072, 0, 1024, 2048]), [-1024, 0, 1024, 2048])
+        # There is no room between 0 and 1 for the task in between, so one of them moves
+        self.assertEqual(sparse_positions([0, None, 1, 2]), [-2047, -1023, 1, 2])
+
+    def test_positions_follow_start(self):
+        self.assertEqual(sparse_positions([0, 2048, 3072], start=1024), [1536, 2048, 3072])
+        self.assertEqual(sparse_positions([None, 1025], start=1024), [2048, 3072])
+
+
+class TestTaskIndex(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeFirestore()
+        patcher = patch("database.manager.initfirebase", return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(close_shared_managers)
+
+        epic = SimpleNamespace(title="Test Epic", problem="Problem", feature="Feature", value="Value")
+        self.tasks = [{"title": f"Task {i}", "issueID": i, "priority": "High"} for i in range(1, 101)]
+        DatabaseManager("epics", "Test Epic").add_to_db(epic, self.tasks)
+
+        self.manager = DatabaseManager("epics", "Test Epic", use_index=True, listener=LocalSnapshotListener)
+        self.addCleanup(self.manager.close)
+        self.db.reads = 0
+
+    def test_lookups_are_served_from_the_index(self):
+        self.assertEqual(self.manager.get_task_with_id(42), self.tasks[41])
+        self.assertEqual(self.manager.get_task_with_title("Task 7"), self.tasks[6])
+        self.assertEqual(self.manager.get_tasks_by_ids([3, 5, 500]), {3: self.tasks[2], 5: self.tasks[4]})
+        self.assertEqual(self.db.reads, 0)
+
+    def test_index_follows_changes(self):
+        DatabaseManager.update_tasks("epics", "Test Epic", "Task 7", {"title": "Renamed"})
+        self.manager.backend.tasks_ref.document("8").delete()
+
+        self.manager.watch.refresh()
+
+        self.assertEqual(self.manager.get_task_with_id(7)["title"], "Renamed")
+        self.assertEqual(self.manager.get_task_with_title("Renamed")["issueID"], 7)
+        self.assertIsNone(self.manager.get_task_with_title("Task 7"))
+        self.assertIsNone(self.manager.get_task_with_id(8))
+
+    def test_get_tasks_by_ids_without_index(self):
+        manager = DatabaseManager("epics", "Test Epic")
+
+        self.assertEqual(manager.get_tasks_by_ids([1, 2]), {1: self.tasks[0], 2: self.tasks[1]})
+
+
+class TestAsyncDatabaseManager(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.db = FakeFirestore()
+        with patch("database.manager.initfirebase", return_value=self.db):
+            epic = SimpleNamespace(title="Test Epic", problem="Problem", feature="Feature", value="Value")
+            self.tasks = [{"title": f"Task {i}", "issueID": i, "priority": "High"} for i in range(1, 4)]
+            DatabaseManager("epics", "Test Epic").add_to_db(epic, self.tasks)
+
+        self.manager = AsyncDatabaseManager("epics", "Test Epic", db=FakeAsyncFirestore(self.db))
+
+    async def test_fetch_database(self):
+        data = await self.manager.fetch_database()
+
+        self.assertEqual(data["title"], "Test Epic")
+        self.assertEqual(data["tasks"], self.tasks)
+
+    async def test_get_task(self):
+        self.assertEqual(await self.manager.get_task_with_id(2), self.tasks[1])
+        self.assertEqual(await self.manager.get_task_with_title("Task 3"), self.tasks[2])
+        self.assertIsNone(await self.manager.get_task_with_title("Missing"))
+
+    async def test_update_tasks_skips_unchanged_values(self):
+        self.db.writes = 0
+
+        await self.manager.update_tasks("Task 1", {"priority": "High", "description": None})
+        self.assertEqual(self.db.writes, 0)
+
+        await self.manager.update_tasks("Task 1", {"priority": "Low"})
+        self.assertEqual(self.db.writes, 1)
+        self.assertEqual((await self.manager.get_task_with_id(1))["priority"], "Low")
+
+
+if __name__ == '__main__':
+    unittest.main()
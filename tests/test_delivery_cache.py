@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+from delivery_cache import DeliveryCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeliveryCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_recognizes_processed_deliveries(self):
+        cache = DeliveryCache(clock=self.clock)
+
+        cache.add("a")
+
+        self.assertFalse(cache.reserve("a"))
+        self.assertTrue(cache.reserve("b"))
+        self.assertTrue(cache.reserve(None))
+        self.assertEqual(cache.stats(), {"size": 1, "duplicates": 1})
+
+    def test_reserves_deliveries_being_processed(self):
+        cache = DeliveryCache(clock=self.clock)
+        self.assertTrue(cache.reserve("a"))
+        self.assertFalse(cache.reserve("a"))
+
+        cache.release("a")
+        self.assertTrue(cache.reserve("a"))
+        cache.add("a")
+
+        self.assertFalse(cache.reserve("a"))
+        self.assertEqual(cache.processing, set())
+        self.assertEqual(cache.stats(), {"size": 1, "duplicates": 2})
+
+    def test_forgets_least_recently_seen_deliveries(self):
+        cache = DeliveryCache(max_size=2, clock=self.clock)
+        cache.add("a")
+        cache.add("b")
+        self.assertFalse(cache.reserve("a"))
+
+        cache.add("c")
+
+        self.assertFalse(cache.reserve("a"))
+        self.assertTrue(cache.reserve("b"))
+
+    def test_forgets_expired_deliveries(self):
+        cache = DeliveryCache(ttl=60, clock=self.clock)
+        cache.add("a")
+        self.clock.now += 30
+        cache.add("b")
+        self.clock.now += 45
+
+        self.assertTrue(cache.reserve("a"))
+        self.assertFalse(cache.reserve("b"))
+        cache.add("c")
+        self.assertEqual(list(cache.seen), ["b", "c"])
+
+    def test_survives_restarts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "deliveries.jsonl")
+            cache = DeliveryCache(max_size=2, ttl=60, path=path, clock=self.clock)
+            for delivery_id in ("a", "b", "c", "d", "e"):
+                cache.add(delivery_id)
+            cache.flush()
+            with open(path, "a", encoding="utf-8") as journal:
+                journal.write('{"id": "f", "ti')
+
+            restarted = DeliveryCache(max_size=2, ttl=60, path=path, clock=self.clock)
+
+            self.assertEqual(list(restarted.seen), ["d", "e"])
+            self.clock.now += 61
+            self.assertTrue(DeliveryCache(path=path, ttl=60, clock=self.clock).reserve("e"))
+            with open(path, encoding="utf-8") as journal:
+                # Compacted once it held twice as many ids as are remembered
+                self.assertLessEqual(len(journal.readlines()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+
+from delivery_queue import DeliveryQueue
+
+
+class TestDeliveryQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.applied = []
+        self.queue = DeliveryQueue(self.apply)
+
+    async def apply(self, task_title, update):
+        await asyncio.sleep(0)
+        self.applied.append((task_title, update))
+
+    async def test_coalesces_pending_updates_per_issue(self):
+        self.queue.enqueue(1, "Task 1", {"priority": "High", "comments": None})
+        self.queue.enqueue(1, "Task 1", {"priority": "Low", "description": "Typing"})
+        self.queue.enqueue(1, "Task 1", {"title": "Renamed", "description": "Typing..."})
+        self.queue.enqueue(2, "Task 2", {"priority": "Low"})
+        self.assertEqual(self.queue.stats()["depth"], 2)
+
+        self.queue.start()
+        await self.queue.stop()
+
+        self.assertEqual(self.applied, [
+            ("Task 1", {"priority": "Low", "description": "Typing...", "title": "Renamed"}),
+            ("Task 2", {"priority": "Low"}),
+        ])
+        self.assertEqual(self.queue.stats(), {"depth": 0, "received": 4, "coalesced": 2, "applied": 2,
+                                              "failed": 0, "coalescing_ratio": 0.5})
+
+    async def test_failed_updates_do_not_stop_the_worker(self):
+        async def apply(task_title, update):
+            if task_title == "Task 1":
+                raise RuntimeError("Firestore unavailable")
+            self.applied.append((task_title, update))
+
+        self.queue.apply = apply
+        self.queue.start()
+        self.queue.enqueue(1, "Task 1", {"priority": "High"})
+        self.queue.enqueue(2, "Task 2", {"priority": "Low"})
+        await self.queue.stop()
+
+        self.assertEqual(self.applied, [("Task 2", {"priority": "Low"})])
+        self.assertEqual(self.queue.stats()["failed"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,13 @@
+import json
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 import httpx
 
+from epics.base_epic import body_hash
+from epics.github_epic import github_epic
+from epics.rate_limit import RateLimiter
+
 class TestCreateGithubIssues(unittest.TestCase):
     def setUp(self):
         # Setup any necessary data for the tests
@@ -93,5 +99,243 @@ class TestCreateGithubIssues(unittest.TestCase):
         )
         return body
 
+class TestCreateIssuesAsync(unittest.TestCase):
+    def setUp(self):
+        self.epic = github_epic("test_owner", "test_repo", "test_token", "Epic", "Problem", "Feature", "Value")
+        for i in range(10):
+            self.epic.add_task({"title": f"Task {i}", "description": "Description", "priority": "High"})
+        self.requests = []
+
+    def handler(self, request):
+        self.requests.append(request)
+        title = json.loads(request.content)["title"]
+        return httpx.Response(201, json={"number": int(title.split()[-1]) + 100})
+
+    def test_sets_issue_ids(self):
+        self.epic.transport = httpx.MockTransport(self.handler)
+
+        self.epic.create_issues_concurrently(max_concurrency=3)
+
+        self.assertEqual(len(self.requests), 10)
+        self.assertEqual([task["issueID"] for task in self.epic.tasks], list(range(100, 110)))
+        self.assertEqual(self.requests[0].headers["Authorization"], "Bearer test_token")
+
+    def test_retries_when_rate_limited(self):
+        responses = [httpx.Response(429, headers={"Retry-After": "0"})]
+
+        def handler(request):
+            if responses:
+                return responses.pop()
+            return self.handler(request)
+
+        self.epic.tasks = self.epic.tasks[:1]
+        self.epic.transport = httpx.MockTransport(handler)
+
+        self.epic.create_issues_concurrently()
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.epic.tasks[0]["issueID"], 100)
+
+    def test_failure_leaves_task_untouched(self):
+        self.epic.tasks = self.epic.tasks[:1]
+        self.epic.transport = httpx.MockTransport(lambda request: httpx.Response(422, text="Validation Failed"))
+
+        self.epic.create_issues_concurrently()
+
+        self.assertNotIn("issueID", self.epic.tasks[0])
+
+
+class TestIterIssues(unittest.TestCase):
+    def setUp(self):
+        self.epic = github_epic("test_owner", "test_repo", "test_token", "Epic", "Problem", "Feature", "Value")
+        self.issues = [
+            {"number": i, "title": f"Task {i}", "body": self.epic.format_body({"priority": "High", "story_point": i})}
+            for i in range(1, 251)
+        ]
+        self.issues.append({"number": 251, "title": "A pull request", "body": None, "pull_request": {}})
+        self.requests = []
+        self.epic.transport = httpx.MockTransport(self.handler)
+
+    def handler(self, request):
+        self.requests.append(request)
+        page = int(request.url.params["page"])
+        per_page = int(request.url.params["per_page"])
+        etag = f'"page-{page}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+
+        last_page = (len(self.issues) + per_page - 1) // per_page
+        headers = {"ETag": etag}
+        if page < last_page:
+            headers["Link"] = (f'<{self.epic.issues_url}?page={page + 1}>; rel="next", '
+                               f'<{self.epic.issues_url}?page={last_page}>; rel="last"')
+        return httpx.Response(200, headers=headers, json=self.issues[(page - 1) * per_page:page * per_page])
+
+    def test_follows_pages_and_returns_tasks(self):
+        tasks = self.epic.get_issues()
+
+        self.assertEqual(sorted(int(request.url.params["page"]) for request in self.requests), [1, 2, 3])
+        self.assertEqual([task["issueID"] for task in tasks], list(range(1, 251)))
+        self.assertEqual(tasks[9], {"title": "Task 10", "issueID": 10, "description": "No description provided",
+                                    "priority": "High", "story_point": 10, "comments": "No comments",
+                                    "state": "open", "body_hash": body_hash("Task 10", self.issues[9]["body"])})
+
+    def test_repoll_uses_etags(self):
+        first = self.epic.get_issues()
+        self.requests.clear()
+
+        second = self.epic.get_issues()
+
+        self.assertTrue(all(request.headers.get("If-None-Match") for request in self.requests))
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(first, second)
+
+
+class TestCloseAllIssues(unittest.TestCase):
+    def setUp(self):
+        self.epic = github_epic("test_owner", "test_repo", "test_token", "Epic", "Problem", "Feature", "Value")
+        self.open_issues = {i: {"number": i, "title": f"Task {i}", "body": ""} for i in range(1, 151)}
+        self.patches = []
+        self.epic.transport = httpx.MockTransport(self.handler)
+
+    def handler(self, request):
+        if request.method == "PATCH":
+            number = int(request.url.path.rsplit("/", 1)[-1])
+            self.patches.append(number)
+            if number == 13:
+                return httpx.Response(410, text="Gone")
+            self.open_issues.pop(number)
+            return httpx.Response(200, json={"number": number, "state": "closed"})
+
+        page = int(request.url.params["page"])
+        issues = sorted(self.open_issues.values(), key=lambda issue: issue["number"])
+        headers = {}
+        if len(issues) > 100 and page == 1:
+            headers["Link"] = f'<{self.epic.issues_url}?page=2>; rel="last"'
+        return httpx.Response(200, headers=headers, json=issues[(page - 1) * 100:page * 100])
+
+    def test_closes_every_open_issue(self):
+        summary = self.epic.close_all_issues()
+
+        self.assertEqual(sorted(self.patches), list(range(1, 151)))
+        self.assertEqual(sorted(summary["closed"]), [i for i in range(1, 151) if i != 13])
+        self.assertEqual(summary["failed"], [{"issueID": 13, "status": 410, "error": "Gone"}])
+        self.assertEqual(list(self.open_issues), [13])
+
+    def test_only_epic_issues(self):
+        self.epic.add_task({"title": "Task 5", "issueID": 5})
+        self.epic.add_task({"title": "Task 120", "issueID": 120})
+        self.epic.add_task({"title": "Not created yet"})
+
+        summary = self.epic.close_all_issues(only_epic=True)
+
+        self.assertEqual(sorted(summary["closed"]), [5, 120])
+        self.assertEqual(len(self.open_issues), 148)
+
+
+class TestReconcile(unittest.TestCase):
+    def setUp(self):
+        self.epic = github_epic("test_owner", "test_repo", "test_token", "Epic", "Problem", "Feature", "Value")
+        for i in range(1, 6):
+            self.epic.add_task({"title": f"Task {i}", "description": "Description", "priority": "High"})
+        self.issues = {}
+        self.reads = 0
+        self.writes = []
+        self.listing_fails = False
+        self.epic.transport = httpx.MockTransport(self.handler)
+
+    def handler(self, request):
+        if request.method == "GET":
+            self.reads += 1
+            if self.listing_fails:
+                return httpx.Response(500, text="Server Error")
+            return httpx.Response(200, json=sorted(self.issues.values(), key=lambda issue: issue["number"]))
+
+        self.writes.append((request.method, request.url.path))
+        data = json.loads(request.content)
+        if request.method == "POST":
+            number = len(self.issues) + 1
+            self.issues[number] = {"number": number, "state": "open", **data}
+            return httpx.Response(201, json=self.issues[number])
+        number = int(request.url.path.rsplit("/", 1)[-1])
+        self.issues[number].update(data)
+        return httpx.Response(200, json=self.issues[number])
+
+    def test_creates_missing_issues(self):
+        summary = self.epic.reconcile()
+
+        self.assertEqual(summary["created"], 5)
+        self.assertEqual(sorted(task["issueID"] for task in self.epic.tasks), [1, 2, 3, 4, 5])
+        self.assertTrue(all(task["body_hash"] for task in self.epic.tasks))
+
+    def test_unchanged_epic_makes_no_calls(self):
+        self.epic.reconcile()
+        self.reads = 0
+        self.writes.clear()
+
+        summary = self.epic.reconcile()
+
+        self.assertEqual((self.reads, self.writes), (0, []))
+        self.assertEqual(summary, {"created": 0, "updated": 0, "closed": 0, "unchanged": 5})
+
+    def test_updates_changed_and_closes_removed_issues(self):
+        self.epic.reconcile()
+        self.writes.clear()
+        task = next(task for task in self.epic.tasks if task["title"] == "Task 2")
+        task["priority"] = "Low"
+        removed = next(task for task in self.epic.tasks if task["title"] == "Task 4")["issueID"]
+        self.epic.remove_task("Task 4")
+
+        summary = self.epic.reconcile()
+
+        self.assertEqual(sorted(path.rsplit("/", 1)[-1] for method, path in self.writes),
+                         sorted([str(removed), str(task["issueID"])]))
+        self.assertEqual((summary["updated"], summary["closed"]), (1, 1))
+        self.assertIn("Priority:** Low", self.issues[task["issueID"]]["body"])
+        self.assertEqual(self.issues[removed]["state"], "closed")
+
+        self.writes.clear()
+        self.epic.reconcile()
+        self.assertEqual(self.writes, [])
+
+    def test_failed_listing_changes_nothing(self):
+        self.epic.reconcile()
+        self.writes.clear()
+        task = self.epic.tasks[0]
+        issue_id = task["issueID"]
+        task["priority"] = "Low"
+        self.epic.remove_task("Task 4")
+        self.listing_fails = True
+
+        self.assertIsNone(self.epic.reconcile())
+
+        self.assertEqual(self.writes, [])
+        self.assertEqual(task["issueID"], issue_id)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_no_delay_with_budget_left(self):
+        limiter = RateLimiter()
+        limiter.update(httpx.Response(201, headers={"X-RateLimit-Remaining": "10",
+                                                    "X-RateLimit-Reset": str(int(time.time()) + 60)}))
+        self.assertEqual(limiter.delay(), 0)
+
+    def test_waits_for_reset_when_exhausted(self):
+        limiter = RateLimiter()
+        rate_limited = limiter.update(httpx.Response(403, headers={"X-RateLimit-Remaining": "0",
+                                                                   "X-RateLimit-Reset": str(int(time.time()) + 60)}))
+        self.assertTrue(rate_limited)
+        self.assertGreater(limiter.delay(), 50)
+
+    def test_retry_after(self):
+        limiter = RateLimiter()
+        self.assertTrue(limiter.update(httpx.Response(429, headers={"Retry-After": "30"})))
+        self.assertGreater(limiter.delay(), 25)
+
+    def test_plain_forbidden_is_not_rate_limited(self):
+        limiter = RateLimiter()
+        self.assertFalse(limiter.update(httpx.Response(403, headers={"X-RateLimit-Remaining": "100"})))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from metrics import Registry
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.requests = self.registry.counter("requests_total", "Requests", ["action"])
+        self.latency = self.registry.histogram("stage_seconds", "Latency", ["stage"], buckets=(0.1, 0.2, 0.5))
+
+    def test_counter(self):
+        self.requests.inc(action="edited")
+        self.requests.inc(2, action="edited")
+        self.requests.inc(action="opened")
+
+        self.assertEqual(self.requests.get(action="edited"), 3)
+        self.assertIn('requests_total{action="edited"} 3', self.registry.render())
+        with self.assertRaises(ValueError):
+            self.requests.inc(stage="parse")
+
+    def test_histogram_buckets_and_quantiles(self):
+        for value in [0.05] * 50 + [0.15] * 40 + [0.4] * 9 + [3.0]:
+            self.latency.observe(value, stage="parse")
+
+        self.assertEqual(self.latency.count(stage="parse"), 100)
+        self.assertAlmostEqual(self.latency.quantile(0.5, stage="parse"), 0.1)
+        self.assertAlmostEqual(self.latency.quantile(0.95, stage="parse"), 0.2 + 0.3 * 5 / 9)
+        self.assertEqual(self.latency.quantile(0.99, stage="parse"), 0.5)
+
+        text = self.registry.render()
+        self.assertIn("# TYPE stage_seconds histogram", text)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="0.2"} 90', text)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="+Inf"} 100', text)
+        self.assertIn('stage_seconds_count{stage="parse"} 100', text)
+        self.assertIn('stage_seconds_quantile{stage="parse",quantile="0.5"} 0.1', text)
+
+    def test_time_observes_when_raising(self):
+        with self.assertRaises(KeyError):
+            with self.latency.time(stage="update"):
+                raise KeyError()
+
+        self.assertEqual(self.latency.count(stage="update"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
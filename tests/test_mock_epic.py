@@ -46,6 +46,15 @@ class TestMockEpic(unittest.TestCase):
         self.assertEqual(tasks[0]["title"], "Task Title")
         logger.info(f"Verified first task title: {tasks[0]['title']}")
 
+    def test_reconcile(self):
+        logger.info("Running test_reconcile...")
+        self.base_epic.add_task({"title": "Task Title", "priority": "High"})
+        summary = self.base_epic.reconcile()
+        logger.debug(f"Reconciled: {summary}")
+        self.assertEqual(summary["created"], 1)
+        self.assertEqual(self.base_epic.reconcile()["unchanged"], 1)
+        logger.info("Verified the issue is created once")
+
 if __name__ == '__main__':
     logger.info("Starting unit test execution...")
     unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from Google import sheets
+from database.manager import DatabaseManager
+from database.pipeline import ImportTarget, import_spreadsheets, load_manifest
+from benchmarks.fake_firestore import FakeFirestore
+from tests.test_sheets import EPIC_VALUES, TASK_VALUES
+
+
+def fake_get_sheets(sheet_names, spreadsheet_id):
+    if spreadsheet_id == "broken":
+        raise ValueError("no such spreadsheet")
+    epic_values = [list(row) for row in EPIC_VALUES]
+    epic_values[2][1] = f"Epic {spreadsheet_id}"
+    return {"Epic": sheets.Sheet(epic_values[0], epic_values[1:]),
+            "Tasks": sheets.Sheet(TASK_VALUES[0], TASK_VALUES[1:])}
+
+
+class TestImportSpreadsheets(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeFirestore()
+        patcher = patch("database.manager.initfirebase", return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("Google.sheets.get_sheets", side_effect=fake_get_sheets)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_imports_every_spreadsheet_into_its_document(self):
+        targets = [ImportTarget(f"sheet{i}", "epics", f"Epic {i}") for i in range(5)]
+
+        results = import_spreadsheets(targets, max_workers=3)
+
+        self.assertEqual([result.target for result in results], targets)
+        for i, result in enumerate(results):
+            self.assertIsNone(result.error)
+            self.assertEqual(result.summary["added"], 2)
+            self.assertEqual(set(result.timings), {"fetch", "transform", "write"})
+            self.assertEqual(self.db.store[f"epics/Epic {i}"]["title"], f"Epic sheet{i}")
+
+    def test_failing_spreadsheet_does_not_stop_the_others(self):
+        targets = [ImportTarget("broken", "epics", "Broken"), ImportTarget("sheet", "epics", "Epic")]
+
+        broken, imported = import_spreadsheets(targets)
+
+        self.assertEqual(broken.error, "fetch failed: no such spreadsheet")
+        self.assertNotIn("epics/Broken", self.db.store)
+        self.assertIsNone(imported.error)
+
+    def test_closes_every_manager(self):
+        managers = []
+
+        def manager_factory(db_collection, db_document):
+            managers.append(MagicMock(wraps=DatabaseManager(db_collection, db_document)))
+            return managers[-1]
+
+        targets = [ImportTarget("broken", "epics", "Broken")] + [ImportTarget(f"sheet{i}", "epics", f"Epic {i}")
+                                                                  for i in range(3)]
+        import_spreadsheets(targets, max_workers=2, manager_factory=manager_factory)
+
+        self.assertEqual(len(managers), 3)
+        for manager in managers:
+            manager.close.assert_called_once_with()
+
+    def test_load_manifest(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as manifest:
+            json.dump({"sheet": {"collection": "epics", "document": "Epic"}}, manifest)
+        self.addCleanup(os.remove, manifest.name)
+
+        self.assertEqual(load_manifest(manifest.name), [ImportTarget("sheet", "epics", "Epic")])
+
+
+if __name__ == '__main__':
+    unittest.main()
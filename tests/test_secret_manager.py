@@ -0,0 +1,57 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import secret_manager
+
+
+class TestSecretCache(unittest.TestCase):
+    def setUp(self):
+        secret_manager.clear_secret_cache()
+        self.addCleanup(secret_manager.clear_secret_cache)
+        patcher = patch.object(secret_manager, "_client", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = MagicMock()
+        self.client.access_secret_version.side_effect = self.access_secret_version
+        patcher = patch("google.cloud.secretmanager.SecretManagerServiceClient", return_value=self.client)
+        self.client_class = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def access_secret_version(self, name):
+        time.sleep(0.05)
+        response = MagicMock()
+        response.payload.data = b'{"token": "secret"}'
+        return response
+
+    def test_secrets_are_cached(self):
+        first = secret_manager.access_secret_version("project", "secret", "latest")
+        second = secret_manager.access_secret_version_json("project", "secret", "latest")
+
+        self.assertEqual(first, '{"token": "secret"}')
+        self.assertEqual(second, {"token": "secret"})
+        self.assertEqual(self.client.access_secret_version.call_count, 1)
+        self.client_class.assert_called_once()
+
+    def test_expired_secrets_are_fetched_again(self):
+        secret_manager.access_secret_version("project", "secret", "latest", ttl=0)
+        secret_manager.access_secret_version("project", "secret", "latest", ttl=0)
+
+        self.assertEqual(self.client.access_secret_version.call_count, 2)
+        self.client_class.assert_called_once()
+
+    def test_concurrent_misses_share_one_fetch(self):
+        threads = [threading.Thread(target=secret_manager.access_secret_version, args=("project", "secret", "latest"))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.client.access_secret_version.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
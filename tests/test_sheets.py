@@ -0,0 +1,219 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from Google import sheets
+from Google.sheet_cache import SheetCache
+
+EPIC_VALUES = [
+    ["Field", "B"],
+    ["Epic", ""],
+    ["Title", "Test Epic"],
+    ["Problem", "Problem"],
+    ["Feature", "Feature"],
+    ["Value", "Value"],
+]
+
+TASK_VALUES = [
+    ["Title", "Description", "Priority", "Story Point", "Issue ID", "Duplicate / Comments"],
+    ["Task 1", "First task", "High", "3", "", "None"],
+    ["Task 2", "Second task", "Low", " 5 "],
+]
+
+
+class TestSheet(unittest.TestCase):
+    def setUp(self):
+        self.sheet = sheets.Sheet(TASK_VALUES[0], [list(row) for row in TASK_VALUES[1:]])
+
+    def test_rows(self):
+        self.assertEqual(len(self.sheet), 2)
+        self.assertEqual(self.sheet[0].index, 2)
+        self.assertEqual(self.sheet[0]["Story Point"], 3)
+        self.assertEqual(self.sheet.row(1).values, {"title": "Task 2", "description": "Second task", "priority": "Low",
+                                                    "story point": 5, "issue id": None, "duplicate / comments": None})
+        self.assertEqual([row["title"] for row in self.sheet], ["Task 1", "Task 2"])
+        with self.assertRaises(IndexError):
+            self.sheet.row(2)
+
+    def test_columns(self):
+        self.assertEqual(list(self.sheet["Priority"]), ["High", "Low"])
+        self.assertEqual(self.sheet.column("Missing", alternatively="Title")[1], "Task 2")
+        self.assertEqual([column.header for column in self.sheet.columns()], [
+            "title", "description", "priority", "story point", "issue id", "duplicate / comments"
+        ])
+
+    def test_row_index(self):
+        self.assertEqual(self.sheet.row_index("Title", "Task 2"), 3)
+        self.assertEqual(self.sheet.row_index("Story Point", 3), 2)
+        with self.assertRaises(IndexError):
+            self.sheet.row_index("Title", "Task 3")
+
+    def test_cells_beyond_the_headers(self):
+        sheet = sheets.Sheet(["A"], [["1", "extra"], ["2"]])
+
+        self.assertEqual(sheet.row(0).values, {"a": 1, None: "extra"})
+        self.assertEqual(sheet.row(1).values, {"a": 2})
+
+    def test_only_ascii_digits_are_numbers(self):
+        sheet = sheets.Sheet(["A"], [["¹³"], ["007"]])
+
+        self.assertEqual(list(sheet["A"]), ["¹³", 7])
+
+
+class TestGetSheets(unittest.TestCase):
+    def setUp(self):
+        sheets.cache.clear()
+        self.addCleanup(sheets.cache.clear)
+        patcher = patch("Google.sheets.spreadsheet_revision", return_value="1")
+        self.spreadsheet_revision = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.sheets_api = MagicMock()
+        self.sheets_api.values().batchGet().execute.return_value = {
+            "valueRanges": [{"range": "Epic!A1:B6", "values": EPIC_VALUES},
+                            {"range": "Tasks!A1:F3", "values": TASK_VALUES}]
+        }
+        self.sheets_api.values().batchGet.reset_mock()
+        patcher = patch("Google.sheets.get_sheets_api", return_value=self.sheets_api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fetches_all_sheets_in_one_request(self):
+        result = sheets.get_sheets(["Epic", "Tasks"], "spreadsheet")
+
+        self.sheets_api.values().batchGet.assert_called_once_with(spreadsheetId="spreadsheet",
+                                                                  ranges=["'Epic'", "'Tasks'"])
+        self.assertEqual(sheets.transform_to_epics(result["Epic"]).title, "Test Epic")
+        self.assertEqual(result["Tasks"].row(1).to_task(), sheets.Task(
+            title="Task 2", comments=None, issueID=None, priority="Low", description="Second task", story_point=5
+        ))
+
+    def test_populates_the_sheet_cache(self):
+        result = sheets.get_sheets(["Epic", "Tasks"], "spreadsheet")
+
+        self.assertIs(sheets.get_sheet("Tasks", "spreadsheet"), result["Tasks"])
+        self.assertIs(sheets.get_sheets(["Epic"], "spreadsheet")["Epic"], result["Epic"])
+        self.sheets_api.values().batchGet.assert_called_once()
+
+    def test_revision_is_only_looked_up_to_revalidate(self):
+        sheets.get_sheets(["Epic", "Tasks"], "spreadsheet")
+        self.spreadsheet_revision.assert_not_called()
+
+        for entry in sheets.cache.entries.values():
+            entry.checked_at -= sheets.cache.ttl
+        sheets.get_sheets(["Epic", "Tasks"], "spreadsheet")
+        for entry in sheets.cache.entries.values():
+            entry.checked_at -= sheets.cache.ttl
+        sheets.get_sheets(["Epic", "Tasks"], "spreadsheet")
+
+        # Cached without a revision, the sheets were fetched again once, and then stored with the revision
+        self.assertEqual(self.sheets_api.values().batchGet.call_count, 2)
+        self.assertEqual(self.spreadsheet_revision.call_count, 4)
+
+
+class FakeSheetsApi:
+    """Serves the values of one sheet for ranges like 'Tasks'!A2:ZZ1001, recording the requested ranges"""
+    def __init__(self, sheet_name, values):
+        self.sheet_name = sheet_name
+        self.sheet_values = values
+        self.ranges = []
+
+    def get(self, spreadsheetId, fields):
+        grid = {"rowCount": len(self.sheet_values) + 10}
+        sheet = {"properties": {"title": self.sheet_name, "gridProperties": grid}}
+        return MagicMock(**{"execute.return_value": {"sheets": [sheet]}})
+
+    def values(self):
+        return MagicMock(get=self.get_values)
+
+    def get_values(self, spreadsheetId, range):
+        self.ranges.append(range)
+        start, end = range.split("!")[1].split(":")
+        start_row, end_row = int(start[1:]), int(end[2:])
+        values = self.sheet_values[start_row - 1:end_row]
+        return MagicMock(**{"execute.return_value": {"values": values} if values else {}})
+
+
+class TestIterTasks(unittest.TestCase):
+    def setUp(self):
+        values = [TASK_VALUES[0]] + [[f"Task {i}", "Description", "High", str(i)] for i in range(1, 2501)]
+        self.sheets_api = FakeSheetsApi("Tasks", values)
+        patcher = patch("Google.sheets.get_sheets_api", return_value=self.sheets_api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_the_sheet_in_row_windows(self):
+        tasks = sheets.iter_tasks("spreadsheet", "Tasks", chunk_size=1000)
+
+        first = next(tasks)
+        self.assertEqual(first.title, "Task 1")
+        self.assertEqual(self.sheets_api.ranges, ["'Tasks'!A1:ZZ1", "'Tasks'!A2:ZZ1001"])
+
+        rest = list(tasks)
+        self.assertEqual(len(rest), 2499)
+        self.assertEqual(rest[-1].story_point, 2500)
+        self.assertEqual(self.sheets_api.ranges[2:], ["'Tasks'!A1002:ZZ2001", "'Tasks'!A2002:ZZ2511"])
+
+
+class TestSheetCache(unittest.TestCase):
+    def setUp(self):
+        self.revisions = {"spreadsheet": "1"}
+        self.cache = SheetCache(maxsize=2, ttl=60, revision=self.revision)
+        self.revision_calls = 0
+
+    def revision(self, spreadsheet_id):
+        self.revision_calls += 1
+        return self.revisions.get(spreadsheet_id)
+
+    def expire(self, key):
+        self.cache.entries[key].checked_at -= 61
+
+    def test_fresh_entries_are_served_without_revalidation(self):
+        self.cache.put("spreadsheet_Tasks", "sheet", "spreadsheet", "1")
+
+        self.assertEqual(self.cache.get("spreadsheet_Tasks"), "sheet")
+        self.assertIsNone(self.cache.get("spreadsheet_Epic"))
+        self.assertEqual(self.revision_calls, 0)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_stale_entry_of_unchanged_spreadsheet_is_kept(self):
+        self.cache.put("spreadsheet_Tasks", "sheet", "spreadsheet", "1")
+        self.expire("spreadsheet_Tasks")
+
+        self.assertEqual(self.cache.get("spreadsheet_Tasks"), "sheet")
+        self.assertEqual(self.cache.get("spreadsheet_Tasks"), "sheet")
+        self.assertEqual(self.revision_calls, 1)
+        self.assertEqual(self.cache.stats()["revalidations"], 1)
+
+    def test_stale_entry_of_changed_spreadsheet_is_dropped(self):
+        self.cache.put("spreadsheet_Tasks", "sheet", "spreadsheet", "1")
+        self.expire("spreadsheet_Tasks")
+        self.revisions["spreadsheet"] = "2"
+
+        self.assertIsNone(self.cache.get("spreadsheet_Tasks"))
+        self.assertNotIn("spreadsheet_Tasks", self.cache)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.get("a")
+        self.cache.put("c", 3)
+
+        self.assertIn("a", self.cache)
+        self.assertNotIn("b", self.cache)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+
+
+class TestAuthenticateService(unittest.TestCase):
+    def test_credentials_are_cached_once_sheets_is_imported(self):
+        import Google
+
+        # Google.sheets must not shadow the package-level credentials cache with a submodule
+        credentials = MagicMock()
+        with patch.dict(Google.cache, {"credentials": credentials}):
+            self.assertIs(Google.authenticate_service(), credentials)
+
+
+if __name__ == '__main__':
+    unittest.main()
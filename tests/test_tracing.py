@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import tracing
+from database.manager import DatabaseManager
+from benchmarks.fake_firestore import FakeFirestore
+
+
+@tracing.traced()
+def traced_function(fail=False):
+    with tracing.span("inner", kind="test") as inner:
+        inner.set(done=True)
+        if fail:
+            raise ValueError("failed")
+
+
+@tracing.traced("traced_coroutine")
+async def traced_coroutine():
+    await asyncio.sleep(0)
+    traced_function()
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.sink = tracing.MemorySink()
+        tracing.set_sink(self.sink)
+        self.addCleanup(tracing.set_sink, None)
+
+    def test_nested_spans(self):
+        asyncio.run(traced_coroutine())
+
+        outer, = self.sink.named("traced_coroutine")
+        function, = self.sink.named("traced_function")
+        inner, = self.sink.named("inner")
+        self.assertIsNone(outer.parent_id)
+        self.assertEqual(function.parent_id, outer.span_id)
+        self.assertEqual(inner.parent_id, function.span_id)
+        self.assertEqual(inner.attributes, {"kind": "test", "done": True})
+        self.assertGreaterEqual(outer.duration, function.duration)
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(ValueError):
+            traced_function(fail=True)
+
+        self.assertEqual(self.sink.named("traced_function")[0].error, "ValueError: failed")
+
+    def test_disabled(self):
+        tracing.set_sink(None)
+
+        traced_function()
+
+        self.assertEqual(self.sink.spans, [])
+        self.assertFalse(tracing.enabled())
+
+    def test_jsonl_sink(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spans.jsonl")
+            tracing.set_sink(tracing.JsonlSink(path))
+
+            traced_function()
+
+            with open(path, encoding="utf-8") as file:
+                spans = [json.loads(line) for line in file]
+        self.assertEqual([span["name"] for span in spans], ["inner", "traced_function"])
+
+    def test_database_manager_spans(self):
+        with patch("database.manager.initfirebase", return_value=FakeFirestore()):
+            manager = DatabaseManager("epics", "Test Epic")
+            epic = SimpleNamespace(title="Test Epic", problem="Problem", feature="Feature", value="Value")
+            manager.add_to_db(epic, [{"title": "Task 1", "issueID": 1}])
+
+        add, = self.sink.named("DatabaseManager.add_to_db")
+        commit, = self.sink.named("DatabaseManager._commit_in_batches")
+        self.assertEqual(commit.parent_id, add.span_id)
+
+    def test_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.prof")
+            with tracing.profile(path):
+                traced_function()
+
+            stats = pstats.Stats(path)
+        self.assertTrue(any(function[2] == "traced_function" for function in stats.stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
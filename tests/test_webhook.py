@@ -0,0 +1,119 @@
+import asyncio
+import os
+import subprocess
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+
+import metrics
+import webhook
+from database.async_manager import AsyncDatabaseManager
+from database.manager import DatabaseManager
+from epics.github_epic import github_epic
+from benchmarks.fake_firestore import FakeAsyncFirestore, FakeFirestore
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+# Seconds importing the webhook module may take, it takes well under 0.1s without the heavy libraries
+IMPORT_BUDGET = 0.5
+# Libraries that take a long time to import, and are only needed once the webhook runs
+HEAVY_MODULES = ("fastapi", "uvicorn", "ngrok", "httpx", "firebase_admin", "google.cloud.firestore",
+                 "google.cloud.secretmanager", "googleapiclient.discovery", "google_auth_oauthlib")
+
+
+class TestImport(unittest.TestCase):
+    def test_import_does_no_work_within_budget(self):
+        code = ("import sys, time\n"
+                "start = time.perf_counter()\n"
+                "import webhook\n"
+                "print(time.perf_counter() - start)\n"
+                f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n")
+        result = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, timeout=60)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        seconds, loaded = result.stdout.splitlines()[-2:]
+        self.assertEqual(loaded, "")
+        self.assertLess(float(seconds), IMPORT_BUDGET)
+
+
+class TestWebhookApp(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = FakeFirestore()
+        with patch("database.manager.initfirebase", return_value=self.db):
+            epic = SimpleNamespace(title="Test Epic", problem="Problem", feature="Feature", value="Value")
+            DatabaseManager("epics", "Test Epic").add_to_db(epic, [{"title": "Task 1", "issueID": 1,
+                                                                   "priority": "High"}])
+        self.app = webhook.create_app(AsyncDatabaseManager("epics", "Test Epic", db=FakeAsyncFirestore(self.db)))
+        self.app.state.delivery_queue.start()
+        transport = httpx.ASGITransport(app=self.app)
+        self.client = httpx.AsyncClient(transport=transport, base_url="http://webhook")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        await self.app.state.delivery_queue.stop()
+
+    async def test_redeliveries_are_dropped(self):
+        epic = github_epic("owner", "repo", "token", "Test Epic", "Problem", "Feature", "Value")
+        delivery = {
+            "action": "edited",
+            "issue": {"number": 1, "title": "Task 1", "body": epic.format_body({"title": "Task 1",
+                                                                                "priority": "Low"})},
+            "changes": {"body": {"from": ""}},
+        }
+        headers = {"X-GitHub-Delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958"}
+
+        first = await self.client.post("/", json=delivery, headers=headers)
+        await self.app.state.delivery_queue.stop()
+        self.db.writes = 0
+        second = await self.client.post("/", json=delivery, headers=headers)
+
+        self.assertEqual(first.json()["status"], "accepted")
+        self.assertEqual(second.json()["status"], "duplicate")
+        self.assertEqual(self.db.store["epics/Test Epic/tasks/1"]["priority"], "Low")
+        self.assertEqual((self.db.writes, self.app.state.delivery_queue.stats()["received"]), (0, 1))
+        self.assertEqual((await self.client.get("/queue")).json()["duplicates"], 1)
+
+    async def test_concurrent_redeliveries_are_processed_once(self):
+        delivery = {"action": "edited", "issue": {"number": 1, "title": "Task 1"},
+                    "changes": {"title": {"from": "Task 1"}}}
+        headers = {"X-GitHub-Delivery": "redelivered"}
+
+        responses = await asyncio.gather(*(self.client.post("/", json=delivery, headers=headers) for _ in range(3)))
+
+        self.assertEqual(sorted(response.json()["status"] for response in responses),
+                         ["accepted", "duplicate", "duplicate"])
+        self.assertEqual(self.app.state.delivery_queue.stats()["received"], 1)
+
+    async def test_failed_deliveries_are_processed_when_redelivered(self):
+        headers = {"X-GitHub-Delivery": "failed", "Content-Type": "application/json"}
+        with self.assertRaises(Exception):
+            await self.client.post("/", content=b"{not json", headers=headers)
+
+        response = await self.client.post("/", json={"action": "opened"}, headers=headers)
+
+        self.assertEqual(response.json(), {"action": "opened"})
+
+    async def test_requests_and_failed_updates_are_measured(self):
+        requests = metrics.webhook_request_seconds.count()
+        errors = metrics.task_update_errors.get()
+        delivery = {"action": "edited", "issue": {"number": 1, "title": "Task 1"},
+                    "changes": {"title": {"from": "Task 1"}}}
+
+        with patch.object(self.app.state.db_manager, "_tasks_with_title", side_effect=RuntimeError("Unavailable")):
+            await self.client.post("/", json=delivery)
+            await self.app.state.delivery_queue.stop()
+
+        self.assertEqual(metrics.webhook_request_seconds.count(), requests + 1)
+        self.assertEqual(metrics.task_update_errors.get(), errors + 1)
+
+    def test_app_is_created_on_first_access(self):
+        with patch.object(webhook, "create_app", return_value="app") as create_app:
+            self.assertEqual(webhook.app, "app")
+            create_app.assert_called_once_with()
+        del webhook.app
+
+
+if __name__ == '__main__':
+    unittest.main()
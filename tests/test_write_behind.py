@@ -0,0 +1,138 @@
+import gc
+import threading
+import time
+import unittest
+import weakref
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from database.backends import DELETE_FIELD
+from database.manager import DatabaseManager
+from database.write_behind import WriteBehindBackend
+from benchmarks.fake_firestore import FakeFirestore
+
+
+class TestWriteBehind(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeFirestore()
+        patcher = patch("database.manager.initfirebase", return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tasks = [{"title": f"Task {i}", "issueID": i, "priority": "High"} for i in range(1, 4)]
+        epic = SimpleNamespace(title="Test Epic", problem="Problem", feature="Feature", value="Value")
+        DatabaseManager("epics", "Test Epic").add_to_db(epic, self.tasks)
+
+        self.manager = DatabaseManager("epics", "Test Epic", write_behind=True)
+        self.addCleanup(self.manager.close)
+        self.db.writes = self.db.commits = 0
+
+    def test_updates_of_a_task_are_merged_into_one_write(self):
+        self.manager.update_task("Task 1", {"priority": "Low"})
+        self.manager.update_task("Task 1", {"description": "Changed"})
+        self.manager.update_task("Task 2", {"priority": "Low"})
+        self.assertEqual(self.db.writes, 0)
+
+        self.manager.flush()
+
+        self.assertEqual((self.db.writes, self.db.commits), (2, 1))
+        self.assertEqual(self.db.store["epics/Test Epic/tasks/1"]["priority"], "Low")
+        self.assertEqual(self.db.store["epics/Test Epic/tasks/1"]["description"], "Changed")
+
+    def test_reads_see_pending_writes(self):
+        self.manager.update_task("Task 1", {"priority": "Low"})
+        self.manager.update_task("Task 2", {"title": "Renamed"})
+
+        self.assertEqual(self.manager.get_task_with_id(1)["priority"], "Low")
+        self.assertEqual(self.manager.get_tasks_by_ids([1])[1]["priority"], "Low")
+        self.assertEqual(self.manager.get_task_with_title("Renamed")["issueID"], 2)
+        self.assertIsNone(self.manager.get_task_with_title("Task 2"))
+
+    def test_flushes_when_full(self):
+        backend = WriteBehindBackend(self.manager.backend.backend, max_pending=2, flush_interval=None)
+        backend.commit([("update", "1", {"priority": "Low"}), ("update", "1", {"priority": "Medium"})])
+        self.assertEqual(self.db.commits, 0)
+
+        backend.commit([("update", "2", {"priority": "Low"})])
+
+        self.assertEqual((self.db.writes, self.db.commits), (2, 1))
+        self.assertEqual(backend.pending, {})
+        backend.close()
+
+    def test_flushes_after_interval(self):
+        backend = WriteBehindBackend(self.manager.backend.backend, flush_interval=0.01)
+        backend.commit([("update", "1", {"priority": "Low"})])
+
+        deadline = time.monotonic() + 5
+        while backend.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.db.store["epics/Test Epic/tasks/1"]["priority"], "Low")
+        backend.close()
+
+    def test_close_flushes(self):
+        self.manager.update_task("Task 3", {"priority": "Low"})
+
+        self.manager.close()
+
+        self.assertEqual(self.db.store["epics/Test Epic/tasks/3"]["priority"], "Low")
+
+    def test_writes_are_merged_in_order(self):
+        backend = self.manager.backend
+        backend.commit([
+            ("set", "4", {"title": "Task 4", "notes": "Draft", "position": 3}),
+            ("merge", "4", {"notes": DELETE_FIELD, "priority": "Low"}),
+            ("delete", "3", None),
+        ])
+        self.assertEqual(backend.pending["4"], ("set", {"title": "Task 4", "position": 3, "priority": "Low"}))
+
+        backend.commit([("update", "3", {"priority": "Low"})])
+
+        # The update of the deleted task cannot be merged, so the pending writes were committed first
+        self.assertEqual(self.db.store["epics/Test Epic/tasks/4"]["priority"], "Low")
+        self.assertNotIn("epics/Test Epic/tasks/3", self.db.store)
+        self.assertEqual(backend.pending, {"3": ("update", {"priority": "Low"})})
+
+    def test_rejected_writes_are_dead_lettered(self):
+        backend = self.manager.backend
+        backend.commit([("update", "42", {"priority": "Low"}), ("update", "1", {"priority": "Low"})])
+
+        self.assertEqual(backend.flush(), 1)
+
+        self.assertEqual(self.db.store["epics/Test Epic/tasks/1"]["priority"], "Low")
+        self.assertEqual([(operation, task_id) for operation, task_id, _, _ in backend.dead_letters],
+                         [("update", "42")])
+        # Later flushes, and the reads that flush first, no longer fail on it
+        backend.commit([("update", "2", {"priority": "Low"})])
+        self.assertEqual(len(self.manager.get_tasks()), 3)
+        self.assertEqual(self.db.store["epics/Test Epic/tasks/2"]["priority"], "Low")
+
+    def test_timed_flushes_share_one_thread(self):
+        threads = set()
+        inner = self.manager.backend.backend
+        commit = inner.commit
+        inner.commit = lambda operations: (threads.add(threading.current_thread()), commit(operations))
+        backends = [WriteBehindBackend(inner, flush_interval=0.01) for _ in range(3)]
+        for priority in ("Low", "High"):
+            for backend in backends:
+                backend.commit([("update", "1", {"priority": priority})])
+            deadline = time.monotonic() + 5
+            while any(backend.pending for backend in backends) and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_unused_buffers_can_be_collected(self):
+        backend = WriteBehindBackend(self.manager.backend.backend, flush_interval=60)
+        backend.commit([("update", "1", {"priority": "Low"})])
+        backend.flush()
+        reference = weakref.ref(backend)
+
+        del backend
+        gc.collect()
+
+        self.assertIsNone(reference())
+
+
+if __name__ == '__main__':
+    unittest.main()